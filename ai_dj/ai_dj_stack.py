@@ -7,6 +7,8 @@ from aws_cdk import (
     aws_apigatewayv2 as apigw,
     aws_apigatewayv2_integrations as integrations,
     aws_iam as iam,
+    aws_sqs as sqs,
+    aws_lambda_event_sources as event_sources,
     aws_s3 as s3,
     aws_s3_deployment as s3deploy,
     aws_cloudfront as cloudfront,
@@ -43,6 +45,41 @@ class AiDjStack(Stack):
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             removal_policy=RemovalPolicy.DESTROY,  # For development - change in production
             point_in_time_recovery=True,
+            # Items written before the cache table existed still expire via TTL
+            time_to_live_attribute="expires_at",
+        )
+        
+        # Ephemeral items (track#, prompt#, profile#, flight#, breaker#, job#, analytics#) live
+        # in their own table so users, sessions and access requests are not buried under cache rows;
+        # same key attribute as the users table, every item carries an epoch expiry for TTL
+        cache_table = dynamodb.Table(
+            self,
+            "AI-DJ-Cache",
+            table_name="AI-DJ-Cache",
+            partition_key=dynamodb.Attribute(
+                name="user_id",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute="expires_at",
+        )
+        
+        # Playlist history: one item per playlist (playlist#... keys); this sparse index
+        # lists a user's playlists in creation order without scanning
+        users_table.add_global_secondary_index(
+            index_name="history-index",
+            partition_key=dynamodb.Attribute(
+                name="history_owner",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="history_created_at",
+                type=dynamodb.AttributeType.STRING
+            ),
+            # Summary fields only: GET /history never reads the stored parameters
+            projection_type=dynamodb.ProjectionType.INCLUDE,
+            non_key_attributes=["playlist_url", "playlist_name", "prompt", "created_at", "tracks_count"],
         )
 
         # ========================================
@@ -118,6 +155,98 @@ class AiDjStack(Stack):
             },
         )
         
+        # Streaming handler: NDJSON events for /playlist, /agent/chat and /playlist-from-image.
+        # The managed Python runtime cannot stream, so the exec wrapper starts
+        # streaming_runtime.py, which talks to the Runtime API in streaming mode.
+        stream_lambda = _lambda.Function(
+            self,
+            "AI-DJ-Stream-Handler",
+            function_name="AI-DJ-Stream-Handler",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler="stream_handler.lambda_handler",
+            code=_lambda.Code.from_asset("lambda_src"),
+            layers=[dependencies_layer],
+            timeout=Duration.seconds(120),  # Function URLs are not bound by the API Gateway 30s limit
+            memory_size=1536,
+            environment={
+                "SPOTIFY_CLIENT_ID": spotify_client_id,
+                "SPOTIFY_CLIENT_SECRET": spotify_client_secret,
+                "DYNAMODB_TABLE_NAME": users_table.table_name,
+                "BEDROCK_MODEL_ID": "us.anthropic.claude-haiku-4-5-20251001-v1:0",
+                "NOVA_MODEL_ID": "us.amazon.nova-lite-v1:0",
+                "AWS_LAMBDA_EXEC_WRAPPER": "/var/task/stream_bootstrap.sh",
+                "PYTHONUNBUFFERED": "1",
+            },
+        )
+        
+        stream_url = stream_lambda.add_function_url(
+            auth_type=_lambda.FunctionUrlAuthType.NONE,
+            invoke_mode=_lambda.InvokeMode.RESPONSE_STREAM,
+            cors=_lambda.FunctionUrlCorsOptions(
+                allowed_origins=["*"],
+                allowed_methods=[_lambda.HttpMethod.POST],
+                allowed_headers=["Content-Type", "Authorization"],
+            ),
+        )
+        
+        # Worker for asynchronous playlist jobs (POST /playlist with async=true).
+        # Invoked asynchronously, so it can run large playlists past the API Gateway limit.
+        job_worker_lambda = _lambda.Function(
+            self,
+            "AI-DJ-Playlist-Job-Worker",
+            function_name="AI-DJ-Playlist-Job-Worker",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler="job_worker.lambda_handler",
+            code=_lambda.Code.from_asset("lambda_src"),
+            layers=[dependencies_layer],
+            timeout=Duration.minutes(10),
+            memory_size=1536,
+            retry_attempts=0,  # A retry would create a second playlist
+            environment={
+                "SPOTIFY_CLIENT_ID": spotify_client_id,
+                "SPOTIFY_CLIENT_SECRET": spotify_client_secret,
+                "DYNAMODB_TABLE_NAME": users_table.table_name,
+                "BEDROCK_MODEL_ID": "us.anthropic.claude-haiku-4-5-20251001-v1:0",
+            },
+        )
+        
+        # Job status handler (GET /playlist/jobs/{job_id})
+        job_status_lambda = _lambda.Function(
+            self,
+            "AI-DJ-Job-Status-Handler",
+            function_name="AI-DJ-Job-Status-Handler",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler="job_status_handler.lambda_handler",
+            code=_lambda.Code.from_asset("lambda_src"),
+            layers=[dependencies_layer],
+            timeout=Duration.seconds(10),
+            memory_size=256,
+            environment={
+                "DYNAMODB_TABLE_NAME": users_table.table_name,
+            },
+        )
+        
+        # Playlist history reader (GET /history)
+        history_lambda = _lambda.Function(
+            self,
+            "AI-DJ-History-Handler",
+            function_name="AI-DJ-History-Handler",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler="history_handler.lambda_handler",
+            code=_lambda.Code.from_asset("lambda_src"),
+            layers=[dependencies_layer],
+            timeout=Duration.seconds(10),
+            memory_size=256,
+            environment={
+                "DYNAMODB_TABLE_NAME": users_table.table_name,
+            },
+        )
+        
+        # Lambdas that run process_playlist_request can queue jobs
+        for lambda_fn in [lambda_function, stream_lambda]:
+            lambda_fn.add_environment("PLAYLIST_JOB_WORKER_FUNCTION", job_worker_lambda.function_name)
+            job_worker_lambda.grant_invoke(lambda_fn)
+        
         # Knowledge handler with Amazon Q
         knowledge_lambda = _lambda.Function(
             self,
@@ -224,13 +353,65 @@ class AiDjStack(Stack):
             },
         )
 
+        # ========================================
+        # Write-behind persistence
+        # ========================================
+        
+        # History items and analytics events are queued by the
+        # request handlers and written to DynamoDB in batches by this consumer
+        write_behind_dlq = sqs.Queue(
+            self,
+            "AI-DJ-Write-Behind-DLQ",
+            retention_period=Duration.days(14),
+        )
+        
+        write_behind_queue = sqs.Queue(
+            self,
+            "AI-DJ-Write-Behind-Queue",
+            visibility_timeout=Duration.seconds(60),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=5, queue=write_behind_dlq),
+        )
+        
+        write_behind_lambda = _lambda.Function(
+            self,
+            "AI-DJ-Write-Behind-Handler",
+            function_name="AI-DJ-Write-Behind-Handler",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler="write_behind_handler.lambda_handler",
+            code=_lambda.Code.from_asset("lambda_src"),
+            layers=[dependencies_layer],
+            timeout=Duration.seconds(30),
+            memory_size=256,
+            environment={
+                "DYNAMODB_TABLE_NAME": users_table.table_name,
+            },
+        )
+        
+        write_behind_lambda.add_event_source(
+            event_sources.SqsEventSource(
+                write_behind_queue,
+                batch_size=25,
+                max_batching_window=Duration.seconds(1),
+                report_batch_item_failures=True,
+            )
+        )
+        
+        for lambda_fn in [lambda_function, agent_lambda, image_lambda, stream_lambda, job_worker_lambda]:
+            lambda_fn.add_environment("WRITE_BEHIND_QUEUE_URL", write_behind_queue.queue_url)
+            write_behind_queue.grant_send_messages(lambda_fn)
+
         # ========================================
         # IAM Permissions
         # ========================================
         
         # Permissions for DynamoDB (all lambdas)
-        for lambda_fn in [lambda_function, agent_lambda, image_lambda, knowledge_lambda, access_request_lambda, admin_lambda, admin_approve_lambda, check_auth_lambda, manual_email_lambda]:
+        for lambda_fn in [lambda_function, agent_lambda, image_lambda, stream_lambda, job_worker_lambda, job_status_lambda, history_lambda, write_behind_lambda, knowledge_lambda, access_request_lambda, admin_lambda, admin_approve_lambda, check_auth_lambda, manual_email_lambda]:
             users_table.grant_read_write_data(lambda_fn)
+        
+        # Cache table (lambdas that load the cache, job or write-behind modules)
+        for lambda_fn in [lambda_function, agent_lambda, image_lambda, stream_lambda, job_worker_lambda, job_status_lambda, history_lambda, write_behind_lambda]:
+            lambda_fn.add_environment("CACHE_TABLE_NAME", cache_table.table_name)
+            cache_table.grant_read_write_data(lambda_fn)
 
         # Permissions for Amazon Bedrock (all lambdas)
         bedrock_policy = iam.PolicyStatement(
@@ -257,7 +438,7 @@ class AiDjStack(Stack):
             resources=["*"],
         )
         
-        for lambda_fn in [lambda_function, agent_lambda, image_lambda, knowledge_lambda]:
+        for lambda_fn in [lambda_function, agent_lambda, image_lambda, stream_lambda, job_worker_lambda, knowledge_lambda]:
             lambda_fn.add_to_role_policy(bedrock_policy)
             lambda_fn.add_to_role_policy(marketplace_policy)
         
@@ -308,6 +489,16 @@ class AiDjStack(Stack):
             agent_lambda,
         )
         
+        job_status_integration = integrations.HttpLambdaIntegration(
+            "JobStatusIntegration",
+            job_status_lambda,
+        )
+        
+        history_integration = integrations.HttpLambdaIntegration(
+            "HistoryIntegration",
+            history_lambda,
+        )
+        
         image_integration = integrations.HttpLambdaIntegration(
             "ImageIntegration",
             image_lambda,
@@ -326,6 +517,20 @@ class AiDjStack(Stack):
             integration=lambda_integration,
         )
         
+        # GET /playlist/jobs/{job_id} - Status of an asynchronous playlist job
+        http_api.add_routes(
+            path="/playlist/jobs/{job_id}",
+            methods=[apigw.HttpMethod.GET],
+            integration=job_status_integration,
+        )
+        
+        # GET /history - Paginated playlist history (summaries)
+        http_api.add_routes(
+            path="/history",
+            methods=[apigw.HttpMethod.GET],
+            integration=history_integration,
+        )
+        
         # POST /agent/chat - Conversational playlist creation (AgentCore)
         http_api.add_routes(
             path="/agent/chat",
@@ -426,6 +631,14 @@ class AiDjStack(Stack):
             export_name="AI-DJ-DynamoDB-Table",
         )
 
+        CfnOutput(
+            self,
+            "CacheTableName",
+            value=cache_table.table_name,
+            description="DynamoDB cache table name",
+            export_name="AI-DJ-Cache-Table",
+        )
+
         CfnOutput(
             self,
             "LambdaFunctionName",
@@ -454,6 +667,13 @@ class AiDjStack(Stack):
             value=f"{http_api.url}music-knowledge",
             description="Amazon Q music knowledge endpoint",
         )
+        
+        CfnOutput(
+            self,
+            "StreamEndpoint",
+            value=stream_url.url,
+            description="Streaming (NDJSON) base URL: POST /playlist, /agent/chat, /playlist-from-image",
+        )
 
         # ========================================
         # S3 Bucket for Frontend
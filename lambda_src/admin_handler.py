@@ -71,11 +71,16 @@ def lambda_handler(event, context):
     
     try:
         # Scan DynamoDB for all spotify_user items
-        response = table.scan(
-            FilterExpression=Attr('user_id').begins_with('spotify_user#')
-        )
-        
-        items = response.get('Items', [])
+        # Cache, job and analytics items live in the cache table, so this scan only pages
+        # through users, sessions and playlist history
+        scan_args = {'FilterExpression': Attr('user_id').begins_with('spotify_user#')}
+        items = []
+        while True:
+            response = table.scan(**scan_args)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
         
         # Format the results
         requests = []
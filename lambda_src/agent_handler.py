@@ -8,17 +8,25 @@ import os
 import boto3
 import sys
 import time
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from botocore.exceptions import ClientError
 
 # Add lambda_src to path to import app functions
 sys.path.insert(0, os.path.dirname(__file__))
 
+import app
+import bedrock_client
+import bedrock_prompt_caching
+import circuit_breaker
+import model_router
+import write_behind
+from circuit_breaker import CircuitOpenError
+from time_budget import Deadline
+
 # AWS Clients
 dynamodb = boto3.resource('dynamodb')
 bedrock_agent_runtime = boto3.client('bedrock-agent-runtime', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
-bedrock_runtime = boto3.client('bedrock-runtime', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
 
 # Environment Variables
 AGENT_ID = os.environ.get('BEDROCK_AGENT_ID')
@@ -26,33 +34,53 @@ AGENT_ALIAS_ID = os.environ.get('BEDROCK_AGENT_ALIAS_ID', 'TSTALIASID')
 DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME')
 SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET')
+# Below this much time left, follow-up questions come from the fallback list instead of Bedrock
+QUESTION_MIN_REMAINING_SECONDS = float(os.environ.get('QUESTION_MIN_REMAINING_SECONDS', '5'))
+BEDROCK_SLOW_CALL_SECONDS = float(os.environ.get('BEDROCK_SLOW_CALL_SECONDS', '20'))
 
 # DynamoDB Table
 table = dynamodb.Table(DYNAMODB_TABLE_NAME)
 
 
-def invoke_bedrock_with_retry(model_id: str, payload: dict, max_retries: int = 3) -> dict:
+def invoke_bedrock_with_retry(model_id: str, payload: dict, max_retries: int = 3, deadline: Optional[Deadline] = None) -> dict:
     """
     Invoke Bedrock with exponential backoff retry logic for throttling
+    (backoff is skipped when the retry would not fit before the deadline).
+    Shares the model's circuit breaker with app.py; raises CircuitOpenError while it is open.
     """
+    breaker = circuit_breaker.get_breaker(f"bedrock:{model_id}", BEDROCK_SLOW_CALL_SECONDS)
     for attempt in range(max_retries):
+        if deadline is not None and deadline.expired():
+            raise Exception("Deadline reached before Bedrock call")
+        breaker.check()
+        started_at = time.time()
         try:
-            response = bedrock_runtime.invoke_model(
+            response = bedrock_client.runtime(deadline).invoke_model(
                 modelId=model_id,
-                body=json.dumps(payload),
+                body=json.dumps(bedrock_prompt_caching.with_cache_point(payload, model_id)),
                 contentType="application/json",
                 accept="application/json"
             )
-            return json.loads(response['body'].read())
+            response_body = json.loads(response['body'].read())
+            breaker.record(True, time.time() - started_at)
+            return response_body
         except ClientError as e:
             error_code = e.response['Error']['Code']
-            if error_code == 'ThrottlingException' and attempt < max_retries - 1:
+            breaker.record(error_code not in circuit_breaker.BEDROCK_FAILURE_CODES, time.time() - started_at)
+            if breaker.is_open():
+                # This failure tripped the breaker: no point backing off for a retry
+                raise CircuitOpenError(breaker.name, breaker.retry_after()) from e
+            wait_time = (2 ** attempt) * 1
+            if (error_code == 'ThrottlingException' and attempt < max_retries - 1 and
+                    (deadline is None or deadline.can_sleep(wait_time, QUESTION_MIN_REMAINING_SECONDS))):
                 # Exponential backoff: 1s, 2s, 4s
-                wait_time = (2 ** attempt) * 1
                 print(f"Throttling detected, waiting {wait_time}s before retry {attempt + 1}/{max_retries}")
                 time.sleep(wait_time)
             else:
                 raise
+        except Exception:
+            breaker.record(False, time.time() - started_at)
+            raise
     raise Exception("Max retries exceeded")
 
 
@@ -62,41 +90,8 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     try:
         body = json.loads(event.get('body', '{}'))
-        user_id = body.get('user_id')
-        message = body.get('message')
-        session_id = body.get('session_id')
-        spotify_token = body.get('spotify_access_token')
-        limit = int(body.get('limit', 25))
-        
-        if not user_id or not message:
-            return create_response(400, {'error': 'Missing user_id or message'})
-        
-        if not spotify_token:
-            return create_response(400, {'error': 'Missing spotify_access_token'})
-        
-        print(f"Agent conversation - user: {user_id}, session: {session_id}, message: {message}")
-        
-        # If we have an agent configured, use it
-        if AGENT_ID:
-            response = invoke_bedrock_agent(
-                agent_id=AGENT_ID,
-                agent_alias_id=AGENT_ALIAS_ID,
-                session_id=session_id or f"session-{user_id}-{datetime.now().timestamp()}",
-                prompt=message,
-                user_id=user_id,
-                spotify_token=spotify_token
-            )
-        else:
-            # Fallback: simulate agent behavior with direct Bedrock calls
-            response = simulate_agent_conversation(
-                message=message,
-                session_id=session_id or f"session-{user_id}-{datetime.now().timestamp()}",
-                user_id=user_id,
-                spotify_token=spotify_token,
-                limit=limit
-            )
-        
-        return create_response(200, response)
+        status_code, response_body = process_agent_request(body, deadline=Deadline.for_request(context))
+        return create_response(status_code, response_body)
         
     except Exception as e:
         print(f"Error in agent handler: {str(e)}")
@@ -105,6 +100,60 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         })
 
 
+def process_agent_request(
+    body: Dict[str, Any],
+    emit: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    deadline: Optional[Deadline] = None
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Runs one conversation turn for a parsed request body and returns (status_code, response body).
+    emit receives streaming progress events when a playlist is created (see app.process_playlist_request).
+    deadline is the request's time budget (see time_budget).
+    """
+    user_id = body.get('user_id')
+    message = body.get('message')
+    session_id = body.get('session_id')
+    spotify_token = body.get('spotify_access_token')
+    limit = int(body.get('limit', 25))
+    fresh = app.is_truthy(body.get('fresh'))
+    # Single-call generation by default; 'two_call' keeps the enhancement round trip for A/B tests
+    pipeline_mode = app.resolve_pipeline_mode(body.get('pipeline_mode'), app.PIPELINE_MODE_FAST)
+    
+    if not user_id or not message:
+        return 400, {'error': 'Missing user_id or message'}
+    
+    if not spotify_token:
+        return 400, {'error': 'Missing spotify_access_token'}
+    
+    print(f"Agent conversation - user: {user_id}, session: {session_id}, message: {message}")
+    
+    # If we have an agent configured, use it
+    if AGENT_ID:
+        response = invoke_bedrock_agent(
+            agent_id=AGENT_ID,
+            agent_alias_id=AGENT_ALIAS_ID,
+            session_id=session_id or f"session-{user_id}-{datetime.now().timestamp()}",
+            prompt=message,
+            user_id=user_id,
+            spotify_token=spotify_token
+        )
+    else:
+        # Fallback: simulate agent behavior with direct Bedrock calls
+        response = simulate_agent_conversation(
+            message=message,
+            session_id=session_id or f"session-{user_id}-{datetime.now().timestamp()}",
+            user_id=user_id,
+            spotify_token=spotify_token,
+            limit=limit,
+            fresh=fresh,
+            pipeline_mode=pipeline_mode,
+            emit=emit,
+            deadline=deadline
+        )
+    
+    return 200, response
+
+
 def invoke_bedrock_agent(
     agent_id: str,
     agent_alias_id: str,
@@ -154,7 +203,11 @@ def simulate_agent_conversation(
     session_id: str,
     user_id: str,
     spotify_token: str,
-    limit: int = 25
+    limit: int = 25,
+    fresh: bool = False,
+    pipeline_mode: str = app.PIPELINE_MODE_FAST,
+    emit: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    deadline: Optional[Deadline] = None
 ) -> Dict[str, Any]:
     """
     Simulate agent behavior using direct Bedrock calls with conversation history
@@ -162,6 +215,8 @@ def simulate_agent_conversation(
     """
     # Get conversation history from DynamoDB
     history = get_conversation_history(session_id)
+    # Tier of the Bedrock call that produced the reply (None for canned replies)
+    question_route = None
     
     # Build context-aware prompt
     system_prompt = """You are AI DJ, a helpful music assistant that creates Spotify playlists.
@@ -215,9 +270,9 @@ Otherwise, respond naturally to continue the conversation and gather more prefer
                 for h in history[-3:] if h['role'] == 'user'
             ])
             
-            q_prompt = f"""Based on this music request: "{conversation_summary}"
-
-Generate ONE intelligent follow-up question to refine the playlist. Ask about:
+            # The question guidelines are the same on every turn and form the cached system
+            # prefix; only the conversation goes into the user message
+            q_system = """Generate ONE intelligent follow-up question to refine the playlist. Ask about:
 - Specific artists they like in that genre
 - Time period or era (80s, 90s, modern, etc.)
 - Energy level (chill, energetic, intense)
@@ -225,28 +280,36 @@ Generate ONE intelligent follow-up question to refine the playlist. Ask about:
 - Language preference
 - Any artists to avoid
 
-Be conversational and natural in Spanish. End with: "O decime 'si' si ya estás listo para crear la playlist."
+Be conversational and natural in Spanish. End with: "O decime 'si' si ya estás listo para crear la playlist.\""""
+            q_prompt = f"""Based on this music request: "{conversation_summary}"
 
 Question:"""
 
             try:
+                if deadline is not None and not deadline.has(QUESTION_MIN_REMAINING_SECONDS):
+                    raise Exception(f"only {deadline.remaining():.1f}s left")
                 # Quick call to Bedrock for intelligent question (Amazon Q pattern)
                 q_payload = {
                     "anthropic_version": "bedrock-2023-05-31",
                     "max_tokens": 150,
                     "temperature": 0.8,
+                    "system": q_system,
                     "messages": [
                         {"role": "user", "content": [{"type": "text", "text": q_prompt}]}
                     ]
                 }
                 
+                route = model_router.route(model_router.TASK_AGENT_QUESTION, conversation_summary)
                 q_response = invoke_bedrock_with_retry(
-                    model_id=os.environ.get('BEDROCK_MODEL_ID', 'us.anthropic.claude-haiku-4-5-20251001-v1:0'),
+                    model_id=route.model_id,
                     payload=q_payload,
-                    max_retries=1  # Quick retry only
+                    max_retries=1,  # Quick retry only
+                    deadline=deadline
                 )
                 
+                bedrock_prompt_caching.record_usage('agent', q_response)
                 assistant_message = q_response['content'][0]['text'].strip()
+                question_route = route.describe()
                 print(f"🤖 Amazon Q generated question: {assistant_message}")
                 
             except Exception as e:
@@ -268,14 +331,25 @@ Question:"""
         prompt_start = assistant_message.find('READY_TO_CREATE:') + len('READY_TO_CREATE:')
         playlist_prompt = assistant_message[prompt_start:].strip()
         
-        # Import functions from app.py to create the actual playlist
         try:
-            import app
-            
             print(f"Creating playlist with prompt: {playlist_prompt}, limit: {limit}")
             
             # Generate playlist using the same logic as the main handler
-            music_parameters = app.interpret_prompt_with_bedrock(playlist_prompt, limit, max_retries=3)
+            # (songs are searched on Spotify while Bedrock is still generating them)
+            generation_stats = {}
+            search_stats = {}
+            music_parameters, tracks = app.generate_and_resolve_tracks(
+                playlist_prompt,
+                limit,
+                spotify_token,
+                fresh=fresh,
+                pipeline_mode=pipeline_mode,
+                max_retries=3,
+                generation_stats=generation_stats,
+                search_stats=search_stats,
+                deadline=deadline,
+                **app.stream_callbacks(emit)
+            )
             print(f"Music parameters: {music_parameters}")
             
             if not music_parameters or not music_parameters.get('songs'):
@@ -286,30 +360,55 @@ Question:"""
                     'conversation_mode': True
                 }
             
-            tracks = app.search_spotify_tracks(music_parameters, spotify_token)
             print(f"Found {len(tracks)} tracks")
             
             if tracks:
                 try:
                     print(f"Creating Spotify playlist with {len(tracks)} tracks...")
+                    playlist_stats = {}
                     playlist_url = app.create_spotify_playlist(
                         user_id=user_id,
                         playlist_name=music_parameters.get('playlist_name', 'AI DJ - Chat Playlist'),
                         track_uris=[track['uri'] for track in tracks],
-                        access_token=spotify_token
+                        access_token=spotify_token,
+                        playlist_stats=playlist_stats,
+                        deadline=deadline
                     )
                     print(f"✅ Playlist created successfully: {playlist_url}")
+                    if emit:
+                        emit('playlist_created', {'playlist_url': playlist_url, 'tracks_count': len(tracks)})
                     
-                    # Return success with playlist info
+                    write_behind.put_items([write_behind.analytics_event('playlist_created', {
+                        'user_id': user_id,
+                        **app.playlist_analytics(
+                            'agent', tracks, music_parameters, generation_stats, search_stats,
+                            pipeline_mode=pipeline_mode, requested_limit=limit
+                        )
+                    })])
+                    
+                    # Return success with playlist info (partial when the deadline cut the search short)
+                    model_router.log_tier('agent', generation_stats.get('model_route'))
+                    message_text = f"✅ ¡Playlist creada exitosamente! Agregué {len(tracks)} canciones basadas en nuestra conversación."
+                    if search_stats.get('partial'):
+                        message_text = f"✅ ¡Playlist creada! Agregué las {len(tracks)} canciones que encontré a tiempo; podés pedirme más para completarla."
                     return {
-                        'message': f"✅ ¡Playlist creada exitosamente! Agregué {len(tracks)} canciones basadas en nuestra conversación.",
+                        'message': message_text,
                         'session_id': session_id,
                         'agent_used': False,
                         'conversation_mode': True,
                         'playlist_created': True,
                         'playlist_url': playlist_url,
                         'tracks_count': len(tracks),
-                        'tracks': tracks[:10]  # First 10 tracks for preview
+                        'tracks': tracks[:10],  # First 10 tracks for preview
+                        'pipeline_mode': pipeline_mode,
+                        'model_used': app.model_used(generation_stats),
+                        'model_tier': generation_stats.get('model_route'),
+                        'prompt_cache': generation_stats.get('prompt_cache'),
+                        'track_cache': search_stats.get('track_cache'),
+                        'not_found_songs': search_stats.get('not_found_songs', []),
+                        'fill': search_stats.get('fill'),
+                        **app.partial_result(search_stats),
+                        'snapshot_id': playlist_stats.get('snapshot_id')
                     }
                 except Exception as playlist_error:
                     print(f"❌ Error creating Spotify playlist: {str(playlist_error)}")
@@ -330,6 +429,15 @@ Question:"""
                     'conversation_mode': True
                 }
                 
+        except CircuitOpenError as e:
+            print(f"Failing fast: {str(e)}")
+            return {
+                'message': f"El servicio de música está saturado en este momento. Probá de nuevo en {int(e.retry_after) + 1} segundos. 🙏",
+                'session_id': session_id,
+                'agent_used': False,
+                'conversation_mode': True,
+                'retry_after': int(e.retry_after) + 1
+            }
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
@@ -344,11 +452,13 @@ Question:"""
             }
     
     # Normal conversation response
+    model_router.log_tier('agent', question_route)
     result = {
         'message': assistant_message,
         'session_id': session_id,
         'agent_used': False,
-        'conversation_mode': True
+        'conversation_mode': True,
+        'model_tier': question_route
     }
     
     return result
@@ -371,6 +481,8 @@ def get_conversation_history(session_id: str) -> List[Dict[str, str]]:
 def save_conversation_turn(session_id: str, user_message: str, assistant_message: str):
     """
     Save conversation turn to DynamoDB
+    Written synchronously from a fresh read: the item holds the whole history, so a queued
+    (write-behind) put could overwrite a newer turn and lose messages.
     """
     try:
         history = get_conversation_history(session_id)
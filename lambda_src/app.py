@@ -1,17 +1,39 @@
 import json
+import math
 import os
 import boto3
-import requests
 import base64
+import copy
 import time
-from typing import Dict, Any, List, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from botocore.exceptions import ClientError
+from requests.exceptions import ConnectTimeout
+
+import bedrock_client
+import bedrock_hedging
+import bedrock_prompt_caching
+import circuit_breaker
+import model_router
+import playlist_history
+import playlist_jobs
+import profile_cache
+import prompt_cache
+import single_flight
+import track_cache
+import write_behind
+from http_client import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, session as http_session
+from circuit_breaker import CircuitOpenError
+from model_router import ModelRoute
+from song_parser import SongStreamParser, record_salvage, salvage_song_list
+from time_budget import MIN_HTTP_TIMEOUT_SECONDS, Deadline
 
 
 # AWS Client Configuration
 dynamodb = boto3.resource('dynamodb')
-bedrock_runtime = boto3.client('bedrock-runtime', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+# Bedrock clients come from bedrock_client, with timeouts capped to the request deadline
 
 # Environment Variables
 SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID')
@@ -20,35 +42,257 @@ DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME')
 # Using Claude Haiku 4.5 - latest and fastest
 BEDROCK_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'us.anthropic.claude-haiku-4-5-20251001-v1:0')
 
+# Spotify search fan-out: number of parallel searches per request and 429 retries per song
+SPOTIFY_SEARCH_CONCURRENCY = int(os.environ.get('SPOTIFY_SEARCH_CONCURRENCY', '8'))
+SPOTIFY_MAX_RATE_LIMIT_RETRIES = int(os.environ.get('SPOTIFY_MAX_RATE_LIMIT_RETRIES', '3'))
+SPOTIFY_MARKET = os.environ.get('SPOTIFY_MARKET', 'US')
+# How long the first search waits for the user's profile (country -> search market)
+SPOTIFY_PROFILE_MARKET_TIMEOUT = float(os.environ.get('SPOTIFY_PROFILE_MARKET_TIMEOUT', '2'))
+
+# Playlist bulk add: Spotify accepts at most 100 URIs per call; chunks are sent in order
+# with explicit positions so the final order matches the track list
+SPOTIFY_PLAYLIST_CHUNK_SIZE = 100
+SPOTIFY_PLAYLIST_ADD_MAX_RETRIES = int(os.environ.get('SPOTIFY_PLAYLIST_ADD_MAX_RETRIES', '3'))
+
+# Generation pipeline modes:
+# - fast: one Bedrock call that enriches the prompt and generates songs together
+# - two_call: Amazon Q pattern enhancement call followed by the generation call (kept for A/B comparison)
+PIPELINE_MODE_FAST = 'fast'
+PIPELINE_MODE_TWO_CALL = 'two_call'
+PIPELINE_MODES = (PIPELINE_MODE_FAST, PIPELINE_MODE_TWO_CALL)
+DEFAULT_PIPELINE_MODE = os.environ.get('PIPELINE_MODE', PIPELINE_MODE_FAST)
+
+# Some suggestions never resolve on Spotify: ask Bedrock for limit * factor songs and stop
+# searching once limit tracks are found
+GENERATION_SURPLUS_FACTOR = float(os.environ.get('GENERATION_SURPLUS_FACTOR', '1.3'))
+
+# Top-up: if the playlist is still short, ask Bedrock only for the missing songs (excluding
+# everything already suggested) while enough of the time budget remains
+TOPUP_MAX_ROUNDS = int(os.environ.get('TOPUP_MAX_ROUNDS', '2'))
+TOPUP_MIN_REMAINING_SECONDS = float(os.environ.get('TOPUP_MIN_REMAINING_SECONDS', '8'))
+TOPUP_EXCLUDE_MAX = 150
+PIPELINE_TIME_BUDGET_SECONDS = float(os.environ.get('PIPELINE_TIME_BUDGET_SECONDS', '25'))
+# Kept back from generation and search so the playlist can still be created from what resolved
+PLAYLIST_WRITE_RESERVE_SECONDS = float(os.environ.get('PLAYLIST_WRITE_RESERVE_SECONDS', '3'))
+# stop_reason reported for Bedrock streams cut off at the deadline
+DEADLINE_STOP_REASON = 'deadline'
+
+# Minimum time left for optional or retried steps to start
+BEDROCK_MIN_CALL_SECONDS = float(os.environ.get('BEDROCK_MIN_CALL_SECONDS', '4'))
+ENHANCE_MIN_REMAINING_SECONDS = float(os.environ.get('ENHANCE_MIN_REMAINING_SECONDS', '15'))
+STRICT_RETRY_MIN_REMAINING_SECONDS = float(os.environ.get('STRICT_RETRY_MIN_REMAINING_SECONDS', '6'))
+SPOTIFY_MIN_CALL_SECONDS = 1.0
+
+# Circuit breakers: calls slower than these count as slow (see circuit_breaker)
+BEDROCK_SLOW_CALL_SECONDS = float(os.environ.get('BEDROCK_SLOW_CALL_SECONDS', '20'))
+SPOTIFY_SEARCH_SLOW_CALL_SECONDS = float(os.environ.get('SPOTIFY_SEARCH_SLOW_CALL_SECONDS', '2'))
+SPOTIFY_WRITE_SLOW_CALL_SECONDS = float(os.environ.get('SPOTIFY_WRITE_SLOW_CALL_SECONDS', '5'))
+SPOTIFY_SEARCH_BREAKER = 'spotify-search'
+SPOTIFY_PLAYLIST_BREAKER = 'spotify-playlist-write'
+
+# Stream song generation so Spotify searches start while Bedrock is still writing the list
+BEDROCK_STREAMING_ENABLED = os.environ.get('BEDROCK_STREAMING_ENABLED', 'true').lower() == 'true'
+# A song list cut off at max_tokens keeps its complete songs; the missing ones are requested
+# as a continuation of the cut-off JSON instead of regenerating the whole list
+SALVAGE_CONTINUATION_ENABLED = os.environ.get('SALVAGE_CONTINUATION_ENABLED', 'true').lower() == 'true'
+
+# Playlist size limits: synchronous requests must finish within the API Gateway timeout,
+# larger playlists run as asynchronous jobs (async=true) on the job worker
+SYNC_MAX_LIMIT = int(os.environ.get('SYNC_MAX_LIMIT', '40'))
+ASYNC_MAX_LIMIT = int(os.environ.get('ASYNC_MAX_LIMIT', '500'))
+BEDROCK_MAX_OUTPUT_TOKENS = int(os.environ.get('BEDROCK_MAX_OUTPUT_TOKENS', '16000'))
+
 # DynamoDB Table
 table = dynamodb.Table(DYNAMODB_TABLE_NAME)
 
+# Shared Spotify rate-limit gate: when any worker receives a 429, every worker
+# waits until the Retry-After window has passed before sending its next search
+_spotify_rate_limit_lock = threading.Lock()
+_spotify_blocked_until = 0.0
+
+
+def bedrock_breaker(model_id: str) -> circuit_breaker.CircuitBreaker:
+    return circuit_breaker.get_breaker(f"bedrock:{model_id}", BEDROCK_SLOW_CALL_SECONDS)
+
 
-def invoke_bedrock_with_retry(model_id: str, payload: dict, max_retries: int = 3) -> dict:
+def invoke_bedrock_with_retry(
+    model_id: str,
+    payload: dict,
+    max_retries: int = 3,
+    deadline: Optional[Deadline] = None,
+    call_kind: str = 'invoke'
+) -> dict:
     """
-    Invoke Bedrock with exponential backoff retry logic for throttling
+    Invoke Bedrock with exponential backoff retry logic for throttling.
+    With a deadline, a backoff is only taken if the retried call still fits in the remaining time.
+    Raises CircuitOpenError without calling Bedrock while the model's circuit breaker is open.
+    Slow calls are hedged when BEDROCK_HEDGE_ENABLED (see bedrock_hedging); call_kind names
+    the call (e.g. 'interpret-strict') so it is only compared with calls of the same kind.
     """
+    breaker = bedrock_breaker(model_id)
+    
+    def invoke(target_model_id: str, claim: Callable[[], bool]) -> dict:
+        response = bedrock_client.runtime(deadline).invoke_model(
+            modelId=target_model_id,
+            body=json.dumps(bedrock_prompt_caching.with_cache_point(payload, target_model_id)),
+            contentType="application/json",
+            accept="application/json"
+        )
+        response_body = json.loads(response['body'].read())
+        claim()
+        return response_body
+    
     for attempt in range(max_retries):
+        if deadline is not None and not deadline.has(BEDROCK_MIN_CALL_SECONDS if attempt else 0.5):
+            raise Exception(f"Deadline reached before Bedrock call ({deadline.remaining():.1f}s left)")
+        breaker.check()
+        started_at = time.time()
         try:
-            response = bedrock_runtime.invoke_model(
-                modelId=model_id,
-                body=json.dumps(payload),
-                contentType="application/json",
-                accept="application/json"
+            response_body = bedrock_hedging.call(
+                model_id, invoke, deadline=deadline, can_hedge=bedrock_available, kind=hedge_kind(call_kind, payload)
             )
-            return json.loads(response['body'].read())
+            breaker.record(True, time.time() - started_at)
+            return response_body
         except ClientError as e:
             error_code = e.response['Error']['Code']
-            if error_code == 'ThrottlingException' and attempt < max_retries - 1:
+            breaker.record(error_code not in circuit_breaker.BEDROCK_FAILURE_CODES, time.time() - started_at)
+            if breaker.is_open():
+                # This failure tripped the breaker: no point backing off for a retry
+                raise CircuitOpenError(breaker.name, breaker.retry_after()) from e
+            wait_time = (2 ** attempt) * 1
+            if (error_code == 'ThrottlingException' and attempt < max_retries - 1 and
+                    (deadline is None or deadline.can_sleep(wait_time, BEDROCK_MIN_CALL_SECONDS))):
                 # Exponential backoff: 1s, 2s, 4s
-                wait_time = (2 ** attempt) * 1
                 print(f"[app.py] Throttling detected, waiting {wait_time}s before retry {attempt + 1}/{max_retries}")
                 time.sleep(wait_time)
             else:
                 raise
+        except Exception:
+            breaker.record(False, time.time() - started_at)
+            raise
     raise Exception("Max retries exceeded")
 
 
+def invoke_bedrock_stream_with_retry(
+    model_id: str,
+    payload: dict,
+    on_text: Callable[[str], None],
+    max_retries: int = 3,
+    deadline: Optional[Deadline] = None,
+    call_kind: str = 'stream'
+) -> dict:
+    """
+    Invoke Bedrock with invoke_model_with_response_stream, passing each text delta to on_text.
+    Returns a body shaped like the non-streaming Anthropic response (content, stop_reason, model)
+    so callers can parse it the same way. A stream still running at the deadline is cut off
+    and returned with stop_reason DEADLINE_STOP_REASON. Throttling is retried with the same backoff as
+    invoke_bedrock_with_retry; errors after text has been streamed are raised.
+    Slow streams are hedged when BEDROCK_HEDGE_ENABLED: the first stream to produce text is
+    passed to on_text, the other one is closed. The circuit breaker sees the time until the
+    first text (or the end of an empty stream) as the call's latency. call_kind is as for
+    invoke_bedrock_with_retry; streams are never compared with non-streaming calls.
+    """
+    breaker = bedrock_breaker(model_id)
+    progress = {}
+    
+    def call_latency() -> float:
+        return progress['latency'] if progress['latency'] is not None else time.time() - progress['started_at']
+    
+    def stream(target_model_id: str, claim: Callable[[], bool]) -> dict:
+        response = bedrock_client.runtime(deadline).invoke_model_with_response_stream(
+            modelId=target_model_id,
+            body=json.dumps(bedrock_prompt_caching.with_cache_point(payload, target_model_id)),
+            contentType="application/json",
+            accept="application/json"
+        )
+        text_parts = []
+        body = {'model': target_model_id, 'stop_reason': None, 'usage': {}}
+        won = False
+        for event in response['body']:
+            if deadline is not None and deadline.expired():
+                # Keep what was generated so far; the caller decides what is usable
+                print(f"Deadline reached, closing Bedrock stream after {len(''.join(text_parts))} chars")
+                body['stop_reason'] = DEADLINE_STOP_REASON
+                break
+            chunk = event.get('chunk')
+            if not chunk:
+                continue
+            data = json.loads(chunk['bytes'])
+            event_type = data.get('type')
+            if event_type == 'message_start':
+                message = data.get('message', {})
+                body['model'] = message.get('model', target_model_id)
+                body['usage'].update(message.get('usage', {}))
+            elif event_type == 'content_block_delta':
+                text = data.get('delta', {}).get('text')
+                if text:
+                    if not won:
+                        if not claim():
+                            # The other hedged stream answered first
+                            response['body'].close()
+                            return body
+                        won = True
+                        progress['latency'] = time.time() - progress['started_at']
+                    progress['streamed_any'] = True
+                    text_parts.append(text)
+                    on_text(text)
+            elif event_type == 'message_delta':
+                body['stop_reason'] = data.get('delta', {}).get('stop_reason')
+                body['usage'].update(data.get('usage', {}))
+        
+        if not won:
+            claim()
+        body['content'] = [{'type': 'text', 'text': ''.join(text_parts)}]
+        return body
+    
+    for attempt in range(max_retries):
+        if deadline is not None and not deadline.has(BEDROCK_MIN_CALL_SECONDS if attempt else 0.5):
+            raise Exception(f"Deadline reached before Bedrock call ({deadline.remaining():.1f}s left)")
+        breaker.check()
+        progress.clear()
+        progress.update({'started_at': time.time(), 'latency': None, 'streamed_any': False})
+        try:
+            body = bedrock_hedging.call(
+                model_id, stream, deadline=deadline, can_hedge=bedrock_available, kind=f"{call_kind} (stream)"
+            )
+            breaker.record(True, call_latency())
+            return body
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            breaker.record(error_code not in circuit_breaker.BEDROCK_FAILURE_CODES, call_latency())
+            if breaker.is_open():
+                # This failure tripped the breaker: no point backing off for a retry
+                raise CircuitOpenError(breaker.name, breaker.retry_after()) from e
+            wait_time = (2 ** attempt) * 1
+            if (error_code == 'ThrottlingException' and not progress['streamed_any'] and attempt < max_retries - 1 and
+                    (deadline is None or deadline.can_sleep(wait_time, BEDROCK_MIN_CALL_SECONDS))):
+                print(f"[app.py] Throttling detected (stream), waiting {wait_time}s before retry {attempt + 1}/{max_retries}")
+                time.sleep(wait_time)
+            else:
+                raise
+        except Exception:
+            breaker.record(False, call_latency())
+            raise
+    raise Exception("Max retries exceeded")
+
+
+def hedge_kind(call_kind: str, payload: dict) -> str:
+    """
+    Hedging kind of a non-streaming call: its completion time grows with the output, so
+    calls are also grouped by max_tokens (rounded up to a power of two).
+    """
+    max_tokens = int(payload.get('max_tokens') or 0)
+    return f"{call_kind} (<={2 ** math.ceil(math.log2(max_tokens))} tokens)" if max_tokens > 0 else call_kind
+
+
+def bedrock_available(model_id: str) -> bool:
+    """
+    Whether calls to a model may go out (its circuit breaker is not open); used before
+    hedging or escalating to another model.
+    """
+    return not bedrock_breaker(model_id).is_open()
+
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Main handler for the Lambda function.
@@ -57,91 +301,673 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
         # Parse the request body
         body = json.loads(event.get('body', '{}'))
-        user_id = body.get('user_id')
-        prompt = body.get('prompt')
-        spotify_access_token = body.get('spotify_access_token')
-        
-        # Validate required parameters
-        if not user_id or not prompt:
-            return create_response(400, {
-                'error': 'Missing required parameters: user_id and prompt are required'
-            })
-        
-        if not spotify_access_token:
-            return create_response(400, {
-                'error': 'Missing spotify_access_token. User must authenticate with Spotify first.'
-            })
-        
-        # Get limit parameter and clamp to avoid timeouts/rate limits
-        try:
-            limit = int(body.get('limit', 25))
-        except Exception:
-            limit = 25
-        effective_limit = max(1, min(limit, 40))
+        status_code, response_body = process_playlist_request(body, deadline=Deadline.for_request(context))
+        return create_response(status_code, response_body)
         
-        print(f"Processing request for user_id: {user_id}, prompt: {prompt}, limit: {limit}, effective_limit: {effective_limit}")
-        
-        # Step 0.5: Use Amazon Q pattern to enhance the prompt before processing
-        enhanced_prompt = enhance_prompt_with_q_pattern(prompt)
-        print(f"Amazon Q enhanced prompt: {enhanced_prompt}")
-        
-        # Step 1: Interpret the enhanced prompt with Amazon Bedrock
-        music_parameters = interpret_prompt_with_bedrock(enhanced_prompt, effective_limit)
+    except Exception as e:
+        print(f"Error processing request: {str(e)}")
+        return create_response(500, {
+            'error': f'Internal server error: {str(e)}',
+            'model_used': BEDROCK_MODEL_ID
+        })
+
+
+def process_playlist_request(
+    body: Dict[str, Any],
+    emit: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    max_limit: int = SYNC_MAX_LIMIT,
+    deadline: Optional[Deadline] = None
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Runs the /playlist pipeline for a parsed request body and returns (status_code, response body).
+    When emit is given (streaming mode), progress events are emitted as they happen:
+    'parameters' once the song list is generated, 'track' for each resolved track and
+    'playlist_created' once the Spotify playlist exists. Exceptions propagate to the caller.
+    With async=true the request is queued as a playlist job and 202 is returned with its id.
+    deadline is the request's time budget; every stage gets it (defaults to
+    PIPELINE_TIME_BUDGET_SECONDS from now).
+    """
+    user_id = body.get('user_id')
+    prompt = body.get('prompt')
+    spotify_access_token = body.get('spotify_access_token')
+    
+    # Validate required parameters
+    if not user_id or not prompt:
+        return 400, {
+            'error': 'Missing required parameters: user_id and prompt are required'
+        }
+    
+    if not spotify_access_token:
+        return 400, {
+            'error': 'Missing spotify_access_token. User must authenticate with Spotify first.'
+        }
+    
+    # Large playlists: hand the request to the job worker and let the client poll
+    if is_truthy(body.get('async')):
+        job_id = playlist_jobs.create_job(user_id, body)
+        return 202, {
+            'message': 'Playlist job queued',
+            'job_id': job_id,
+            'status': playlist_jobs.JOB_STATUS_QUEUED,
+            'status_url': f'/playlist/jobs/{job_id}',
+            'timestamp': datetime.utcnow().isoformat()
+        }
+    
+    # Get limit parameter and clamp to avoid timeouts/rate limits
+    try:
+        limit = int(body.get('limit', 25))
+    except Exception:
+        limit = 25
+    effective_limit = max(1, min(limit, max_limit))
+    deadline = deadline or Deadline.after(PIPELINE_TIME_BUDGET_SECONDS)
+    
+    # Fail fast instead of generating songs for a playlist Spotify will not accept right now
+    playlist_breaker = spotify_playlist_breaker()
+    if playlist_breaker.is_open():
+        return circuit_open_response(CircuitOpenError(playlist_breaker.name, playlist_breaker.retry_after()))
+    
+    # fresh=true bypasses the prompt cache for users who want a new selection
+    fresh = is_truthy(body.get('fresh'))
+    pipeline_mode = resolve_pipeline_mode(body.get('pipeline_mode'), DEFAULT_PIPELINE_MODE)
+    
+    print(f"Processing request for user_id: {user_id}, prompt: {prompt}, limit: {limit}, effective_limit: {effective_limit}, fresh: {fresh}, pipeline_mode: {pipeline_mode}")
+    
+    # Step 3 (started early): look up the Spotify profile and create the empty playlist
+    # while the songs are generated and searched; tracks are appended at the end
+    provisional_name = f"AI DJ - {prompt[:30]}"
+    pending_playlist = PendingPlaylist(provisional_name, spotify_access_token, body.get('spotify_token_expires_at'), deadline)
+    
+    try:
+        # Steps 0.5 + 1 + 2: Enhance the prompt (Amazon Q pattern), interpret it with Amazon Bedrock
+        # (unless an identical prompt was generated recently) and search the songs on Spotify
+        # while they are still being generated
+        generation_stats = {}
+        search_stats = {}
+        music_parameters, tracks = generate_and_resolve_tracks(
+            prompt,
+            effective_limit,
+            spotify_access_token,
+            fresh=fresh,
+            pipeline_mode=pipeline_mode,
+            generation_stats=generation_stats,
+            search_stats=search_stats,
+            market_provider=pending_playlist.market,
+            deadline=deadline,
+            **stream_callbacks(emit)
+        )
         print(f"Extracted music parameters: {music_parameters}")
         
-        # Step 2: Search for tracks on Spotify
-        # Ensure we only search up to effective_limit songs
-        if isinstance(music_parameters, dict) and isinstance(music_parameters.get('songs'), list):
-            music_parameters['songs'] = music_parameters['songs'][:effective_limit]
-        tracks = search_spotify_tracks(music_parameters, spotify_access_token)
-        
         if not tracks:
+            pending_playlist.discard()
             # Return debug info to frontend to help diagnose (model, parameters, songs count)
-            return create_response(404, {
+            model_router.log_tier('app', generation_stats.get('model_route'))
+            return 404, {
                 'error': 'No tracks found matching the criteria',
-                'model_used': BEDROCK_MODEL_ID,
+                'model_used': model_used(generation_stats),
+                'model_tier': generation_stats.get('model_route'),
                 'parameters': music_parameters,
                 'ai_songs_count': len(music_parameters.get('songs', [])) if isinstance(music_parameters, dict) else 0,
+                'track_cache': search_stats.get('track_cache'),
+                'not_found_songs': search_stats.get('not_found_songs', []),
+                'fill': search_stats.get('fill'),
+                **partial_result(search_stats),
                 'timestamp': datetime.utcnow().isoformat()
-            })
+            }
         
         print(f"Found {len(tracks)} tracks")
         
-        # Step 3: Create a playlist on Spotify
-        playlist_url = create_spotify_playlist(
-            user_id=user_id,
-            playlist_name=music_parameters.get('playlist_name', f"AI DJ - {prompt[:30]}"),
+        # Step 3: Name the pre-created playlist and add the tracks
+        playlist_stats = {}
+        playlist_url = pending_playlist.finalize(
+            playlist_name=music_parameters.get('playlist_name') or provisional_name,
             track_uris=[track['uri'] for track in tracks],
-            access_token=spotify_access_token
+            playlist_stats=playlist_stats
         )
+    except CircuitOpenError as e:
+        pending_playlist.discard()
+        return circuit_open_response(e)
+    except Exception:
+        pending_playlist.discard()
+        raise
+    finally:
+        pending_playlist.close()
+    
+    print(f"Created playlist: {playlist_url}")
+    if emit:
+        emit('playlist_created', {'playlist_url': playlist_url, 'tracks_count': len(tracks)})
+    
+    # Step 4: Save to DynamoDB (write-behind, off the critical path)
+    save_playlist_to_dynamodb(user_id, playlist_url, prompt, music_parameters, playlist_analytics(
+        'playlist', tracks, music_parameters, generation_stats, search_stats,
+        pipeline_mode=pipeline_mode, requested_limit=limit, market=search_stats.get('market')
+    ), tracks_count=len(tracks))
+    
+    # Successful response with track list (partial when the deadline cut the search short)
+    model_router.log_tier('app', generation_stats.get('model_route'))
+    return 200, {
+        'message': 'Playlist created with the tracks found in time' if search_stats.get('partial') else 'Playlist created successfully',
+        'playlist_url': playlist_url,
+        'tracks_count': len(tracks),
+        'tracks': tracks,  # Include full track list
+        'parameters': music_parameters,
+        'model_used': model_used(generation_stats),  # Show which model was used
+        'model_tier': generation_stats.get('model_route'),
+        'timestamp': datetime.utcnow().isoformat(),  # Prevent caching
+        'requested_limit': limit,
+        'effective_limit': effective_limit,
+        'pipeline_mode': pipeline_mode,
+        'prompt_cache': generation_stats.get('prompt_cache'),
+        'single_flight': generation_stats.get('single_flight'),
+        'salvage': generation_stats.get('salvage'),
+        'track_cache': search_stats.get('track_cache'),
+        'not_found_songs': search_stats.get('not_found_songs', []),
+        'fill': search_stats.get('fill'),
+        'snapshot_id': playlist_stats.get('snapshot_id'),
+        'market': search_stats.get('market'),
+        **partial_result(search_stats),
+        'time_budget': deadline.report()
+    }
+
+
+def model_used(generation_stats: Dict[str, Any]) -> str:
+    """
+    Model that produced the song list (the routed tier, after any escalation).
+    """
+    return (generation_stats.get('model_route') or {}).get('model_id', BEDROCK_MODEL_ID)
+
+
+def circuit_open_response(error: CircuitOpenError) -> Tuple[int, Dict[str, Any]]:
+    """
+    503 returned when a dependency's circuit breaker is open.
+    """
+    print(f"Failing fast: {str(error)}")
+    return 503, {
+        'error': 'A music service is temporarily unavailable, please try again shortly',
+        'dependency': error.name,
+        'retry_after': int(math.ceil(error.retry_after)),
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+
+def partial_result(search_stats: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Response fields flagging a playlist cut short by the deadline, with the suggestions
+    that were not resolved in time (empty when the result is complete).
+    """
+    partial = bool(search_stats.get('partial'))
+    return {
+        'partial': partial,
+        'unresolved_songs': search_stats.get('unresolved_songs', []) if partial else []
+    }
+
+
+def stream_callbacks(emit: Optional[Callable[[str, Dict[str, Any]], None]]) -> Dict[str, Any]:
+    """
+    Maps a streaming emit function to the on_parameters/on_track callbacks of
+    generate_and_resolve_tracks. Returns no callbacks for buffered requests.
+    """
+    if not emit:
+        return {}
+    return {
+        'on_parameters': lambda music_parameters: emit('parameters', {'parameters': music_parameters}),
+        'on_track': lambda position, track: emit('track', {'position': position, 'track': track})
+    }
+
+
+def is_truthy(value: Any) -> bool:
+    """
+    Interprets JSON booleans and "true"/"1"/"yes" strings from request bodies.
+    """
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('true', '1', 'yes')
+
+
+def resolve_pipeline_mode(requested: Any, default: str) -> str:
+    """
+    Returns the requested pipeline mode if it is known, otherwise the default.
+    """
+    mode = str(requested or '').strip().lower()
+    return mode if mode in PIPELINE_MODES else default
+
+
+def generate_music_parameters(
+    prompt: str,
+    limit: int,
+    fresh: bool = False,
+    pipeline_mode: str = PIPELINE_MODE_FAST,
+    max_retries: int = 4,
+    generation_stats: Optional[Dict[str, Any]] = None,
+    on_song: Optional[Callable[[str], None]] = None,
+    deadline: Optional[Deadline] = None,
+    route: Optional[ModelRoute] = None
+) -> Dict[str, Any]:
+    """
+    Produces the song list for a prompt, serving it from the prompt cache when possible.
+    On a miss, fast mode enriches and generates in a single Bedrock call, while two_call
+    mode first enhances the prompt (Amazon Q pattern) and then interprets it.
+    Songs are trimmed to limit and the result is cached.
+    If generation_stats is given, cache info is written to generation_stats['prompt_cache'].
+    on_song is forwarded to interpret_prompt_with_bedrock to stream songs as they are generated
+    (it is not called on a cache hit).
+    When the deadline is too close for two calls, two_call mode falls back to the fast path.
+    While the model's circuit breaker is open, a cached list is served even with fresh=True;
+    without one, CircuitOpenError is raised.
+    route is the model route for the generation (see model_router; chosen here if not given).
+    Lists are cached per routed model, so a cheap-tier list is never served for a prompt
+    routed to a larger model (and vice versa).
+    """
+    route = route or model_router.route(model_router.TASK_PLAYLIST, prompt, limit)
+    cache_key = prompt_cache.build_cache_key(prompt, limit, route.model_id, pipeline_mode)
+    
+    if fresh and bedrock_breaker(route.model_id).is_open():
+        print("Bedrock circuit breaker open, serving the prompt cache despite fresh=true")
+        fresh = False
+    cached = None if fresh else prompt_cache.get_cached_generation(cache_key)
+    if cached:
+        if generation_stats is not None:
+            generation_stats['prompt_cache'] = cached['cache_info']
+        return cached['music_parameters']
+    
+    if pipeline_mode == PIPELINE_MODE_TWO_CALL and deadline is not None and not deadline.has(ENHANCE_MIN_REMAINING_SECONDS):
+        print(f"Skipping prompt enhancement: {deadline.remaining():.1f}s left, using the fast pipeline")
+        pipeline_mode = PIPELINE_MODE_FAST
+    
+    if pipeline_mode == PIPELINE_MODE_TWO_CALL:
+        enhanced_prompt = enhance_prompt_with_q_pattern(prompt, deadline=deadline)
+        print(f"Amazon Q enhanced prompt: {enhanced_prompt}")
+        music_parameters = interpret_prompt_with_bedrock(
+            enhanced_prompt, limit, max_retries=max_retries, on_song=on_song, deadline=deadline, route=route
+        )
+    else:
+        music_parameters = interpret_prompt_with_bedrock(
+            prompt, limit, max_retries=max_retries, enrich=True, on_song=on_song, deadline=deadline, route=route
+        )
+    
+    # Ensure we only search up to limit songs
+    if isinstance(music_parameters, dict) and isinstance(music_parameters.get('songs'), list):
+        music_parameters['songs'] = music_parameters['songs'][:limit]
+    
+    # A list cut short by the deadline, or salvaged from a cut-off response without reaching
+    # limit, is served once, never cached
+    truncated = isinstance(music_parameters, dict) and bool(music_parameters.pop('truncated_by_deadline', False))
+    salvage = music_parameters.pop('salvage', None) if isinstance(music_parameters, dict) else None
+    short_salvage = bool(salvage) and len(music_parameters.get('songs') or []) < limit
+    if not truncated and not short_salvage:
+        prompt_cache.put_cached_generation(cache_key, music_parameters)
+    
+    if generation_stats is not None:
+        generation_stats['prompt_cache'] = {
+            'hit': False,
+            'enabled': prompt_cache.PROMPT_CACHE_ENABLED,
+            'bypassed': fresh
+        }
+        generation_stats['truncated_by_deadline'] = truncated
+        if salvage:
+            generation_stats['salvage'] = salvage
+    return music_parameters
+
+
+def generate_and_resolve_tracks(
+    prompt: str,
+    limit: int,
+    access_token: str,
+    fresh: bool = False,
+    pipeline_mode: str = PIPELINE_MODE_FAST,
+    max_retries: int = 4,
+    generation_stats: Optional[Dict[str, Any]] = None,
+    search_stats: Optional[Dict[str, Any]] = None,
+    on_track: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+    on_parameters: Optional[Callable[[Dict[str, Any]], None]] = None,
+    market_provider: Optional[Callable[[], str]] = None,
+    deadline: Optional[Deadline] = None
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Generates the song list and resolves it on Spotify, overlapping the two when
+    Bedrock streaming is enabled: each song is handed to the resolver as soon as the
+    model finishes writing it, so total time approaches max(generation, search).
+    Bedrock is asked for a surplus of songs (GENERATION_SURPLUS_FACTOR) and searching
+    stops once limit tracks are found. If the playlist is still short, top-up rounds ask
+    for the missing songs only, as long as deadline (defaults to PIPELINE_TIME_BUDGET_SECONDS
+    from now) leaves time; the same deadline bounds generation and every search.
+    Generation and search stop PLAYLIST_WRITE_RESERVE_SECONDS before the deadline and keep
+    what resolved by then: search_stats['partial'] is set when that cut the playlist short,
+    with the suggestions left unresolved in search_stats['unresolved_songs'].
+    search_stats['fill'] reports the outcome.
+    on_track(position, track) is called from resolver threads as each track resolves;
+    on_parameters(music_parameters) is called once generation has finished.
+    market_provider() is called once, right before the first search, to pick the market.
+    Identical requests in flight at the same time (same normalized prompt, limit and mode)
+    are coalesced: one of them generates and searches, the others reuse its song list and
+    tracks (see single_flight; generation_stats['single_flight'] reports the role).
+    fresh=true requests never coalesce.
+    Returns (music_parameters, at most limit tracks in suggestion order).
+    """
+    deadline = deadline or Deadline.after(PIPELINE_TIME_BUDGET_SECONDS)
+    generation_stats = generation_stats if generation_stats is not None else {}
+    search_stats = search_stats if search_stats is not None else {}
+    
+    # Routed up front so identical prompts only coalesce when they would use the same model
+    route = model_router.route(model_router.TASK_PLAYLIST, prompt, surplus_limit(limit))
+    
+    def compute() -> Dict[str, Any]:
+        music_parameters, tracks = _generate_and_resolve_tracks(
+            prompt, limit, access_token, fresh, pipeline_mode, max_retries, generation_stats,
+            search_stats, on_track, on_parameters, market_provider, deadline, route
+        )
+        return {
+            'music_parameters': music_parameters,
+            'tracks': tracks,
+            'generation_stats': {key: value for key, value in generation_stats.items() if key != 'single_flight'},
+            'search_stats': search_stats
+        }
+    
+    if fresh or not single_flight.SINGLE_FLIGHT_ENABLED:
+        result = compute()
+        return result['music_parameters'], result['tracks']
+    
+    flight_key = single_flight.build_key(prompt, limit, route.model_id, pipeline_mode)
+    result, flight = single_flight.run(flight_key, compute, deadline.reserving(PLAYLIST_WRITE_RESERVE_SECONDS))
+    generation_stats['single_flight'] = flight
+    if flight['role'] != 'follower':
+        return result['music_parameters'], result['tracks']
+    
+    print(f"Reusing the generation of an identical in-flight request ({flight['source']}, waited {flight['waited_ms']}ms)")
+    return follow_flight(
+        copy.deepcopy(result), limit, access_token, generation_stats, search_stats,
+        on_track, on_parameters, market_provider, deadline
+    )
+
+
+def follow_flight(
+    result: Dict[str, Any],
+    limit: int,
+    access_token: str,
+    generation_stats: Dict[str, Any],
+    search_stats: Dict[str, Any],
+    on_track: Optional[Callable[[int, Dict[str, Any]], None]],
+    on_parameters: Optional[Callable[[Dict[str, Any]], None]],
+    market_provider: Optional[Callable[[], str]],
+    deadline: Deadline
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Adopts the leader's result for a coalesced request. Its tracks are reused when they were
+    resolved in the same market; otherwise the leader's song list is searched in ours.
+    The streaming callbacks are replayed so followers emit the same events as the leader.
+    """
+    music_parameters = result['music_parameters']
+    generation_stats.update(result['generation_stats'])
+    if on_parameters:
+        on_parameters(music_parameters)
+    
+    market = market_provider() if market_provider else SPOTIFY_MARKET
+    if result['search_stats'].get('market') == market:
+        tracks = result['tracks']
+        search_stats.update(result['search_stats'])
+    else:
+        print(f"Leader resolved its tracks in {result['search_stats'].get('market')}, searching the songs in {market}")
+        tracks = search_spotify_tracks(
+            music_parameters, access_token, search_stats, market=market,
+            deadline=deadline.reserving(PLAYLIST_WRITE_RESERVE_SECONDS), limit=limit
+        )
+        search_stats['partial'] = len(tracks) < limit and bool(search_stats['unresolved_songs'])
+        search_stats['fill'] = fill_stats(
+            limit, surplus_limit(limit), music_parameters, tracks, partial=search_stats['partial']
+        )
+    
+    if on_track:
+        for position, track in enumerate(tracks):
+            on_track(position, track)
+    return music_parameters, tracks
+
+
+def _generate_and_resolve_tracks(
+    prompt: str,
+    limit: int,
+    access_token: str,
+    fresh: bool,
+    pipeline_mode: str,
+    max_retries: int,
+    generation_stats: Dict[str, Any],
+    search_stats: Dict[str, Any],
+    on_track: Optional[Callable[[int, Dict[str, Any]], None]],
+    on_parameters: Optional[Callable[[Dict[str, Any]], None]],
+    market_provider: Optional[Callable[[], str]],
+    deadline: Deadline,
+    route: ModelRoute
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    generate_and_resolve_tracks for a single request, without coalescing.
+    """
+    search_deadline = deadline.reserving(PLAYLIST_WRITE_RESERVE_SECONDS)
+    generation_limit = surplus_limit(limit)
+    topup = {'topup_rounds': 0, 'topup_songs': 0}
+    
+    # Every path goes through the resolver, streamed or not: it stops searching once limit
+    # tracks are found and drops songs resolving to a track already kept
+    resolver = StreamingTrackResolver(
+        access_token, on_track=on_track, market_provider=market_provider, target=limit, deadline=search_deadline
+    )
+    try:
+        music_parameters = generate_music_parameters(
+            prompt, generation_limit, fresh=fresh, pipeline_mode=pipeline_mode, max_retries=max_retries,
+            generation_stats=generation_stats, on_song=resolver.submit, deadline=search_deadline, route=route
+        )
+        if on_parameters:
+            on_parameters(music_parameters)
+        # Cache hits, non-streamed fallbacks and strict retries did not go through on_song;
+        # already submitted songs are ignored by the resolver
+        songs = music_parameters.get('songs')
+        if isinstance(songs, list):
+            for song in songs:
+                resolver.submit(song)
+        tracks = resolver.results(search_stats)
         
-        print(f"Created playlist: {playlist_url}")
-        
-        # Step 4: Save to DynamoDB
-        save_playlist_to_dynamodb(user_id, playlist_url, prompt, music_parameters)
-        
-        # Successful response with track list
-        return create_response(200, {
-            'message': 'Playlist created successfully',
-            'playlist_url': playlist_url,
-            'tracks_count': len(tracks),
-            'tracks': tracks,  # Include full track list
-            'parameters': music_parameters,
-            'model_used': BEDROCK_MODEL_ID,  # Show which model was used
-            'timestamp': datetime.utcnow().isoformat(),  # Prevent caching
-            'requested_limit': limit,
-            'effective_limit': effective_limit
-        })
-        
+        while should_top_up(limit, tracks, topup, search_deadline):
+            escalate_for_fill(route, limit, tracks, search_deadline)
+            songs = request_top_up_songs(
+                prompt, limit - len(tracks), music_parameters, tracks, search_stats, topup,
+                on_song=resolver.submit, deadline=search_deadline, route=route
+            )
+            if not songs:
+                break
+            for song in songs:
+                resolver.submit(song)
+            tracks = resolver.results(search_stats)
+    finally:
+        resolver.close()
+    fill_extra = {'searches_skipped': resolver.skipped, 'searches_cancelled': resolver.cancelled}
+    
+    # Partial: short of limit because time ran out (generation cut off, searches left
+    # unresolved or top-up skipped), not because the suggestions were missing on Spotify
+    out_of_time = (generation_stats.get('truncated_by_deadline') or bool(search_stats.get('unresolved_songs')) or
+                   topup.get('topup_skipped_for_time', False))
+    search_stats['partial'] = len(tracks) < limit and bool(out_of_time)
+    if search_stats['partial']:
+        print(f"Partial result: {len(tracks)}/{limit} tracks, {len(search_stats['unresolved_songs'])} suggestion(s) unresolved")
+    search_stats['fill'] = fill_stats(
+        limit, generation_limit, music_parameters, tracks, partial=search_stats['partial'], **fill_extra, **topup
+    )
+    generation_stats['model_route'] = route.describe()
+    return music_parameters, tracks
+
+
+def escalate_for_fill(route: ModelRoute, limit: int, tracks: List[Dict[str, Any]], deadline: Deadline) -> None:
+    """
+    Moves the top-up rounds to a larger model when the playlist resolved below the fill threshold.
+    """
+    reason = model_router.escalation_reason(fill_rate=len(tracks) / limit if limit else 1.0)
+    if reason:
+        route.escalate(reason, deadline, bedrock_available)
+
+
+def should_top_up(limit: int, tracks: List[Dict[str, Any]], topup: Dict[str, Any], deadline: Deadline) -> bool:
+    """
+    Another top-up round is worth it only while the playlist is short and the remaining
+    time can fit a (small) generation plus its searches.
+    """
+    if len(tracks) >= limit or topup['topup_rounds'] >= TOPUP_MAX_ROUNDS:
+        return False
+    if not deadline.has(TOPUP_MIN_REMAINING_SECONDS):
+        print(f"Skipping top-up for {limit - len(tracks)} missing tracks: {deadline.remaining():.1f}s left")
+        topup['topup_skipped_for_time'] = True
+        return False
+    return True
+
+
+def request_top_up_songs(
+    prompt: str,
+    missing: int,
+    music_parameters: Dict[str, Any],
+    tracks: List[Dict[str, Any]],
+    search_stats: Dict[str, Any],
+    topup: Dict[str, int],
+    on_song: Optional[Callable[[str], None]] = None,
+    deadline: Optional[Deadline] = None,
+    route: Optional[ModelRoute] = None
+) -> List[str]:
+    """
+    Asks Bedrock for songs to fill the missing slots (with the usual surplus), excluding
+    resolved tracks, songs known to be missing on Spotify and everything suggested so far.
+    New songs are appended to music_parameters['songs'].
+    """
+    suggested = music_parameters.get('songs') if isinstance(music_parameters.get('songs'), list) else []
+    exclude = [f"{track['name']} - {track['artist']}" for track in tracks]
+    exclude += search_stats.get('not_found_songs', [])
+    exclude += suggested
+    exclude = list(dict.fromkeys(exclude))[:TOPUP_EXCLUDE_MAX]
+    
+    topup['topup_rounds'] += 1
+    print(f"Top-up round {topup['topup_rounds']}: requesting {missing} more songs (excluding {len(exclude)})")
+    try:
+        top_up_parameters = interpret_prompt_with_bedrock(
+            prompt, surplus_limit(missing), _retry_if_empty=False, max_retries=1,
+            enrich=True, on_song=on_song, exclude=exclude, deadline=deadline, route=route
+        )
+    except CircuitOpenError as e:
+        print(f"Skipping top-up: {str(e)}")
+        return []
+    songs = top_up_parameters.get('songs') if isinstance(top_up_parameters.get('songs'), list) else []
+    songs = [song for song in songs if isinstance(song, str) and song not in suggested]
+    
+    music_parameters['songs'] = suggested + songs
+    topup['topup_songs'] += len(songs)
+    return songs
+
+
+def surplus_limit(limit: int) -> int:
+    """
+    Number of songs to request from Bedrock for a playlist of limit tracks.
+    """
+    return max(limit, math.ceil(limit * GENERATION_SURPLUS_FACTOR))
+
+
+def fill_stats(
+    limit: int,
+    generation_limit: int,
+    music_parameters: Dict[str, Any],
+    tracks: List[Dict[str, Any]],
+    **extra: Any
+) -> Dict[str, Any]:
+    """
+    How well the surplus covered the requested count (reported as 'fill' in responses).
+    """
+    songs = music_parameters.get('songs', []) if isinstance(music_parameters, dict) else []
+    return {
+        'requested': limit,
+        'surplus_factor': GENERATION_SURPLUS_FACTOR,
+        'surplus_requested': generation_limit - limit,
+        'songs_generated': len(songs) if isinstance(songs, list) else 0,
+        'tracks_resolved': len(tracks),
+        'fill_rate': round(len(tracks) / limit, 3) if limit else 0.0,
+        **extra
+    }
+
+
+def salvage_truncated_songs(
+    text: str,
+    limit: int,
+    payload: Dict[str, Any],
+    stop_reason: Optional[str],
+    route: ModelRoute,
+    on_song: Optional[Callable[[str], None]] = None,
+    max_retries: int = 4,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """
+    Music parameters from a song list that did not parse: the complete songs of text and,
+    when the list was cut off at max_tokens with fewer than limit songs, the rest requested
+    as a continuation (the cut-off JSON is sent back as the start of the assistant's answer,
+    so the model only writes the missing songs). Songs already passed to on_song are not
+    passed again. Returns {} when nothing could be salvaged, so the caller can retry.
+    """
+    salvaged = salvage_song_list(text, limit)
+    songs = salvaged['songs']
+    if not songs:
+        record_salvage(0, False)
+        return {}
+    print(f"Salvaged {len(songs)}/{limit} songs from an unparsable response (stop_reason={stop_reason})")
+    
+    music_params = {
+        'songs': songs,
+        'playlist_name': salvaged['playlist_name'] or 'AI DJ Playlist',
+        'salvage': {'songs': len(songs), 'continued': False, 'continuation_songs': 0}
+    }
+    if len(songs) >= limit or stop_reason != 'max_tokens' or not SALVAGE_CONTINUATION_ENABLED:
+        record_salvage(len(songs), False)
+        return music_params
+    if deadline is not None and not deadline.has(STRICT_RETRY_MIN_REMAINING_SECONDS):
+        print(f"Not continuing the song list: {deadline.remaining():.1f}s left")
+        record_salvage(len(songs), False)
+        return music_params
+    
+    missing = limit - len(songs)
+    continuation_payload = dict(payload)
+    continuation_payload['max_tokens'] = min(missing * 25 + 200, BEDROCK_MAX_OUTPUT_TOKENS)
+    continuation_payload['messages'] = payload['messages'] + [
+        {"role": "assistant", "content": [{"type": "text", "text": salvaged['prefix']}]}
+    ]
+    print(f"Continuing the song list for {missing} more songs on {route.model_id}")
+    
+    def on_continued_song(song: str) -> None:
+        # The prefix replays the salvaged songs; only new ones are passed on
+        if on_song is not None and len(parser.songs) > len(songs):
+            on_song(song)
+    
+    parser = SongStreamParser(on_continued_song, max_songs=limit)
+    parser.feed(salvaged['prefix'])
+    try:
+        if on_song is not None and BEDROCK_STREAMING_ENABLED:
+            body = invoke_bedrock_stream_with_retry(
+                route.model_id, continuation_payload, parser.feed, max_retries=max_retries, deadline=deadline,
+                call_kind='interpret-continuation'
+            )
+        else:
+            body = invoke_bedrock_with_retry(
+                route.model_id, continuation_payload, max_retries=max_retries, deadline=deadline,
+                call_kind='interpret-continuation'
+            )
+            parser.feed(body['content'][0].get('text') or '')
+    except CircuitOpenError:
+        raise
     except Exception as e:
-        print(f"Error processing request: {str(e)}")
-        return create_response(500, {
-            'error': f'Internal server error: {str(e)}',
-            'model_used': BEDROCK_MODEL_ID
-        })
+        print(f"Song list continuation failed, keeping {len(songs)} salvaged songs: {str(e)}")
+        record_salvage(len(songs), True)
+        return music_params
+    bedrock_prompt_caching.record_usage('interpret-continuation', body)
+    
+    continuation_text = (body.get('content') or [{}])[0].get('text') or ''
+    name = salvage_song_list(salvaged['prefix'] + continuation_text)['playlist_name']
+    music_params['songs'] = list(parser.songs)
+    music_params['playlist_name'] = salvaged['playlist_name'] or name or music_params['playlist_name']
+    music_params['salvage'].update({'continued': True, 'continuation_songs': len(parser.songs) - len(songs)})
+    if body.get('stop_reason') == DEADLINE_STOP_REASON:
+        music_params['truncated_by_deadline'] = True
+    record_salvage(len(parser.songs), True)
+    return music_params
 
 
-def enhance_prompt_with_q_pattern(prompt: str) -> str:
+def enhance_prompt_with_q_pattern(prompt: str, deadline: Optional[Deadline] = None) -> str:
     """
     Use Amazon Q pattern to enhance and expand user prompt with more details
     Makes prompts more specific for better playlist generation
@@ -169,7 +995,8 @@ Enhanced prompt:"""
             ]
         }
         
-        response = invoke_bedrock_with_retry(BEDROCK_MODEL_ID, payload, max_retries=1)
+        route = model_router.route(model_router.TASK_PROMPT_ENHANCEMENT, prompt)
+        response = invoke_bedrock_with_retry(route.model_id, payload, max_retries=1, deadline=deadline, call_kind='enhance')
         enhanced = response['content'][0]['text'].strip()
         
         print(f"🤖 Amazon Q enhanced: '{prompt}' → '{enhanced}'")
@@ -180,11 +1007,31 @@ Enhanced prompt:"""
         return prompt
 
 
-def interpret_prompt_with_bedrock(prompt: str, limit: int = 25, _retry_if_empty: bool = True, max_retries: int = 4) -> Dict[str, Any]:
+def interpret_prompt_with_bedrock(
+    prompt: str,
+    limit: int = 25,
+    _retry_if_empty: bool = True,
+    max_retries: int = 4,
+    enrich: bool = False,
+    on_song: Optional[Callable[[str], None]] = None,
+    exclude: Optional[List[str]] = None,
+    deadline: Optional[Deadline] = None,
+    route: Optional[ModelRoute] = None
+) -> Dict[str, Any]:
     """
     Uses Amazon Bedrock to interpret the user's prompt and suggest specific songs.
+    With enrich=True the model also performs the Amazon Q style expansion (artists, era,
+    energy, occasion, language) inside this same call, replacing enhance_prompt_with_q_pattern.
+    With on_song, the response is streamed and on_song is called with each "Song - Artist"
+    (up to limit) as soon as it is generated; the full result is still returned at the end.
+    exclude lists "Song - Artist" entries the model must not suggest (top-up rounds).
+    deadline bounds the Bedrock retries; the strict JSON retry is skipped when it cannot fit.
+    The model comes from route (see model_router). An unparsable answer keeps its complete
+    songs, continued when it was cut off (salvage_truncated_songs); only when no song can be
+    salvaged is the model escalated to the next tier for the strict JSON retry.
     """
-    print(f"🤖 Using Bedrock Model: {BEDROCK_MODEL_ID}")
+    route = route or model_router.route(model_router.TASK_PLAYLIST, prompt, limit)
+    print(f"🤖 Using Bedrock Model: {route.model_id} ({route.tier} tier)")
     
     system_prompt = """You are a helpful assistant for creating music playlists. Interpret the user's request and return a strictly filtered list of songs that match ALL inferred constraints, without relying on any hardcoded artist, genre, or country lists.
 
@@ -210,19 +1057,36 @@ Output requirements:
 - Use real, popular songs available on Spotify.
 """
 
-    # Add timestamp to prevent caching
-    import time
-    request_id = int(time.time() * 1000)
+    # Fast pipeline: fold the prompt enhancement step into this call (silently, no extra output)
+    enrichment_step = ""
+    if enrich:
+        enrichment_step = """0) Silently expand the request before filtering: infer specific example artists in that style, time period/era if relevant, energy level and mood, typical occasion, and language if not specified. Treat these as soft preferences; the user's explicit constraints always win.
+"""
     
-    user_message = f"""[Request ID: {request_id}] Create a playlist with {limit} songs based on: "{prompt}"
-
-Process to follow (no prose in output):
-1) Extract constraints explicitly stated by the user (artist(s), genre/subgenre, country/region, language, era, mood, etc.).
+    # Everything above is identical for every request and is cached by Bedrock as one prefix;
+    # the per-request part (prompt, exclusions, request id) only goes into the user message
+    system_prompt += f"""
+Process to follow for every request (no prose in output):
+{enrichment_step}1) Extract constraints explicitly stated by the user (artist(s), genre/subgenre, country/region, language, era, mood, etc.).
 2) Propose candidates and FILTER OUT anything that violates ANY constraint.
 3) Validate each remaining song against ALL constraints. If uncertain, exclude it.
 4) Return ONLY strict JSON with keys: songs, playlist_name. No markdown, no extra text.
+"""
+    
+    user_message = f'Create a playlist with {limit} songs based on: "{prompt}"'
+    
+    if exclude:
+        excluded_songs = "\n".join(f"- {song}" for song in exclude)
+        user_message += f"""
+
+Do NOT include any of these songs (already in the playlist or not available on Spotify):
+{excluded_songs}"""
+    
+    # Add timestamp to prevent response caching (after the cached prefix, so it does not break it)
+    request_id = int(time.time() * 1000)
+    user_message += f"""
 
-Now create the playlist with {limit} songs:"""
+Now create the playlist with {limit} songs. [Request ID: {request_id}]"""
     
     # Prepare the payload for Anthropic Messages API (Bedrock)
     # Calculate required tokens based on limit (each song ~20 tokens)
@@ -231,7 +1095,7 @@ Now create the playlist with {limit} songs:"""
     
     payload = {
         "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": min(required_tokens, 4096),  # Cap at model limit
+        "max_tokens": min(required_tokens, BEDROCK_MAX_OUTPUT_TOKENS),  # Cap at model limit
         "temperature": 0.7,
         "system": system_prompt,
         "messages": [
@@ -245,8 +1109,26 @@ Now create the playlist with {limit} songs:"""
     }
     
     try:
-        # Invoke Bedrock with retry logic
-        response_body = invoke_bedrock_with_retry(BEDROCK_MODEL_ID, payload, max_retries=max_retries)
+        # Invoke Bedrock with retry logic (streamed when the caller wants songs incrementally)
+        if on_song is not None and BEDROCK_STREAMING_ENABLED:
+            song_parser = SongStreamParser(on_song, max_songs=limit)
+            response_body = invoke_bedrock_stream_with_retry(
+                route.model_id, payload, song_parser.feed, max_retries=max_retries, deadline=deadline,
+                call_kind='interpret'
+            )
+            print(f"Streamed {len(song_parser.songs)} songs, first after {song_parser.first_song_ms} ms")
+            if response_body.get('stop_reason') == DEADLINE_STOP_REASON:
+                # The JSON is incomplete; the songs parsed so far are the usable part
+                return {
+                    'songs': list(song_parser.songs),
+                    'playlist_name': f'AI DJ - {prompt[:30]}',
+                    'truncated_by_deadline': True
+                }
+        else:
+            response_body = invoke_bedrock_with_retry(
+                route.model_id, payload, max_retries=max_retries, deadline=deadline, call_kind='interpret'
+            )
+        bedrock_prompt_caching.record_usage('interpret', response_body)
         print(f"Bedrock raw response keys: {list(response_body.keys())}")
         if isinstance(response_body, dict):
             print(f"Bedrock meta: model={response_body.get('model')} stop_reason={response_body.get('stop_reason')}")
@@ -299,7 +1181,11 @@ Now create the playlist with {limit} songs:"""
                 music_params = json.loads(text)
             except Exception as ex:
                 print(f"Failed to parse AI content as JSON: {str(ex)} | content preview: {str((content or '') )[:400]}")
-                music_params = {}
+                # Keep every complete song (continuing the list if it was cut off) before paying for a retry
+                music_params = salvage_truncated_songs(
+                    content or '', limit, payload, response_body.get('stop_reason'),
+                    route, on_song, max_retries, deadline
+                )
 
         # Ensure required fields
         if 'songs' not in music_params:
@@ -309,7 +1195,14 @@ Now create the playlist with {limit} songs:"""
 
         # If no songs were produced, do a single JSON-enforcing retry
         if _retry_if_empty and (not isinstance(music_params.get('songs'), list) or len(music_params.get('songs', [])) == 0):
-            print("No songs in AI response. Retrying with strict JSON-only instruction...")
+            if deadline is not None and not deadline.has(STRICT_RETRY_MIN_REMAINING_SECONDS):
+                print(f"No songs in AI response and {deadline.remaining():.1f}s left; skipping the strict JSON retry")
+                return music_params
+            reason = model_router.escalation_reason(
+                truncated=response_body.get('stop_reason') == 'max_tokens', parsed=False
+            )
+            route.escalate(reason, deadline, bedrock_available)
+            print(f"No songs in AI response ({reason}). Retrying with strict JSON-only instruction on {route.model_id}...")
             strict_system = """You generate playlists. Return ONLY valid minified JSON, no markdown, no comments, no prose.
 Keys: songs (array of strings "Song - Artist"), playlist_name (string). Do not add extra keys. Do not wrap in backticks. Do not explain.
 If the user asked for genre or country, pick real, popular songs that exist on Spotify."""
@@ -327,7 +1220,10 @@ If the user asked for genre or country, pick real, popular songs that exist on S
             }
 
             try:
-                strict_body = invoke_bedrock_with_retry(BEDROCK_MODEL_ID, strict_payload, max_retries=max_retries)
+                strict_body = invoke_bedrock_with_retry(
+                    route.model_id, strict_payload, max_retries=max_retries, deadline=deadline, call_kind='interpret-strict'
+                )
+                bedrock_prompt_caching.record_usage('interpret-strict', strict_body)
                 strict_text = None
                 if isinstance(strict_body.get('content'), list) and strict_body['content']:
                     strict_text = strict_body['content'][0].get('text') or strict_body['content'][0].get('content')
@@ -356,6 +1252,9 @@ If the user asked for genre or country, pick real, popular songs that exist on S
 
         return music_params
         
+    except CircuitOpenError:
+        # Callers decide how to degrade (prompt cache, skip top-up, 503)
+        raise
     except Exception as e:
         print(f"Error calling Bedrock: {str(e)}")
         # Fallback to default parameters
@@ -393,7 +1292,7 @@ def get_spotify_client_token() -> Optional[str]:
     }
     
     try:
-        response = requests.post(auth_url, headers=headers, data=data, timeout=10)
+        response = http_session.post(auth_url, headers=headers, data=data)
         response.raise_for_status()
         return response.json().get('access_token')
     except Exception as e:
@@ -401,166 +1300,667 @@ def get_spotify_client_token() -> Optional[str]:
         return None
 
 
-def search_spotify_tracks(parameters: Dict[str, Any], access_token: str) -> List[Dict[str, Any]]:
+def _wait_for_spotify_rate_limit(deadline: Optional[Deadline] = None) -> bool:
     """
-    Searches for specific songs on Spotify based on AI suggestions.
-    Returns track details including name, artist, and URI.
+    Blocks the calling worker while the shared Spotify Retry-After window is open.
+    Returns False without waiting when the window outlasts the deadline.
     """
-    headers = {
-        'Authorization': f'Bearer {access_token}'
+    with _spotify_rate_limit_lock:
+        wait_time = _spotify_blocked_until - time.time()
+    if wait_time > 0:
+        if deadline is not None and not deadline.can_sleep(wait_time, SPOTIFY_MIN_CALL_SECONDS):
+            return False
+        time.sleep(wait_time)
+    return True
+
+
+def _spotify_timeout(deadline: Optional[Deadline]) -> Tuple[float, float]:
+    return deadline.http_timeout() if deadline is not None else (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+
+def _register_spotify_retry_after(retry_after: float) -> None:
+    """
+    Extends the shared Spotify Retry-After window so all workers back off together.
+    """
+    global _spotify_blocked_until
+    with _spotify_rate_limit_lock:
+        _spotify_blocked_until = max(_spotify_blocked_until, time.time() + retry_after)
+
+
+def search_spotify_track(
+    song: str,
+    headers: Dict[str, str],
+    market: str = SPOTIFY_MARKET,
+    deadline: Optional[Deadline] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Searches Spotify for a single "Song - Artist" string and returns the best match.
+    Returns an empty dict when Spotify has no match, or None when the search itself failed.
+    Honors 429 Retry-After responses across all concurrent workers. With a deadline the
+    search is given up (None) once it can no longer finish in time; the same happens while
+    the Spotify search circuit breaker is open (cached tracks are still served by callers).
+    """
+    search_url = 'https://api.spotify.com/v1/search'
+    search_params = {
+        'q': song,
+        'type': 'track',
+        'limit': 1,  # Get only the best match
+        'market': market
     }
-    
+
+    try:
+        print(f"Searching for: {song}")
+
+        breaker = circuit_breaker.get_breaker(SPOTIFY_SEARCH_BREAKER, SPOTIFY_SEARCH_SLOW_CALL_SECONDS)
+        for attempt in range(SPOTIFY_MAX_RATE_LIMIT_RETRIES + 1):
+            if not _wait_for_spotify_rate_limit(deadline) or (deadline is not None and deadline.expired()):
+                print(f"Deadline reached, giving up search for '{song}'")
+                return None
+            if not breaker.allow():
+                print(f"Spotify search circuit breaker open, skipping '{song}'")
+                return None
+            started_at = time.time()
+            try:
+                response = http_session.get(search_url, headers=headers, params=search_params, timeout=_spotify_timeout(deadline))
+            except Exception:
+                breaker.record(False, time.time() - started_at)
+                raise
+            breaker.record(response.status_code != 429 and response.status_code < 500, time.time() - started_at)
+
+            if response.status_code == 429 and attempt < SPOTIFY_MAX_RATE_LIMIT_RETRIES:
+                try:
+                    retry_after = float(response.headers.get('Retry-After', 1))
+                except (TypeError, ValueError):
+                    retry_after = 1.0
+                print(f"Spotify rate limit hit for '{song}', backing off {retry_after}s (retry {attempt + 1}/{SPOTIFY_MAX_RATE_LIMIT_RETRIES})")
+                _register_spotify_retry_after(retry_after)
+                continue
+
+            response.raise_for_status()
+            break
+
+        tracks_data = response.json()
+
+        # Get the first (best) result
+        if tracks_data['tracks']['items']:
+            track = tracks_data['tracks']['items'][0]
+            print(f"✓ Found: {track['name']} - {track['artists'][0]['name']}")
+            return {
+                'uri': track['uri'],
+                'name': track['name'],
+                'artist': track['artists'][0]['name'],
+                'popularity': track['popularity'],
+                'id': track['id'],
+                'album': track['album']['name'],
+                'album_image': track['album']['images'][0]['url'] if track['album']['images'] else None
+            }
+
+        print(f"✗ Not found: {song}")
+        return {}
+
+    except Exception as e:
+        print(f"Error searching for '{song}': {str(e)}")
+        return None
+
+
+def search_spotify_tracks(
+    parameters: Dict[str, Any],
+    access_token: str,
+    search_stats: Optional[Dict[str, Any]] = None,
+    market: str = SPOTIFY_MARKET,
+    deadline: Optional[Deadline] = None,
+    limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Searches for specific songs on Spotify based on AI suggestions, through
+    StreamingTrackResolver: cached songs skip Spotify, the rest are searched concurrently,
+    songs resolving to a track already found are dropped and, with limit, searching stops
+    once limit tracks are found. Results keep the order in which the AI suggested them.
+    If search_stats is given, cache counters are written to search_stats['track_cache'],
+    songs Spotify has no match for to search_stats['not_found_songs'] and songs whose search
+    failed or was given up at the deadline to search_stats['unresolved_songs'].
+    Returns track details including name, artist, and URI.
+    """
     songs = parameters.get('songs', [])
     
     if not songs:
         print("No songs suggested by AI")
+        if search_stats is not None:
+            search_stats.update({'track_cache': track_cache.new_cache_stats(), 'not_found_songs': [], 'unresolved_songs': []})
         return []
     
     print(f"Searching for {len(songs)} specific songs suggested by AI")
     
-    # Search for each specific song
-    search_url = 'https://api.spotify.com/v1/search'
-    found_tracks = []
-    
-    for song in songs:
-        try:
-            print(f"Searching for: {song}")
-            
-            # Search for the exact song
-            search_params = {
-                'q': song,
-                'type': 'track',
-                'limit': 1,  # Get only the best match
-                'market': 'US'
-            }
-            
-            response = requests.get(search_url, headers=headers, params=search_params, timeout=10)
-            response.raise_for_status()
-            tracks_data = response.json()
-            
-            # Get the first (best) result
-            if tracks_data['tracks']['items']:
-                track = tracks_data['tracks']['items'][0]
-                found_tracks.append({
-                    'uri': track['uri'],
-                    'name': track['name'],
-                    'artist': track['artists'][0]['name'],
-                    'popularity': track['popularity'],
-                    'id': track['id'],
-                    'album': track['album']['name'],
-                    'album_image': track['album']['images'][0]['url'] if track['album']['images'] else None
-                })
-                print(f"✓ Found: {track['name']} - {track['artists'][0]['name']}")
+    resolver = StreamingTrackResolver(access_token, market=market, target=limit, deadline=deadline)
+    try:
+        for song in songs:
+            resolver.submit(song)
+        return resolver.results(search_stats)
+    finally:
+        resolver.close()
+
+
+class StreamingTrackResolver:
+    """
+    Resolves songs on a bounded thread pool as they are submitted, e.g. while Bedrock
+    is still streaming the list. Each song goes through the track cache, then Spotify.
+    Duplicate songs (same normalized key) are resolved once and listed once; different
+    spellings that resolve to the same Spotify track are listed (and counted) once.
+    With a target, the first target tracks found are kept: later submissions are skipped,
+    queued searches are cancelled and tracks finishing after that are dropped.
+    With a deadline, results() stops waiting when it is reached and cancels what is left.
+    """
+
+    def __init__(
+        self,
+        access_token: str,
+        market: str = SPOTIFY_MARKET,
+        on_track: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+        market_provider: Optional[Callable[[], str]] = None,
+        target: Optional[int] = None,
+        deadline: Optional[Deadline] = None
+    ):
+        self.headers = {'Authorization': f'Bearer {access_token}'}
+        self.market = market
+        self.target = target
+        self.deadline = deadline
+        self.skipped = 0
+        self.cancelled = 0
+        self._market_provider = market_provider
+        self._accepted = set()  # positions of the tracks kept (the first target found)
+        self._accepted_uris = set()
+        self.duplicate_tracks = 0
+        self._stopped = False
+        self.deadline_reached = False
+        self._late_songs = []  # submitted after the deadline stopped the resolver
+        self.on_track = on_track
+        self.cache_stats = track_cache.new_cache_stats()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, SPOTIFY_SEARCH_CONCURRENCY))
+        self._submitted = []  # (song, future) in submission order
+        self._keys = set()
+        self._lock = threading.Lock()
+
+    def submit(self, song: str) -> None:
+        if not isinstance(song, str) or not song.strip():
+            return
+        with self._lock:
+            if self._market_provider is not None:
+                # Resolved lazily so the profile lookup can run alongside generation
+                provider, self._market_provider = self._market_provider, None
+                self.market = provider() or self.market
+            key = track_cache.normalize_song_key(song, self.market)
+            if key in self._keys:
+                return
+            self._keys.add(key)
+            if self._stopped:
+                self.skipped += 1
+                if self.deadline_reached:
+                    self._late_songs.append(song)
+                return
+            position = len(self._submitted)
+            future = self._executor.submit(self._resolve, song, key, position)
+            self._submitted.append((song, future))
+
+    def _resolve(self, song: str, key: str, position: int) -> Optional[Dict[str, Any]]:
+        """
+        Returns the track, {} when Spotify has no match, or None when the search failed.
+        """
+        stats = track_cache.new_cache_stats()
+        cached = track_cache.get_cached_tracks([song], self.market, stats)
+        if key in cached:
+            track = cached[key] or {}
+        else:
+            track = search_spotify_track(song, self.headers, self.market, self.deadline)
+            if track:
+                track_cache.put_cached_tracks({key: track}, stats)
+            elif track is not None:
+                track_cache.put_not_found([key], stats)
+        
+        with self._lock:
+            track_cache.merge_cache_stats(self.cache_stats, stats)
+            accepted = bool(track) and not self._stopped
+            if accepted and track.get('uri') in self._accepted_uris:
+                # Another spelling already produced this track
+                accepted = False
+                self.duplicate_tracks += 1
+            if accepted:
+                self._accepted.add(position)
+                self._accepted_uris.add(track.get('uri'))
+                if self.target is not None and len(self._accepted) >= self.target:
+                    self._stop()
+        
+        if accepted and self.on_track:
+            try:
+                self.on_track(position, dict(track))
+            except Exception as e:
+                print(f"on_track callback failed: {str(e)}")
+        return track
+
+    def _stop(self, reason: Optional[str] = None) -> None:
+        """
+        Target (or deadline) reached, called with the lock held: cancel searches that have not started.
+        """
+        self._stopped = True
+        for song, future in self._submitted:
+            if future.cancel():
+                self.cancelled += 1
+        print(f"{reason or f'Found {self.target} tracks'}, cancelled {self.cancelled} queued search(es)")
+
+    def results(self, search_stats: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Waits for every submitted song (until the deadline, if any) and returns found tracks
+        in submission order. Songs whose search failed, or that the deadline cut off, are
+        reported in search_stats['unresolved_songs'].
+        """
+        with self._lock:
+            submitted = list(self._submitted)
+        
+        found_tracks = []
+        not_found_songs = []
+        unresolved_songs = []
+        for position, (song, future) in enumerate(submitted):
+            if future.cancelled():
+                if self.deadline_reached:
+                    unresolved_songs.append(song)
+                continue
+            try:
+                track = future.result(timeout=self.deadline.remaining() if self.deadline is not None else None)
+            except FutureTimeoutError:
+                with self._lock:
+                    if not self._stopped:
+                        self.deadline_reached = True
+                        self._stop('Deadline reached')
+                print(f"Deadline reached before '{song}' resolved")
+                track = None
+            except Exception as e:
+                print(f"Error resolving '{song}': {str(e)}")
+                track = None
+            if track:
+                if position in self._accepted:
+                    found_tracks.append(dict(track))
+            elif track is not None:
+                not_found_songs.append(song)
             else:
-                print(f"✗ Not found: {song}")
-            
-        except Exception as e:
-            print(f"Error searching for '{song}': {str(e)}")
-            continue
-    
-    print(f"Successfully found {len(found_tracks)} out of {len(songs)} songs")
-    
-    return found_tracks
+                unresolved_songs.append(song)
+        with self._lock:
+            unresolved_songs += self._late_songs
+        
+        print(f"Successfully found {len(found_tracks)} out of {len(submitted)} songs (cache hits: {self.cache_stats['spotify_calls_saved']})")
+        if self.duplicate_tracks:
+            print(f"Dropped {self.duplicate_tracks} song(s) resolving to a track already in the playlist")
+        
+        if search_stats is not None:
+            search_stats['track_cache'] = self.cache_stats
+            search_stats['not_found_songs'] = not_found_songs
+            search_stats['unresolved_songs'] = unresolved_songs
+            search_stats['market'] = self.market
+        return found_tracks
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
 
 
 def create_spotify_playlist(
     user_id: str,
     playlist_name: str,
     track_uris: List[str],
-    access_token: str
+    access_token: str,
+    playlist_stats: Optional[Dict[str, Any]] = None,
+    deadline: Optional[Deadline] = None
 ) -> str:
     """
     Creates a new playlist on Spotify and adds the tracks.
     Requires the user's access token (with playlist-modify-public or playlist-modify-private scope).
+    If playlist_stats is given, it receives the playlist id, the final snapshot_id and add stats.
+    deadline caps HTTP timeouts and retry backoff.
     """
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json'
-    }
+    headers = spotify_user_headers(access_token)
     
     try:
-        # Get the Spotify user ID from the token
-        profile_url = 'https://api.spotify.com/v1/me'
-        profile_response = requests.get(profile_url, headers=headers, timeout=10)
-        profile_response.raise_for_status()
-        spotify_user_id = profile_response.json()['id']
-        
-        # Create playlist
-        create_url = f'https://api.spotify.com/v1/users/{spotify_user_id}/playlists'
-        create_data = {
-            'name': playlist_name,
-            'description': f'Created by AI DJ - {datetime.utcnow().strftime("%Y-%m-%d %H:%M")} UTC',
-            'public': True
-        }
-        
-        create_response = requests.post(create_url, headers=headers, json=create_data, timeout=10)
-        create_response.raise_for_status()
-        playlist_id = create_response.json()['id']
-        playlist_url = create_response.json()['external_urls']['spotify']
+        profile = get_spotify_profile(access_token, deadline=deadline)
+        playlist = create_empty_playlist(playlist_name, headers, profile['id'], deadline)
         
         # Add tracks to the playlist
-        if track_uris:
-            add_tracks_url = f'https://api.spotify.com/v1/playlists/{playlist_id}/tracks'
-            add_tracks_data = {
-                'uris': track_uris
-            }
-            
-            add_response = requests.post(add_tracks_url, headers=headers, json=add_tracks_data, timeout=10)
-            add_response.raise_for_status()
+        add_stats = {}
+        snapshot_id = add_tracks_to_playlist(playlist['id'], track_uris, headers, add_stats, deadline)
+        
+        if playlist_stats is not None:
+            playlist_stats.update({'playlist_id': playlist['id'], 'snapshot_id': snapshot_id, **add_stats})
         
-        return playlist_url
+        return playlist['url']
         
     except Exception as e:
         print(f"Error creating Spotify playlist: {str(e)}")
         raise
 
 
+def spotify_playlist_breaker() -> circuit_breaker.CircuitBreaker:
+    return circuit_breaker.get_breaker(SPOTIFY_PLAYLIST_BREAKER, SPOTIFY_WRITE_SLOW_CALL_SECONDS)
+
+
+def spotify_playlist_request(method: str, url: str, headers: Dict[str, str], deadline: Optional[Deadline] = None, **kwargs: Any):
+    """
+    Playlist write (create, rename, add, unfollow) through the playlist-write circuit breaker.
+    Raises CircuitOpenError without calling Spotify while it is open; 429 and 5xx count as failures.
+    """
+    breaker = spotify_playlist_breaker()
+    breaker.check()
+    started_at = time.time()
+    try:
+        response = http_session.request(method, url, headers=headers, timeout=_spotify_timeout(deadline), **kwargs)
+    except Exception:
+        breaker.record(False, time.time() - started_at)
+        raise
+    breaker.record(response.status_code != 429 and response.status_code < 500, time.time() - started_at)
+    return response
+
+
+def spotify_user_headers(access_token: str) -> Dict[str, str]:
+    return {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+
+
+def get_spotify_profile(access_token: str, token_expires_at: Any = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """
+    Returns {'id', 'display_name', 'country'} for the token's user. Uses the profile cache
+    (memory, then DynamoDB) and only calls /me on a miss. token_expires_at (epoch seconds,
+    optional) bounds how long the result is cached.
+    """
+    try:
+        token_expires_at = int(token_expires_at) if token_expires_at else None
+    except (TypeError, ValueError):
+        token_expires_at = None
+    
+    key = profile_cache.build_cache_key(access_token)
+    cached = profile_cache.get_cached_profile(key)
+    if cached:
+        print(f"⚡ Spotify profile cache hit ({cached['tier']})")
+        return cached['profile']
+    
+    profile_response = http_session.get(
+        'https://api.spotify.com/v1/me', headers=spotify_user_headers(access_token), timeout=_spotify_timeout(deadline)
+    )
+    profile_response.raise_for_status()
+    profile = profile_response.json()
+    profile_cache.put_cached_profile(key, profile, token_expires_at)
+    return {field: profile.get(field) for field in profile_cache.PROFILE_FIELDS}
+
+
+def create_empty_playlist(
+    playlist_name: str,
+    headers: Dict[str, str],
+    spotify_user_id: str,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, str]:
+    """
+    Creates an empty playlist for the given Spotify user. Returns {'id', 'url'}.
+    """
+    # Create playlist
+    create_url = f'https://api.spotify.com/v1/users/{spotify_user_id}/playlists'
+    create_data = {
+        'name': playlist_name,
+        'description': f'Created by AI DJ - {datetime.utcnow().strftime("%Y-%m-%d %H:%M")} UTC',
+        'public': True
+    }
+    
+    create_response = spotify_playlist_request('POST', create_url, headers, deadline, json=create_data)
+    create_response.raise_for_status()
+    created = create_response.json()
+    return {'id': created['id'], 'url': created['external_urls']['spotify']}
+
+
+class PendingPlaylist:
+    """
+    Creates an empty Spotify playlist in the background so the /me and create round trips
+    overlap with song generation and search. finalize() renames it to the generated name
+    and adds the tracks; discard() removes it again when nothing could be added.
+    market() returns the user's country once the profile is known, for Spotify searches.
+    deadline (optional) caps every Spotify call and wait made on behalf of the playlist.
+    """
+
+    def __init__(self, playlist_name: str, access_token: str, token_expires_at: Any = None, deadline: Optional[Deadline] = None):
+        self.playlist_name = playlist_name
+        self.headers = spotify_user_headers(access_token)
+        self.deadline = deadline
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        self._profile = self._executor.submit(get_spotify_profile, access_token, token_expires_at, deadline)
+        self._creation = self._executor.submit(self._create)
+        self._finalized = False
+
+    def _create(self) -> Dict[str, str]:
+        return create_empty_playlist(self.playlist_name, self.headers, self._profile.result()['id'], self.deadline)
+
+    def _wait_timeout(self) -> Optional[float]:
+        return max(MIN_HTTP_TIMEOUT_SECONDS, self.deadline.remaining()) if self.deadline is not None else None
+
+    def market(self) -> str:
+        try:
+            country = self._profile.result(timeout=SPOTIFY_PROFILE_MARKET_TIMEOUT).get('country')
+        except Exception as e:
+            print(f"Spotify profile not available for market selection: {str(e)}")
+            country = None
+        return country or SPOTIFY_MARKET
+
+    def finalize(
+        self,
+        playlist_name: str,
+        track_uris: List[str],
+        playlist_stats: Optional[Dict[str, Any]] = None
+    ) -> str:
+        try:
+            playlist = self._creation.result(timeout=self._wait_timeout())
+        except Exception as e:
+            print(f"Error creating Spotify playlist: {str(e) or type(e).__name__}")
+            raise
+        
+        # Rename in parallel with the track add (the name is only known after generation)
+        rename = None
+        if playlist_name != self.playlist_name:
+            rename = self._executor.submit(rename_playlist, playlist['id'], playlist_name, self.headers, self.deadline)
+        
+        add_stats = {}
+        snapshot_id = add_tracks_to_playlist(playlist['id'], track_uris, self.headers, add_stats, self.deadline)
+        self._finalized = True
+        
+        if rename is not None:
+            try:
+                rename.result(timeout=self._wait_timeout())
+            except Exception as e:
+                print(f"Error renaming playlist {playlist['id']}: {str(e)}")
+        
+        if playlist_stats is not None:
+            playlist_stats.update({'playlist_id': playlist['id'], 'snapshot_id': snapshot_id, **add_stats})
+        return playlist['url']
+
+    def discard(self) -> None:
+        if self._finalized:
+            return
+        try:
+            playlist = self._creation.result(timeout=self._wait_timeout())
+        except Exception:
+            return
+        try:
+            # Spotify has no playlist delete; unfollowing removes it from the owner's library
+            response = spotify_playlist_request(
+                'DELETE', f"https://api.spotify.com/v1/playlists/{playlist['id']}/followers", self.headers, self.deadline
+            )
+            response.raise_for_status()
+            print(f"Removed empty playlist {playlist['id']}")
+        except Exception as e:
+            print(f"Error removing empty playlist {playlist['id']}: {str(e)}")
+        self._finalized = True
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+def rename_playlist(playlist_id: str, playlist_name: str, headers: Dict[str, str], deadline: Optional[Deadline] = None) -> None:
+    response = spotify_playlist_request(
+        'PUT', f'https://api.spotify.com/v1/playlists/{playlist_id}', headers, deadline, json={'name': playlist_name}
+    )
+    response.raise_for_status()
+
+
+def add_tracks_to_playlist(
+    playlist_id: str,
+    track_uris: List[str],
+    headers: Dict[str, str],
+    add_stats: Optional[Dict[str, Any]] = None,
+    deadline: Optional[Deadline] = None
+) -> Optional[str]:
+    """
+    Adds track_uris to an empty playlist in 100-URI chunks, in order, and returns the final
+    snapshot_id. A chunk is resent only when the add clearly did not happen (429, connect
+    timeout); after other failures (read timeout, dropped connection, 5xx) the playlist
+    length is checked first, so a chunk Spotify already stored is never inserted twice.
+    Retries use exponential backoff while the deadline allows.
+    """
+    chunks = [
+        track_uris[offset:offset + SPOTIFY_PLAYLIST_CHUNK_SIZE]
+        for offset in range(0, len(track_uris), SPOTIFY_PLAYLIST_CHUNK_SIZE)
+    ]
+    if add_stats is not None:
+        add_stats.update({'add_chunks': len(chunks), 'add_retries': 0})
+    if not chunks:
+        return None
+    
+    add_tracks_url = f'https://api.spotify.com/v1/playlists/{playlist_id}/tracks'
+    snapshot_id = None
+    for index, chunk in enumerate(chunks):
+        position = index * SPOTIFY_PLAYLIST_CHUNK_SIZE
+        retries = 0
+        while True:
+            if not _wait_for_spotify_rate_limit(deadline):
+                raise Exception(f"Chunk {index} not sent: Spotify rate limit outlasts the deadline")
+            response = None
+            try:
+                response = spotify_playlist_request('POST', add_tracks_url, headers, deadline, json={
+                    'uris': chunk,
+                    'position': position
+                })
+                response.raise_for_status()
+                snapshot_id = response.json().get('snapshot_id')
+                break
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                if response is not None and response.status_code < 500 and response.status_code != 429:
+                    raise
+                if retries >= SPOTIFY_PLAYLIST_ADD_MAX_RETRIES:
+                    raise
+                backoff = 2 ** retries
+                if response is not None and response.status_code == 429:
+                    try:
+                        backoff = float(response.headers.get('Retry-After', 1))
+                    except (TypeError, ValueError):
+                        backoff = 1.0
+                if deadline is not None and not deadline.can_sleep(backoff, SPOTIFY_MIN_CALL_SECONDS):
+                    raise
+                retries += 1
+                if add_stats is not None:
+                    add_stats['add_retries'] += 1
+                if response is not None and response.status_code == 429:
+                    _register_spotify_retry_after(backoff)
+                else:
+                    if not isinstance(e, ConnectTimeout):
+                        # The add may have been stored before the error: check before resending
+                        landed = chunk_landed(add_tracks_url, headers, position, len(chunk), deadline)
+                        if landed is not None:
+                            print(f"Playlist chunk {index} was added despite the error: {str(e)}")
+                            snapshot_id = landed
+                            break
+                    time.sleep(backoff)
+                print(f"Retrying playlist chunk {index} ({retries}/{SPOTIFY_PLAYLIST_ADD_MAX_RETRIES}): {str(e)}")
+    
+    # Each add returns a new snapshot; the last one reflects the full playlist
+    print(f"Added {len(track_uris)} tracks to playlist {playlist_id} in {len(chunks)} chunk(s)")
+    return snapshot_id
+
+
+def chunk_landed(
+    add_tracks_url: str,
+    headers: Dict[str, str],
+    position: int,
+    size: int,
+    deadline: Optional[Deadline] = None
+) -> Optional[str]:
+    """
+    After an add of size tracks at position whose outcome is unknown: the playlist's
+    snapshot_id if the tracks are there (the add was stored), None if the playlist still
+    ends at position (safe to resend). Raises when the length cannot be read or matches
+    neither, so a chunk is never added twice.
+    """
+    response = spotify_playlist_request('GET', add_tracks_url, headers, deadline, params={'fields': 'total', 'limit': 1})
+    response.raise_for_status()
+    total = response.json().get('total', 0)
+    if total == position:
+        return None
+    if total != position + size:
+        raise Exception(f"Playlist has {total} tracks after an uncertain add at {position}; not resending")
+    playlist = spotify_playlist_request(
+        'GET', add_tracks_url.rsplit('/', 1)[0], headers, deadline, params={'fields': 'snapshot_id'}
+    )
+    playlist.raise_for_status()
+    return playlist.json().get('snapshot_id')
+
+
 def save_playlist_to_dynamodb(
     user_id: str,
     playlist_url: str,
     prompt: str,
-    parameters: Dict[str, Any]
+    parameters: Dict[str, Any],
+    analytics: Optional[Dict[str, Any]] = None,
+    tracks_count: Optional[int] = None
 ) -> None:
     """
-    Saves the playlist information to DynamoDB.
+    Saves the playlist information to DynamoDB (one history item per playlist), plus an
+    optional analytics event. Writes go through the write-behind queue so the response
+    does not wait for DynamoDB.
     """
     try:
-        timestamp = datetime.utcnow().isoformat()
-        
-        # Get existing playlists for the user
-        response = table.get_item(Key={'user_id': user_id})
-        
-        if 'Item' in response:
-            # User exists, add new playlist
-            playlists = response['Item'].get('playlists', [])
-        else:
-            # New user
-            playlists = []
-        
-        # Add new playlist
-        playlists.append({
-            'playlist_url': playlist_url,
-            'prompt': prompt,
-            'parameters': parameters,
-            'created_at': timestamp
-        })
-        
-        # Save to DynamoDB
-        table.put_item(
-            Item={
-                'user_id': user_id,
-                'playlists': playlists,
-                'last_updated': timestamp
-            }
-        )
-        
-        print(f"Saved playlist to DynamoDB for user {user_id}")
+        items = [playlist_history.build_playlist_item(user_id, playlist_url, prompt, parameters, tracks_count)]
+        if analytics is not None:
+            items.append(write_behind.analytics_event('playlist_created', {'user_id': user_id, **analytics}))
+        write_behind.put_items(items)
+        print(f"Queued playlist history for user {user_id}")
         
     except Exception as e:
         print(f"Error saving to DynamoDB: {str(e)}")
         # Do not raise exception, the playlist has already been created
 
 
+def playlist_analytics(
+    source: str,
+    tracks: List[Dict[str, Any]],
+    music_parameters: Dict[str, Any],
+    generation_stats: Dict[str, Any],
+    search_stats: Dict[str, Any],
+    **extra: Any
+) -> Dict[str, Any]:
+    """
+    Summary of one playlist creation for the analytics event.
+    """
+    songs = music_parameters.get('songs', []) if isinstance(music_parameters, dict) else []
+    prompt_cache_info = generation_stats.get('prompt_cache') or {}
+    return {
+        'source': source,
+        'model_id': model_used(generation_stats),
+        'model_tier': (generation_stats.get('model_route') or {}).get('tier'),
+        'songs_suggested': len(songs),
+        'tracks_count': len(tracks),
+        'not_found_count': len(search_stats.get('not_found_songs', [])),
+        'prompt_cache_hit': bool(prompt_cache_info.get('hit')),
+        'track_cache': search_stats.get('track_cache'),
+        'fill_rate': (search_stats.get('fill') or {}).get('fill_rate'),
+        'partial': bool(search_stats.get('partial')),
+        'single_flight_role': (generation_stats.get('single_flight') or {}).get('role'),
+        'song_list_salvaged': bool(generation_stats.get('salvage')),
+        **extra
+    }
+
+
 def create_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
     """
     Creates a formatted HTTP response for API Gateway.
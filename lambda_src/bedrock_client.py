@@ -0,0 +1,52 @@
+"""
+Bedrock runtime clients bounded by the request deadline
+botocore's timeouts are fixed per client, so a call started with a few seconds left would
+still be given the full BEDROCK_READ_TIMEOUT to answer and could run past the API Gateway
+limit. runtime(deadline) returns a client whose connect/read timeouts fit in the time that
+is left. Clients are cached per whole second of timeout, so a warm container builds only a few.
+"""
+
+import math
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import boto3
+from botocore.config import Config
+
+from time_budget import Deadline
+
+# Environment Variables
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+BEDROCK_READ_TIMEOUT = int(os.environ.get('BEDROCK_READ_TIMEOUT', '60'))
+BEDROCK_CONNECT_TIMEOUT = 5
+
+_clients: Dict[int, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def runtime(deadline: Optional[Deadline] = None) -> Any:
+    """
+    bedrock-runtime client for a call that must finish before deadline (BEDROCK_READ_TIMEOUT
+    without one). botocore's own retries are disabled: callers retry within the deadline.
+    """
+    read_timeout = BEDROCK_READ_TIMEOUT
+    if deadline is not None:
+        read_timeout = min(read_timeout, max(1, math.ceil(deadline.remaining())))
+    with _clients_lock:
+        client = _clients.get(read_timeout)
+        if client is None:
+            client = _clients[read_timeout] = _build(read_timeout)
+    return client
+
+
+def _build(read_timeout: int) -> Any:
+    return boto3.client(
+        'bedrock-runtime',
+        region_name=AWS_REGION,
+        config=Config(
+            connect_timeout=min(BEDROCK_CONNECT_TIMEOUT, read_timeout),
+            read_timeout=read_timeout,
+            retries={'max_attempts': 1, 'mode': 'standard'}
+        )
+    )
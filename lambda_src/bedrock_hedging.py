@@ -0,0 +1,172 @@
+"""
+Hedged Bedrock requests
+A call that has not answered within the hedge delay gets a second, identical call (to
+BEDROCK_HEDGE_MODEL_ID when set, e.g. another region's inference profile). Whichever
+answers first wins; the loser is abandoned. "Answering" means the full response for
+invoke_model and the first text delta for streams, so a hedged stream never mixes text
+from both calls. The delay is the BEDROCK_HEDGE_PERCENTILE of recent answer times in this
+container for the same model and call kind (BEDROCK_HEDGE_DELAY_SECONDS until enough such
+calls were seen), so only the slow tail is hedged: a full generation is never compared
+with a short helper call or a stream's time to first text. Hedge rate, wins and the tokens spent by abandoned calls are counted per container.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from time_budget import Deadline
+
+# Environment Variables
+BEDROCK_HEDGE_ENABLED = os.environ.get('BEDROCK_HEDGE_ENABLED', 'false').lower() == 'true'
+BEDROCK_HEDGE_MODEL_ID = os.environ.get('BEDROCK_HEDGE_MODEL_ID', '')
+BEDROCK_HEDGE_PERCENTILE = float(os.environ.get('BEDROCK_HEDGE_PERCENTILE', '95'))
+BEDROCK_HEDGE_DELAY_SECONDS = float(os.environ.get('BEDROCK_HEDGE_DELAY_SECONDS', '4'))
+BEDROCK_HEDGE_MIN_DELAY_SECONDS = float(os.environ.get('BEDROCK_HEDGE_MIN_DELAY_SECONDS', '1'))
+# Not worth a second call unless it has at least this long to answer
+BEDROCK_HEDGE_MIN_REMAINING_SECONDS = float(os.environ.get('BEDROCK_HEDGE_MIN_REMAINING_SECONDS', '5'))
+
+# Answer-time samples kept per (model, call kind), and how many are needed before the percentile is trusted
+LATENCY_SAMPLES = 200
+MIN_LATENCY_SAMPLES = 20
+
+PRIMARY = 'primary'
+HEDGE = 'hedge'
+
+# Abandoned calls keep running in the background until Bedrock answers
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='bedrock-hedge')
+_latencies: Dict[Tuple[str, str], deque] = {}
+_stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0, 'abandoned_input_tokens': 0, 'abandoned_output_tokens': 0}
+_lock = threading.Lock()
+
+
+class _Race:
+    """
+    Decides the winner between the primary and the hedge: the first attempt to claim().
+    """
+
+    def __init__(self):
+        self.winner: Optional[str] = None
+        self.started_at = time.time()
+        self.answered_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def claimer(self, attempt: str) -> Callable[[], bool]:
+        def claim() -> bool:
+            with self._lock:
+                if self.winner is None:
+                    self.winner = attempt
+                    self.answered_at = time.time()
+                return self.winner == attempt
+        return claim
+
+
+def hedge_delay(model_id: str, kind: str) -> float:
+    """
+    Seconds to wait for the primary call of this kind before hedging it.
+    """
+    with _lock:
+        samples = sorted(_latencies.get((model_id, kind), ()))
+    if len(samples) < MIN_LATENCY_SAMPLES:
+        return BEDROCK_HEDGE_DELAY_SECONDS
+    index = min(len(samples) - 1, int(len(samples) * BEDROCK_HEDGE_PERCENTILE / 100))
+    return max(BEDROCK_HEDGE_MIN_DELAY_SECONDS, samples[index])
+
+
+def hedge_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+    stats['hedge_rate'] = round(stats['hedged'] / stats['calls'], 3) if stats['calls'] else 0.0
+    return stats
+
+
+def call(
+    model_id: str,
+    attempt: Callable[[str, Callable[[], bool]], Dict[str, Any]],
+    deadline: Optional[Deadline] = None,
+    can_hedge: Optional[Callable[[str], bool]] = None,
+    kind: str = 'invoke'
+) -> Dict[str, Any]:
+    """
+    Runs attempt(target_model_id, claim) and hedges it when it is slow for its kind
+    (the caller's name for calls of a similar size and shape, e.g. 'interpret (stream)'). The attempt must call
+    claim() when it has its answer (and, for streams, before passing any text on); if claim()
+    returns False another attempt already won, so it should stop and return what it has.
+    Attempts return the Anthropic response body (its 'usage' is counted for losers).
+    can_hedge(target_model_id) can veto the hedge (e.g. an open circuit breaker).
+    Errors of the primary raised before a hedge was sent propagate unchanged.
+    """
+    if not BEDROCK_HEDGE_ENABLED:
+        return attempt(model_id, lambda: True)
+
+    hedge_model_id = BEDROCK_HEDGE_MODEL_ID or model_id
+    race = _Race()
+    delay = hedge_delay(model_id, kind)
+    primary = _executor.submit(attempt, model_id, race.claimer(PRIMARY))
+    futures = {primary: PRIMARY}
+
+    done, _ = wait([primary], timeout=delay)
+    hedged = False
+    if not done and race.winner is None and _hedge_allowed(hedge_model_id, deadline, can_hedge):
+        print(f"Bedrock call to {model_id} slower than {delay:.1f}s, hedging to {hedge_model_id}")
+        futures[_executor.submit(attempt, hedge_model_id, race.claimer(HEDGE))] = HEDGE
+        hedged = True
+
+    pending = set(futures)
+    errors = {}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = futures[future]
+            if race.winner == name:
+                _record((model_id, kind), race, hedged)
+                for loser in pending:
+                    loser.add_done_callback(_count_abandoned)
+                return future.result()
+            if future.exception() is not None:
+                errors[name] = future.exception()
+
+    # Nobody claimed: every attempt failed before answering
+    _record((model_id, kind), race, hedged)
+    raise errors.get(PRIMARY) or errors[HEDGE]
+
+
+def _hedge_allowed(
+    hedge_model_id: str,
+    deadline: Optional[Deadline],
+    can_hedge: Optional[Callable[[str], bool]]
+) -> bool:
+    if deadline is not None and not deadline.has(BEDROCK_HEDGE_MIN_REMAINING_SECONDS):
+        return False
+    return can_hedge is None or can_hedge(hedge_model_id)
+
+
+def _record(key: Tuple[str, str], race: _Race, hedged: bool) -> None:
+    answered_in = (race.answered_at or time.time()) - race.started_at
+    with _lock:
+        _stats['calls'] += 1
+        if race.answered_at is not None:
+            _latencies.setdefault(key, deque(maxlen=LATENCY_SAMPLES)).append(answered_in)
+        if hedged:
+            _stats['hedged'] += 1
+            if race.winner == HEDGE:
+                _stats['hedge_wins'] += 1
+    if hedged:
+        stats = hedge_stats()
+        print(f"Bedrock hedge ({key[1]}): {race.winner or 'no'} answer after {answered_in:.1f}s "
+              f"(hedge rate {stats['hedge_rate']:.1%}, {stats['hedge_wins']}/{stats['hedged']} hedge wins, "
+              f"abandoned calls used {stats['abandoned_input_tokens']} input / {stats['abandoned_output_tokens']} output tokens)")
+
+
+def _count_abandoned(future) -> None:
+    """
+    Adds the tokens of an abandoned call, once it finishes, to the hedge cost counters.
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    usage = (future.result() or {}).get('usage') or {}
+    with _lock:
+        _stats['abandoned_input_tokens'] += int(usage.get('input_tokens', 0))
+        _stats['abandoned_output_tokens'] += int(usage.get('output_tokens', 0))
@@ -0,0 +1,92 @@
+"""
+Bedrock prompt caching for the large static system prompts
+(not to be confused with prompt_cache, which stores generated song lists)
+Callers put everything that never changes between requests into the system prompt; the
+per-request text (the user's prompt, exclusions, request id) goes in the user message.
+Right before a call, with_cache_point marks the end of the system prompt as a cache checkpoint
+(cache_control) when it is long enough for the target Anthropic model to cache: shorter
+prefixes are not cached by Bedrock, so they are sent as plain prompts. Cache read/write token
+counts from each response's usage are logged and counted per container.
+"""
+
+import os
+import threading
+from typing import Any, Dict
+
+# Environment Variables
+BEDROCK_PROMPT_CACHING_ENABLED = os.environ.get('BEDROCK_PROMPT_CACHING_ENABLED', 'true').lower() == 'true'
+
+# Minimum cacheable prefix per Anthropic model, in tokens (first matching model id fragment wins)
+MIN_CACHEABLE_TOKENS = (
+    ('claude-haiku-4-5', 4096),
+    ('claude-opus-4-5', 4096),
+    ('claude-3-5-haiku', 2048),
+    ('claude-3-haiku', 2048),
+    ('anthropic.', 1024)
+)
+# Rough size of a token in English text, used to estimate a prompt's length
+CHARS_PER_TOKEN = 4
+
+_stats = {'calls': 0, 'input_tokens': 0, 'cache_read_input_tokens': 0, 'cache_write_input_tokens': 0}
+_lock = threading.Lock()
+
+
+def min_cacheable_tokens(model_id: str) -> int:
+    """
+    Shortest prefix model_id caches, or 0 for models without Anthropic prompt caching.
+    """
+    for fragment, tokens in MIN_CACHEABLE_TOKENS:
+        if fragment in model_id:
+            return tokens
+    return 0
+
+
+def with_cache_point(payload: Dict[str, Any], model_id: str) -> Dict[str, Any]:
+    """
+    Anthropic Messages payload with a cache checkpoint at the end of its "system" prompt, if that
+    prompt is long enough for model_id to cache. Otherwise the payload is returned unchanged.
+    """
+    system = payload.get('system')
+    if not BEDROCK_PROMPT_CACHING_ENABLED or not isinstance(system, str):
+        return payload
+    min_tokens = min_cacheable_tokens(model_id)
+    if not min_tokens or len(system) // CHARS_PER_TOKEN < min_tokens:
+        return payload
+    return {**payload, 'system': [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]}
+
+
+def cache_usage(response_body: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Input and cache token counts of a response, for Anthropic and Nova usage formats.
+    """
+    usage = response_body.get('usage') or {}
+    return {
+        'input_tokens': int(usage.get('input_tokens', usage.get('inputTokens', 0)) or 0),
+        'cache_read_input_tokens': int(usage.get('cache_read_input_tokens', usage.get('cacheReadInputTokenCount', 0)) or 0),
+        'cache_write_input_tokens': int(usage.get('cache_creation_input_tokens', usage.get('cacheWriteInputTokenCount', 0)) or 0)
+    }
+
+
+def record_usage(source: str, response_body: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Logs and counts the cache usage of one response; returns it.
+    """
+    usage = cache_usage(response_body)
+    with _lock:
+        _stats['calls'] += 1
+        for key, value in usage.items():
+            _stats[key] += value
+    print(f"[{source}] Bedrock prompt cache: read {usage['cache_read_input_tokens']}, "
+          f"write {usage['cache_write_input_tokens']}, uncached input {usage['input_tokens']} tokens")
+    return usage
+
+
+def usage_stats() -> Dict[str, Any]:
+    """
+    Container totals; cache_hit_ratio is the share of prompt tokens served from the cache.
+    """
+    with _lock:
+        stats = dict(_stats)
+    prompt_tokens = stats['input_tokens'] + stats['cache_read_input_tokens'] + stats['cache_write_input_tokens']
+    stats['cache_hit_ratio'] = round(stats['cache_read_input_tokens'] / prompt_tokens, 3) if prompt_tokens else 0.0
+    return stats
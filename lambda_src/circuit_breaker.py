@@ -0,0 +1,333 @@
+"""
+Circuit breakers for external dependencies (Bedrock models, Spotify search, Spotify playlist writes)
+Each breaker watches the calls of the last CIRCUIT_BREAKER_WINDOW_SECONDS in the warm container
+and opens when too many of them fail or are slow. While open, calls are rejected immediately
+(CircuitOpenError) so callers fail fast or degrade instead of sitting through retries. After
+the open period a single half-open probe is let through; its outcome closes or reopens the breaker.
+Open/closed transitions are shared between containers through "breaker#<name>" items in the
+cache table (refreshed in the background, never on the request path), and the half-open
+probe is claimed there (and released when it reports) so only one container probes at a time.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# AWS Client Configuration
+# Breaker bookkeeping must never hold up the calls it protects: short timeouts, no SDK retries
+dynamodb = boto3.resource('dynamodb', config=Config(connect_timeout=1, read_timeout=1, retries={'max_attempts': 1}))
+
+# Environment Variables
+CACHE_TABLE_NAME = os.environ.get('CACHE_TABLE_NAME') or os.environ.get('DYNAMODB_TABLE_NAME')
+CIRCUIT_BREAKER_ENABLED = os.environ.get('CIRCUIT_BREAKER_ENABLED', 'true').lower() == 'true'
+CIRCUIT_BREAKER_WINDOW_SECONDS = float(os.environ.get('CIRCUIT_BREAKER_WINDOW_SECONDS', '30'))
+CIRCUIT_BREAKER_MIN_CALLS = int(os.environ.get('CIRCUIT_BREAKER_MIN_CALLS', '10'))
+CIRCUIT_BREAKER_FAILURE_RATE = float(os.environ.get('CIRCUIT_BREAKER_FAILURE_RATE', '0.5'))
+CIRCUIT_BREAKER_SLOW_CALL_RATE = float(os.environ.get('CIRCUIT_BREAKER_SLOW_CALL_RATE', '0.8'))
+CIRCUIT_BREAKER_OPEN_SECONDS = float(os.environ.get('CIRCUIT_BREAKER_OPEN_SECONDS', '20'))
+# How often a container re-reads the shared state of a breaker
+CIRCUIT_BREAKER_SYNC_SECONDS = float(os.environ.get('CIRCUIT_BREAKER_SYNC_SECONDS', '2'))
+
+# A claimed half-open probe that never reports back is given up after this long
+PROBE_LEASE_SECONDS = 30
+# Shared items outlive the open period a little, then expire via TTL
+SHARED_STATE_TTL_SECONDS = 3600
+
+# Bedrock error codes that count as failures; anything else (validation, access) is a caller problem
+BEDROCK_FAILURE_CODES = {
+    'ThrottlingException', 'ServiceUnavailableException', 'ModelTimeoutException',
+    'InternalServerException', 'ModelNotReadyException', 'ModelStreamErrorException'
+}
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# DynamoDB Table (cache table; breaker items use a "breaker#" key prefix)
+table = dynamodb.Table(CACHE_TABLE_NAME)
+
+_breakers: Dict[str, 'CircuitBreaker'] = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency whose breaker is open.
+    """
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit breaker '{name}' is open, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Failure-rate and slow-call-rate breaker over a sliding time window.
+    Callers ask allow() (or check()) before a call and report it with record().
+    """
+
+    def __init__(self, name: str, slow_call_seconds: float):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self._calls = deque()  # (timestamp, failed, slow)
+        self._state = STATE_CLOSED
+        self._open_until = 0.0
+        self._changed_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+        self._probe_claiming = False
+        self._probe_lease_ms = None  # probe_until_ms of our shared claim, released when the probe reports
+        self._synced_at = 0.0
+        self._syncing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def retry_after(self) -> float:
+        return max(0.0, self._open_until - time.time())
+
+    def allow(self) -> bool:
+        """
+        True if a call may go ahead. In half-open state only the single probe call is allowed.
+        """
+        if not CIRCUIT_BREAKER_ENABLED:
+            return True
+        self._sync_shared()
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_HALF_OPEN:
+                return self._start_probe()
+            if time.time() < self._open_until or self._probe_claiming:
+                return False
+            # One thread per container claims; the DynamoDB call runs without the lock
+            self._probe_claiming = True
+        
+        lease_ms = self._claim_probe()
+        with self._lock:
+            self._probe_claiming = False
+            if lease_ms is None:
+                return False
+            if self._state == STATE_OPEN:
+                self._set_state(STATE_HALF_OPEN)
+                self._probe_lease_ms = lease_ms or None
+                return self._start_probe()
+            closed = self._state == STATE_CLOSED
+        # Another container closed the breaker while we were claiming; give the claim back
+        if lease_ms:
+            threading.Thread(target=self._release_probe, args=(lease_ms,), daemon=True).start()
+        return closed
+
+    def _start_probe(self) -> bool:
+        """
+        Lets the half-open probe call through unless one is already out (called with the lock held).
+        """
+        if self._probe_in_flight and time.time() - self._probe_started_at < PROBE_LEASE_SECONDS:
+            return False
+        self._probe_in_flight = True
+        self._probe_started_at = time.time()
+        return True
+
+    def is_open(self) -> bool:
+        """
+        True while calls are being rejected and no probe is due yet. Unlike allow(),
+        this never claims the half-open probe, so it is safe for up-front checks.
+        """
+        if not CIRCUIT_BREAKER_ENABLED:
+            return False
+        self._sync_shared()
+        return self._state == STATE_OPEN and time.time() < self._open_until
+
+    def check(self) -> None:
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def record(self, success: bool, duration: Optional[float] = None) -> None:
+        """
+        Reports the outcome of an allowed call. Slow successes count against the slow-call rate.
+        """
+        if not CIRCUIT_BREAKER_ENABLED:
+            return
+        slow = duration is not None and duration > self.slow_call_seconds
+        now = time.time()
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._probe_in_flight = False
+                lease_ms, self._probe_lease_ms = self._probe_lease_ms, None
+                if lease_ms:
+                    threading.Thread(target=self._release_probe, args=(lease_ms,), daemon=True).start()
+                if success and not slow:
+                    print(f"Circuit breaker '{self.name}' closed after a successful probe")
+                    self._set_state(STATE_CLOSED)
+                else:
+                    self._trip(now, 'probe failed' if not success else f'probe took {duration:.1f}s')
+                return
+            if self._state == STATE_OPEN:
+                # Late result of a call that started before the breaker opened
+                return
+
+            self._calls.append((now, not success, slow))
+            while self._calls and self._calls[0][0] < now - CIRCUIT_BREAKER_WINDOW_SECONDS:
+                self._calls.popleft()
+            if len(self._calls) < CIRCUIT_BREAKER_MIN_CALLS:
+                return
+            failure_rate = sum(1 for call in self._calls if call[1]) / len(self._calls)
+            slow_rate = sum(1 for call in self._calls if call[2]) / len(self._calls)
+            if failure_rate >= CIRCUIT_BREAKER_FAILURE_RATE:
+                self._trip(now, f'{failure_rate:.0%} of {len(self._calls)} calls failed')
+            elif slow_rate >= CIRCUIT_BREAKER_SLOW_CALL_RATE:
+                self._trip(now, f'{slow_rate:.0%} of {len(self._calls)} calls slower than {self.slow_call_seconds}s')
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self._state,
+                'calls_in_window': len(self._calls),
+                'retry_after': round(self.retry_after(), 1) if self._state == STATE_OPEN else 0
+            }
+
+    def _trip(self, now: float, reason: str) -> None:
+        """
+        Opens the breaker (called with the lock held) and shares the new state.
+        """
+        print(f"Circuit breaker '{self.name}' opened for {CIRCUIT_BREAKER_OPEN_SECONDS:.0f}s: {reason}")
+        self._open_until = now + CIRCUIT_BREAKER_OPEN_SECONDS
+        self._set_state(STATE_OPEN, reason)
+
+    def _set_state(self, state: str, reason: Optional[str] = None) -> None:
+        self._state = state
+        self._changed_at = time.time()
+        self._calls.clear()
+        self._probe_in_flight = False
+        if state != STATE_HALF_OPEN:
+            # Timestamps are stored as integer milliseconds (DynamoDB numbers)
+            item = {
+                **self._shared_key(),
+                'state': state,
+                'open_until_ms': _ms(self._open_until),
+                'reason': reason,
+                'updated_at_ms': _ms(self._changed_at),
+                'expires_at': int(time.time() + CIRCUIT_BREAKER_OPEN_SECONDS) + SHARED_STATE_TTL_SECONDS
+            }
+            threading.Thread(target=self._publish, args=(item,), daemon=True).start()
+
+    def _shared_key(self) -> Dict[str, str]:
+        return {'user_id': f"breaker#{self.name}"}
+
+    def _publish(self, item: Dict[str, Any]) -> None:
+        try:
+            table.put_item(Item=item)
+        except Exception as e:
+            print(f"Circuit breaker '{self.name}' state not shared: {str(e)}")
+
+    def _sync_shared(self) -> None:
+        """
+        Starts a background refresh of the shared state when one is due; callers keep
+        using the last known state meanwhile.
+        """
+        with self._lock:
+            now = time.time()
+            if self._syncing or now - self._synced_at < CIRCUIT_BREAKER_SYNC_SECONDS:
+                return
+            self._synced_at = now
+            self._syncing = True
+        threading.Thread(target=self._refresh_shared, daemon=True).start()
+
+    def _refresh_shared(self) -> None:
+        """
+        Adopts a transition made by another container since our last change.
+        """
+        try:
+            self._adopt_shared_state()
+        finally:
+            with self._lock:
+                self._syncing = False
+
+    def _adopt_shared_state(self) -> None:
+        now = time.time()
+        try:
+            item = table.get_item(Key=self._shared_key()).get('Item')
+        except Exception as e:
+            print(f"Circuit breaker '{self.name}' shared state unavailable: {str(e)}")
+            return
+        if not item or int(item.get('updated_at_ms', 0)) <= _ms(self._changed_at):
+            return
+
+        with self._lock:
+            shared_open_until = int(item.get('open_until_ms', 0)) / 1000.0
+            if item.get('state') == STATE_OPEN and self._state == STATE_CLOSED and shared_open_until > now:
+                print(f"Circuit breaker '{self.name}' opened by another container: {item.get('reason')}")
+                self._state = STATE_OPEN
+                self._open_until = shared_open_until
+                self._calls.clear()
+            elif item.get('state') == STATE_CLOSED and self._state == STATE_OPEN:
+                self._state = STATE_CLOSED
+                self._calls.clear()
+            self._changed_at = int(item['updated_at_ms']) / 1000.0
+
+    def _claim_probe(self) -> Optional[int]:
+        """
+        Claims the half-open probe across containers. Returns the lease (probe_until_ms) on
+        success, None if another container holds it, or 0 if the shared store is unavailable
+        and this container probes on its own.
+        """
+        now = time.time()
+        lease_ms = _ms(now + PROBE_LEASE_SECONDS)
+        try:
+            table.update_item(
+                Key=self._shared_key(),
+                UpdateExpression='SET probe_until_ms = :until',
+                ConditionExpression='attribute_not_exists(probe_until_ms) OR probe_until_ms < :now',
+                ExpressionAttributeValues={':until': lease_ms, ':now': _ms(now)}
+            )
+            return lease_ms
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return None
+            print(f"Circuit breaker '{self.name}' probe claim failed, probing locally: {str(e)}")
+            return 0
+        except Exception as e:
+            print(f"Circuit breaker '{self.name}' probe claim failed, probing locally: {str(e)}")
+            return 0
+
+    def _release_probe(self, lease_ms: int) -> None:
+        """
+        Clears our probe claim so the next open period can be probed without waiting for the lease.
+        """
+        try:
+            table.update_item(
+                Key=self._shared_key(),
+                UpdateExpression='REMOVE probe_until_ms',
+                ConditionExpression='probe_until_ms = :until',
+                ExpressionAttributeValues={':until': lease_ms}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                print(f"Circuit breaker '{self.name}' probe claim not released: {str(e)}")
+        except Exception as e:
+            print(f"Circuit breaker '{self.name}' probe claim not released: {str(e)}")
+
+
+def _ms(timestamp: float) -> int:
+    return int(timestamp * 1000)
+
+
+def get_breaker(name: str, slow_call_seconds: float) -> CircuitBreaker:
+    """
+    Returns the container-wide breaker for a dependency, creating it on first use.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, slow_call_seconds)
+        return breaker
@@ -0,0 +1,130 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Any, Optional
+
+import requests
+
+import playlist_history
+from app import get_spotify_profile
+from time_budget import Deadline
+
+
+def create_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Creates a properly formatted response for API Gateway
+    """
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+            'Access-Control-Allow-Methods': 'GET,OPTIONS',
+            'Cache-Control': 'no-cache'
+        },
+        'body': json.dumps(body, ensure_ascii=False, default=decimal_default)
+    }
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    GET /history?user_id=...&limit=20&cursor=...&from=2025-01-01&to=2025-01-31&order=desc
+    Requires "Authorization: Bearer <Spotify access token>"; user_id must be the token's
+    Spotify user (401 without a valid token, 403 for anyone else's history).
+    Returns one page of playlist summaries (url, name, prompt, created_at, tracks_count)
+    and next_cursor to fetch the following page (null on the last page).
+    """
+    http_method = event.get('httpMethod') or event.get('requestContext', {}).get('http', {}).get('method')
+    if http_method == 'OPTIONS':
+        return create_response(200, {'message': 'OK'})
+
+    params = event.get('queryStringParameters') or {}
+    user_id = params.get('user_id')
+    if not user_id:
+        return create_response(400, {'error': 'Missing required parameter: user_id'})
+
+    denied = check_owner(event, user_id, Deadline.for_request(context))
+    if denied:
+        return denied
+
+    try:
+        limit = int(params.get('limit', playlist_history.HISTORY_PAGE_SIZE))
+    except ValueError:
+        return create_response(400, {'error': 'limit must be an integer'})
+
+    created_from = params.get('from')
+    created_to = params.get('to')
+    for name, value in (('from', created_from), ('to', created_to)):
+        if value and not is_iso_date(value):
+            return create_response(400, {'error': f'{name} must be an ISO date (YYYY-MM-DD) or timestamp'})
+
+    cursor = params.get('cursor')
+    if cursor:
+        try:
+            playlist_history.decode_cursor(cursor)
+        except Exception:
+            return create_response(400, {'error': 'Invalid cursor'})
+
+    try:
+        playlists, next_cursor = playlist_history.query_playlists(
+            user_id,
+            limit=limit,
+            cursor=cursor,
+            newest_first=params.get('order', 'desc').lower() != 'asc',
+            created_from=created_from,
+            created_to=created_to
+        )
+        return create_response(200, {
+            'user_id': user_id,
+            'playlists': playlists,
+            'count': len(playlists),
+            'next_cursor': next_cursor
+        })
+
+    except Exception as e:
+        print(f"Error reading playlist history: {str(e)}")
+        return create_response(500, {'error': f'Internal server error: {str(e)}'})
+
+
+def check_owner(event: Dict[str, Any], user_id: str, deadline: Deadline) -> Optional[Dict[str, Any]]:
+    """
+    Error response unless the request's Spotify token belongs to user_id, None if it does.
+    The owner is resolved through the cached /me profile.
+    """
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    authorization = headers.get('authorization', '')
+    access_token = authorization[len('Bearer '):].strip() if authorization.lower().startswith('bearer ') else ''
+    if not access_token:
+        return create_response(401, {'error': 'Missing Spotify access token (Authorization: Bearer ...)'})
+
+    try:
+        profile = get_spotify_profile(access_token, deadline=deadline)
+    except requests.HTTPError as e:
+        status = e.response.status_code if e.response is not None else None
+        if status in (400, 401, 403):
+            return create_response(401, {'error': 'Invalid or expired Spotify access token'})
+        print(f"Spotify profile lookup failed: {str(e)}")
+        return create_response(502, {'error': 'Could not verify the Spotify access token'})
+    except Exception as e:
+        print(f"Spotify profile lookup failed: {str(e)}")
+        return create_response(502, {'error': 'Could not verify the Spotify access token'})
+
+    if profile.get('id') != user_id:
+        print(f"History of {user_id} requested with a token of {profile.get('id')}")
+        return create_response(403, {'error': 'Forbidden'})
+    return None
+
+
+def is_iso_date(value: Optional[str]) -> bool:
+    try:
+        datetime.fromisoformat(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def decimal_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
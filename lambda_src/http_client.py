@@ -0,0 +1,48 @@
+"""
+Shared HTTP client for outbound calls (Spotify API, image downloads)
+The session lives at module level so warm Lambda containers reuse pooled keep-alive connections
+"""
+
+import os
+import requests
+from requests.adapters import HTTPAdapter
+
+# Environment Variables
+# Number of distinct hosts to keep a connection pool for (accounts.spotify.com, api.spotify.com, image hosts)
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', '4'))
+# Maximum open connections per host; must cover SPOTIFY_SEARCH_CONCURRENCY
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '16'))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '10'))
+
+
+class PooledSession(requests.Session):
+    """
+    requests.Session that applies the default (connect, read) timeout to every call
+    unless the caller passes its own.
+    """
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        return super().request(method, url, **kwargs)
+
+
+def build_session() -> requests.Session:
+    """
+    Creates a keep-alive session with a bounded connection pool per host.
+    pool_block makes extra workers wait for a free connection instead of
+    opening (and then discarding) connections beyond the per-host limit.
+    """
+    session = PooledSession()
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        pool_block=True
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+# Created once per container and reused by every invocation
+session = build_session()
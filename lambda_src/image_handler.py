@@ -7,22 +7,35 @@ import json
 import os
 import boto3
 import base64
-import requests
-from typing import Dict, Any, List
+import time
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
+import bedrock_client
+import bedrock_prompt_caching
+import circuit_breaker
+import model_router
+from app import (
+    PIPELINE_MODE_FAST, PIPELINE_TIME_BUDGET_SECONDS, circuit_open_response, create_spotify_playlist,
+    generate_and_resolve_tracks, is_truthy, model_used, partial_result, playlist_analytics,
+    resolve_pipeline_mode, save_playlist_to_dynamodb, stream_callbacks
+)
+from botocore.exceptions import ClientError
+from circuit_breaker import CircuitOpenError
+from http_client import session as http_session
+from model_router import ModelRoute
+from time_budget import Deadline
+
 # AWS Clients
 dynamodb = boto3.resource('dynamodb')
-bedrock_runtime = boto3.client('bedrock-runtime', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
 s3 = boto3.client('s3')
 
 # Environment Variables
 DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME')
 SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET')
-BEDROCK_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'us.anthropic.claude-haiku-4-5-20251001-v1:0')
-# Nova Act model for vision
-NOVA_MODEL_ID = os.environ.get('NOVA_MODEL_ID', 'us.amazon.nova-lite-v1:0')
+# Nova Act models for vision are configured in model_router (NOVA_MODEL_ID, NOVA_LARGE_MODEL_ID)
+NOVA_SLOW_CALL_SECONDS = float(os.environ.get('NOVA_SLOW_CALL_SECONDS', '10'))
 
 table = dynamodb.Table(DYNAMODB_TABLE_NAME)
 
@@ -33,89 +46,154 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     try:
         body = json.loads(event.get('body', '{}'))
-        user_id = body.get('user_id')
-        image_data = body.get('image_data')  # Base64 encoded image
-        image_url = body.get('image_url')     # Or URL to image
-        spotify_access_token = body.get('spotify_access_token')
-        limit = int(body.get('limit', 25))
-        
-        if not user_id:
-            return create_response(400, {'error': 'Missing user_id'})
-        
-        if not spotify_access_token:
-            return create_response(400, {'error': 'Missing spotify_access_token'})
-        
-        if not image_data and not image_url:
-            return create_response(400, {'error': 'Missing image_data or image_url'})
-        
-        print(f"Processing image for user: {user_id}")
+        status_code, response_body = process_image_request(body, deadline=Deadline.for_request(context))
+        return create_response(status_code, response_body)
         
-        # Step 1: Analyze image with Nova Act
-        mood_analysis = analyze_image_with_nova(image_data, image_url)
-        print(f"Mood analysis: {mood_analysis}")
-        
-        # Step 2: Generate specific song suggestions based on image analysis
-        # Instead of just a prompt, get actual song suggestions from AI
-        playlist_prompt = mood_analysis.get('playlist_prompt', 'Energetic and upbeat music')
-        
-        # Step 3: Get AI to suggest SPECIFIC songs based on the image analysis
-        from app import interpret_prompt_with_bedrock, search_spotify_tracks, create_spotify_playlist, save_playlist_to_dynamodb
-        
-        # Use the detailed prompt to get specific song suggestions
-        music_parameters = interpret_prompt_with_bedrock(playlist_prompt, limit)
-        
-        # Search for the specific songs suggested by AI
-        tracks = search_spotify_tracks(music_parameters, spotify_access_token)
+    except Exception as e:
+        print(f"Error in image handler: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return create_response(500, {
+            'error': f'Internal server error: {str(e)}'
+        })
+
+
+def process_image_request(
+    body: Dict[str, Any],
+    emit: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    deadline: Optional[Deadline] = None
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Runs the image-to-playlist pipeline for a parsed request body and returns (status_code, response body).
+    emit receives streaming progress events (see app.process_playlist_request).
+    deadline is the request's time budget, shared by the image analysis and the playlist pipeline.
+    """
+    user_id = body.get('user_id')
+    image_data = body.get('image_data')  # Base64 encoded image
+    image_url = body.get('image_url')     # Or URL to image
+    spotify_access_token = body.get('spotify_access_token')
+    limit = int(body.get('limit', 25))
+    fresh = is_truthy(body.get('fresh'))
+    
+    if not user_id:
+        return 400, {'error': 'Missing user_id'}
+    
+    if not spotify_access_token:
+        return 400, {'error': 'Missing spotify_access_token'}
+    
+    if not image_data and not image_url:
+        return 400, {'error': 'Missing image_data or image_url'}
+    
+    print(f"Processing image for user: {user_id}")
+    
+    deadline = deadline or Deadline.after(PIPELINE_TIME_BUDGET_SECONDS)
+    
+    # Step 1: Analyze image with Nova Act
+    analysis_route = model_router.route(model_router.TASK_IMAGE_ANALYSIS)
+    mood_analysis = analyze_image_with_nova(image_data, image_url, deadline, analysis_route)
+    print(f"Mood analysis: {mood_analysis}")
+    
+    # Step 2: Generate specific song suggestions based on image analysis
+    # Instead of just a prompt, get actual song suggestions from AI
+    playlist_prompt = mood_analysis.get('playlist_prompt', 'Energetic and upbeat music')
+    
+    # Step 3: Get AI to suggest SPECIFIC songs based on the image analysis
+    # Single-call generation by default; 'two_call' keeps the enhancement round trip for A/B tests
+    pipeline_mode = resolve_pipeline_mode(body.get('pipeline_mode'), PIPELINE_MODE_FAST)
+    
+    # Use the detailed prompt to get specific song suggestions,
+    # searching each one on Spotify as soon as the AI suggests it
+    generation_stats = {}
+    search_stats = {}
+    try:
+        music_parameters, tracks = generate_and_resolve_tracks(
+            playlist_prompt,
+            limit,
+            spotify_access_token,
+            fresh=fresh,
+            pipeline_mode=pipeline_mode,
+            generation_stats=generation_stats,
+            search_stats=search_stats,
+            deadline=deadline,
+            **stream_callbacks(emit)
+        )
         
         if not tracks:
-            return create_response(404, {
+            return 404, {
                 'error': 'No tracks found',
                 'mood_analysis': mood_analysis,
-                'generated_prompt': playlist_prompt
-            })
+                'generated_prompt': playlist_prompt,
+                **partial_result(search_stats)
+            }
         
+        playlist_stats = {}
         playlist_url = create_spotify_playlist(
             user_id=user_id,
             playlist_name=music_parameters.get('playlist_name', f"AI DJ - {mood_analysis.get('mood', 'Vibe')} Mix"),
             track_uris=[track['uri'] for track in tracks],
-            access_token=spotify_access_token
+            access_token=spotify_access_token,
+            playlist_stats=playlist_stats,
+            deadline=deadline
         )
-        
-        # Save with image metadata
-        save_playlist_to_dynamodb(user_id, playlist_url, playlist_prompt, {
-            **music_parameters,
-            'source': 'image_analysis',
-            'mood_analysis': mood_analysis
-        })
-        
-        return create_response(200, {
-            'message': 'Playlist created from image analysis',
-            'playlist_url': playlist_url,
-            'tracks_count': len(tracks),
-            'tracks': tracks,
-            'mood_analysis': mood_analysis,
-            'generated_prompt': playlist_prompt,
-            'model_used': f'{NOVA_MODEL_ID} + {BEDROCK_MODEL_ID}'
-        })
-        
-    except Exception as e:
-        print(f"Error in image handler: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return create_response(500, {
-            'error': f'Internal server error: {str(e)}'
-        })
+    except CircuitOpenError as e:
+        return circuit_open_response(e)
+    
+    if emit:
+        emit('playlist_created', {'playlist_url': playlist_url, 'tracks_count': len(tracks)})
+    
+    # Save with image metadata
+    save_playlist_to_dynamodb(user_id, playlist_url, playlist_prompt, {
+        **music_parameters,
+        'source': 'image_analysis',
+        'mood_analysis': mood_analysis
+    }, playlist_analytics(
+        'image', tracks, music_parameters, generation_stats, search_stats,
+        pipeline_mode=pipeline_mode, requested_limit=limit
+    ), tracks_count=len(tracks))
+    
+    model_router.log_tier('image', analysis_route.describe())
+    model_router.log_tier('image', generation_stats.get('model_route'))
+    return 200, {
+        'message': 'Playlist created from image analysis' + (' (tracks found in time)' if search_stats.get('partial') else ''),
+        'playlist_url': playlist_url,
+        'tracks_count': len(tracks),
+        'tracks': tracks,
+        'mood_analysis': mood_analysis,
+        'generated_prompt': playlist_prompt,
+        'model_used': f'{analysis_route.model_id} + {model_used(generation_stats)}',
+        'model_tier': {'image_analysis': analysis_route.describe(), 'playlist': generation_stats.get('model_route')},
+        'pipeline_mode': pipeline_mode,
+        'prompt_cache': generation_stats.get('prompt_cache'),
+        'track_cache': search_stats.get('track_cache'),
+        'not_found_songs': search_stats.get('not_found_songs', []),
+        'fill': search_stats.get('fill'),
+        **partial_result(search_stats),
+        'snapshot_id': playlist_stats.get('snapshot_id'),
+        'time_budget': deadline.report()
+    }
 
 
-def analyze_image_with_nova(image_data: str = None, image_url: str = None) -> Dict[str, Any]:
+def analyze_image_with_nova(
+    image_data: str = None,
+    image_url: str = None,
+    deadline: Optional[Deadline] = None,
+    route: Optional[ModelRoute] = None
+) -> Dict[str, Any]:
     """
     Analyze image using Amazon Nova Act to detect mood, scene, and vibe
+    (the download is bounded by the deadline; past it, the fallback analysis is used)
+    route picks the Nova model (see model_router) and records any escalation.
     """
     try:
+        if deadline is not None and deadline.expired():
+            raise Exception("Deadline reached before image analysis")
         # Prepare image content
         if image_url:
             # Download image from URL
-            response = requests.get(image_url, timeout=10)
+            if deadline is not None:
+                response = http_session.get(image_url, timeout=deadline.http_timeout())
+            else:
+                response = http_session.get(image_url)
             image_bytes = response.content
             image_b64 = base64.b64encode(image_bytes).decode('utf-8')
         elif image_data:
@@ -212,88 +290,121 @@ Be as specific as possible with artist and song names."""
             }
         }
         
-        response = bedrock_runtime.invoke_model(
-            modelId=NOVA_MODEL_ID,
+        # While the Nova breaker is open this raises and the default analysis below is used.
+        # A truncated or unparsable analysis is retried once per larger Nova tier.
+        route = route or model_router.route(model_router.TASK_IMAGE_ANALYSIS)
+        while True:
+            analysis, stop_reason = invoke_nova_analysis(route.model_id, payload, deadline)
+            reason = model_router.escalation_reason(
+                truncated=analysis is None and stop_reason == 'max_tokens', parsed=analysis is not None
+            )
+            if not reason or not route.escalate(reason, deadline, nova_available):
+                break
+        
+        return analysis or default_analysis()
+        
+    except Exception as e:
+        print(f"Error analyzing image with Nova: {str(e)}")
+        # Return default analysis
+        return {**default_analysis(), 'error': str(e)}
+
+
+def invoke_nova_analysis(
+    model_id: str,
+    payload: Dict[str, Any],
+    deadline: Optional[Deadline] = None
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    One Nova call through its circuit breaker, bounded by the deadline.
+    Returns (parsed analysis or None, stopReason).
+    """
+    if deadline is not None and deadline.expired():
+        raise Exception("Deadline reached before Nova call")
+    breaker = circuit_breaker.get_breaker(f"bedrock:{model_id}", NOVA_SLOW_CALL_SECONDS)
+    breaker.check()
+    started_at = time.time()
+    try:
+        response = bedrock_client.runtime(deadline).invoke_model(
+            modelId=model_id,
             body=json.dumps(payload),
             contentType="application/json",
             accept="application/json"
         )
-        
         response_body = json.loads(response['body'].read())
-        print(f"Nova response body: {json.dumps(response_body)[:500]}")
-        
-        # Nova response format: {"output": {"message": {"content": [{"text": "..."}]}}}
-        if 'output' in response_body and 'message' in response_body['output']:
-            content = response_body['output']['message']['content'][0]['text']
-        elif 'content' in response_body:
-            # Fallback to Claude format
-            content = response_body['content'][0]['text']
-        else:
-            raise Exception(f"Unexpected Nova response format: {list(response_body.keys())}")
-        
-        print(f"Nova content: {content[:500]}")
-        
-        # Parse JSON from response
-        try:
-            # Try direct JSON parse
-            analysis = json.loads(content)
-            print(f"Successfully parsed JSON: {analysis}")
-        except Exception as parse_error:
-            print(f"Failed to parse as direct JSON: {parse_error}")
-            # Extract JSON from markdown
-            if '```json' in content:
-                content = content.split('```json', 1)[1].split('```', 1)[0].strip()
-            elif '```' in content:
-                content = content.split('```', 1)[1].split('```', 1)[0].strip()
-            
-            # Find JSON object
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            if start != -1 and end > start:
-                try:
-                    analysis = json.loads(content[start:end])
-                    print(f"Successfully extracted JSON: {analysis}")
-                except Exception as extract_error:
-                    print(f"Failed to extract JSON: {extract_error}")
-                    print(f"Content was: {content[start:end][:500]}")
-                    # Fallback
-                    analysis = {
-                        'detected_person': None,
-                        'visual_theme': 'Unknown',
-                        'mood': 'energetic',
-                        'energy_level': 0.7,
-                        'valence': 0.7,
-                        'suggested_genres': ['pop', 'rock'],
-                        'playlist_prompt': 'Energetic and upbeat music'
-                    }
-            else:
-                print(f"No JSON object found in content")
-                # Fallback
-                analysis = {
-                    'detected_person': None,
-                    'visual_theme': 'Unknown',
-                    'mood': 'energetic',
-                    'energy_level': 0.7,
-                    'valence': 0.7,
-                    'suggested_genres': ['pop', 'rock'],
-                    'playlist_prompt': 'Energetic and upbeat music'
-                }
-        
+    except ClientError as e:
+        breaker.record(e.response['Error']['Code'] not in circuit_breaker.BEDROCK_FAILURE_CODES, time.time() - started_at)
+        raise
+    except Exception:
+        breaker.record(False, time.time() - started_at)
+        raise
+    breaker.record(True, time.time() - started_at)
+    bedrock_prompt_caching.record_usage('image', response_body)
+    print(f"Nova response body: {json.dumps(response_body)[:500]}")
+    
+    # Nova response format: {"output": {"message": {"content": [{"text": "..."}]}}}
+    if 'output' in response_body and 'message' in response_body['output']:
+        content = response_body['output']['message']['content'][0]['text']
+    elif 'content' in response_body:
+        # Fallback to Claude format
+        content = response_body['content'][0]['text']
+    else:
+        raise Exception(f"Unexpected Nova response format: {list(response_body.keys())}")
+    
+    print(f"Nova content: {content[:500]}")
+    return parse_analysis(content), response_body.get('stopReason') or response_body.get('stop_reason')
+
+
+def parse_analysis(content: str) -> Optional[Dict[str, Any]]:
+    """
+    Parses the analysis JSON, also when wrapped in markdown or prose. None if there is none.
+    """
+    try:
+        # Try direct JSON parse
+        analysis = json.loads(content)
+        print(f"Successfully parsed JSON: {analysis}")
         return analysis
-        
-    except Exception as e:
-        print(f"Error analyzing image with Nova: {str(e)}")
-        # Return default analysis
-        return {
-            'detected_person': None,
-            'visual_theme': 'Unknown',
-            'mood': 'energetic',
-            'energy_level': 0.7,
-            'valence': 0.7,
-            'suggested_genres': ['pop', 'rock'],
-            'playlist_prompt': 'Energetic and upbeat music',
-            'error': str(e)
-        }
+    except Exception as parse_error:
+        print(f"Failed to parse as direct JSON: {parse_error}")
+    
+    # Extract JSON from markdown
+    if '```json' in content:
+        content = content.split('```json', 1)[1].split('```', 1)[0].strip()
+    elif '```' in content:
+        content = content.split('```', 1)[1].split('```', 1)[0].strip()
+    
+    # Find JSON object
+    start = content.find('{')
+    end = content.rfind('}') + 1
+    if start == -1 or end <= start:
+        print(f"No JSON object found in content")
+        return None
+    try:
+        analysis = json.loads(content[start:end])
+        print(f"Successfully extracted JSON: {analysis}")
+        return analysis
+    except Exception as extract_error:
+        print(f"Failed to extract JSON: {extract_error}")
+        print(f"Content was: {content[start:end][:500]}")
+        return None
+
+
+def default_analysis() -> Dict[str, Any]:
+    """
+    Analysis used when Nova is unavailable or its answer cannot be parsed.
+    """
+    return {
+        'detected_person': None,
+        'visual_theme': 'Unknown',
+        'mood': 'energetic',
+        'energy_level': 0.7,
+        'valence': 0.7,
+        'suggested_genres': ['pop', 'rock'],
+        'playlist_prompt': 'Energetic and upbeat music'
+    }
+
+
+def nova_available(model_id: str) -> bool:
+    return not circuit_breaker.get_breaker(f"bedrock:{model_id}", NOVA_SLOW_CALL_SECONDS).is_open()
 
 
 def create_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
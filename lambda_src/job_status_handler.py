@@ -0,0 +1,63 @@
+import json
+from typing import Dict, Any
+
+import playlist_jobs
+
+
+def create_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Creates a properly formatted response for API Gateway
+    """
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+            'Access-Control-Allow-Methods': 'GET,OPTIONS',
+            'Cache-Control': 'no-cache'
+        },
+        'body': json.dumps(body, ensure_ascii=False)
+    }
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    GET /playlist/jobs/{job_id}
+    Returns the status, progress and partial tracks of an asynchronous playlist job.
+    Optional ?user_id= must match the user that created the job.
+    """
+    http_method = event.get('httpMethod') or event.get('requestContext', {}).get('http', {}).get('method')
+    if http_method == 'OPTIONS':
+        return create_response(200, {'message': 'OK'})
+
+    try:
+        job_id = (event.get('pathParameters') or {}).get('job_id')
+        if not job_id:
+            return create_response(400, {'error': 'Missing job_id'})
+
+        job = playlist_jobs.get_job(job_id)
+        user_id = (event.get('queryStringParameters') or {}).get('user_id')
+        if not job or (user_id and job.get('owner_id') != user_id):
+            return create_response(404, {'error': f'Job {job_id} not found'})
+
+        tracks = sorted(job.get('tracks', []), key=lambda track: track.get('position', 0))
+        request = json.loads(job.get('request') or '{}')
+        return create_response(200, {
+            'job_id': job_id,
+            'status': job.get('status'),
+            'stage': job.get('stage'),
+            'requested_limit': request.get('limit'),
+            'songs_suggested': job.get('songs_suggested'),
+            'tracks_found': job.get('tracks_found', len(tracks)),
+            'tracks': tracks,
+            'playlist_url': job.get('playlist_url'),
+            'error': job.get('error'),
+            'result': job.get('result'),
+            'created_at': job.get('created_at'),
+            'updated_at': job.get('updated_at')
+        })
+
+    except Exception as e:
+        print(f"Error reading playlist job: {str(e)}")
+        return create_response(500, {'error': f'Internal server error: {str(e)}'})
@@ -0,0 +1,64 @@
+"""
+Worker for asynchronous playlist jobs
+Invoked asynchronously (InvocationType=Event) by playlist_jobs.create_job with
+{"job_id": ..., "body": <original /playlist request>}. Runs the regular /playlist pipeline
+with the async size limit and records progress, partial tracks and the final result
+on the job record.
+"""
+
+import traceback
+from typing import Dict, Any
+
+import app
+import playlist_jobs
+from time_budget import Deadline
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    job_id = event.get('job_id')
+    body = dict(event.get('body') or {})
+    if not job_id:
+        print("Job worker invoked without job_id")
+        return {'status': 'ignored'}
+
+    # The worker runs the pipeline itself; never re-queue
+    body.pop('async', None)
+    print(f"Starting playlist job {job_id}")
+
+    try:
+        playlist_jobs.update_job(job_id, status=playlist_jobs.JOB_STATUS_RUNNING, stage='generating')
+    except Exception as e:
+        print(f"Error marking job {job_id} as running: {str(e)}")
+
+    progress = playlist_jobs.JobProgressWriter(job_id)
+    try:
+        status_code, response_body = app.process_playlist_request(
+            body,
+            emit=progress,
+            max_limit=app.ASYNC_MAX_LIMIT,
+            # Invoked directly, so only the worker's own timeout applies
+            deadline=Deadline.for_request(context, behind_api_gateway=False)
+        )
+        progress.flush()
+    except Exception as e:
+        print(f"Playlist job {job_id} failed: {str(e)}")
+        traceback.print_exc()
+        status_code, response_body = 500, {'error': f'Internal server error: {str(e)}'}
+
+    succeeded = status_code == 200
+    fields = {
+        'status': playlist_jobs.JOB_STATUS_SUCCEEDED if succeeded else playlist_jobs.JOB_STATUS_FAILED,
+        'stage': 'completed',
+        'status_code': status_code
+    }
+    if succeeded:
+        # Tracks are already on the record; keep the result small
+        fields['result'] = {key: value for key, value in response_body.items() if key != 'tracks'}
+        fields['playlist_url'] = response_body.get('playlist_url')
+    else:
+        fields['error'] = response_body.get('error', 'Playlist job failed')
+        fields['result'] = response_body
+
+    playlist_jobs.update_job(job_id, **fields)
+    print(f"Finished playlist job {job_id} with status {status_code}")
+    return {'status': fields['status'], 'job_id': job_id}
@@ -6,11 +6,14 @@ Provides expert knowledge about music genres, artists, history, and recommendati
 import json
 import os
 import boto3
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 
+import bedrock_client
+import model_router
+from time_budget import Deadline
+
 # AWS Clients
-bedrock_runtime = boto3.client('bedrock-runtime', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
 # Amazon Q Business client (if configured)
 try:
     q_business = boto3.client('qbusiness', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
@@ -19,7 +22,6 @@ except Exception:
 
 # Environment Variables
 Q_APPLICATION_ID = os.environ.get('Q_APPLICATION_ID')
-BEDROCK_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'us.anthropic.claude-haiku-4-5-20251001-v1:0')
 
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -28,6 +30,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     try:
         body = json.loads(event.get('body', '{}'))
+        deadline = Deadline.for_request(context)
         user_id = body.get('user_id')
         query = body.get('query')
         
@@ -43,7 +46,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             response = query_amazon_q(Q_APPLICATION_ID, user_id, query)
         else:
             # Fallback: Use Bedrock with music knowledge
-            response = query_with_bedrock_knowledge(query)
+            response = query_with_bedrock_knowledge(query, deadline)
         
         return create_response(200, response)
         
@@ -92,9 +95,11 @@ def query_amazon_q(app_id: str, user_id: str, query: str) -> Dict[str, Any]:
         raise
 
 
-def query_with_bedrock_knowledge(query: str) -> Dict[str, Any]:
+def query_with_bedrock_knowledge(query: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
     """
     Fallback: Use Bedrock with embedded music knowledge
+    The model tier comes from model_router; a truncated or non-JSON answer is retried on the next tier
+    while the deadline leaves time for it. Every call is bounded by the deadline.
     """
     system_prompt = """You are a music expert with deep knowledge of:
 - Music genres, subgenres, and their characteristics
@@ -128,44 +133,44 @@ Format as JSON with keys: answer (string), context (string), examples (array), s
         ]
     }
     
+    route = model_router.route(model_router.TASK_KNOWLEDGE, query)
     try:
-        response = bedrock_runtime.invoke_model(
-            modelId=BEDROCK_MODEL_ID,
-            body=json.dumps(payload),
-            contentType="application/json",
-            accept="application/json"
-        )
-        
-        response_body = json.loads(response['body'].read())
-        content = response_body['content'][0]['text']
-        
-        # Try to parse as JSON
-        try:
-            knowledge_data = json.loads(content)
-        except:
-            # Extract JSON if wrapped
-            if '```json' in content:
-                content = content.split('```json', 1)[1].split('```', 1)[0].strip()
-            elif '```' in content:
-                content = content.split('```', 1)[1].split('```', 1)[0].strip()
+        while True:
+            if deadline is not None and deadline.expired():
+                raise Exception("Deadline reached before Bedrock call")
+            response = bedrock_client.runtime(deadline).invoke_model(
+                modelId=route.model_id,
+                body=json.dumps(payload),
+                contentType="application/json",
+                accept="application/json"
+            )
+            
+            response_body = json.loads(response['body'].read())
+            content = response_body['content'][0]['text']
+            knowledge_data = parse_knowledge(content)
             
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            if start != -1 and end > start:
-                knowledge_data = json.loads(content[start:end])
-            else:
-                # Fallback: return as plain text
-                knowledge_data = {
-                    'answer': content,
-                    'context': '',
-                    'examples': [],
-                    'suggestions': []
-                }
+            reason = model_router.escalation_reason(
+                truncated=knowledge_data is None and response_body.get('stop_reason') == 'max_tokens',
+                parsed=knowledge_data is not None
+            )
+            if not reason or not route.escalate(reason, deadline):
+                break
+        
+        if knowledge_data is None:
+            # Fallback: return as plain text
+            knowledge_data = {
+                'answer': content,
+                'context': '',
+                'examples': [],
+                'suggestions': []
+            }
         
+        model_router.log_tier('knowledge', route.describe())
         return {
             **knowledge_data,
             'source_type': 'bedrock_knowledge',
-            'model_used': BEDROCK_MODEL_ID,
+            'model_used': route.model_id,
+            'model_tier': route.describe(),
             'timestamp': datetime.utcnow().isoformat()
         }
         
@@ -174,6 +179,30 @@ Format as JSON with keys: answer (string), context (string), examples (array), s
         raise
 
 
+def parse_knowledge(content: str) -> Optional[Dict[str, Any]]:
+    """
+    Parses the JSON answer, also when wrapped in markdown or prose. None if there is none.
+    """
+    # Try to parse as JSON
+    try:
+        return json.loads(content)
+    except:
+        # Extract JSON if wrapped
+        if '```json' in content:
+            content = content.split('```json', 1)[1].split('```', 1)[0].strip()
+        elif '```' in content:
+            content = content.split('```', 1)[1].split('```', 1)[0].strip()
+        
+        start = content.find('{')
+        end = content.rfind('}') + 1
+        if start != -1 and end > start:
+            try:
+                return json.loads(content[start:end])
+            except Exception:
+                return None
+        return None
+
+
 def create_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
     """
     Creates a formatted HTTP response for API Gateway
@@ -0,0 +1,161 @@
+"""
+Model routing and cascade for Bedrock calls
+Every handler asks route() which model serves a task: small playlists, simple prompts and
+short helper calls go to the fast tier, everything else to the standard tier. A call is
+escalated to the next tier (ModelRoute.escalate) only when its output was truncated, could
+not be parsed, or resolved below ESCALATION_FILL_RATE_THRESHOLD of the requested tracks;
+escalation_reason() holds those rules. Image analysis cascades within the Nova family,
+everything else within Claude. With MODEL_ROUTING_ENABLED=false every call uses the
+standard tier (BEDROCK_MODEL_ID / NOVA_MODEL_ID) and never escalates.
+"""
+
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from time_budget import Deadline
+
+# Environment Variables
+MODEL_ROUTING_ENABLED = os.environ.get('MODEL_ROUTING_ENABLED', 'true').lower() == 'true'
+BEDROCK_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'us.anthropic.claude-haiku-4-5-20251001-v1:0')
+BEDROCK_FAST_MODEL_ID = os.environ.get('BEDROCK_FAST_MODEL_ID') or BEDROCK_MODEL_ID
+BEDROCK_LARGE_MODEL_ID = os.environ.get('BEDROCK_LARGE_MODEL_ID', 'us.anthropic.claude-sonnet-4-5-20250929-v1:0')
+NOVA_MODEL_ID = os.environ.get('NOVA_MODEL_ID', 'us.amazon.nova-lite-v1:0')
+NOVA_LARGE_MODEL_ID = os.environ.get('NOVA_LARGE_MODEL_ID', 'us.amazon.nova-pro-v1:0')
+# Routing rules: playlists up to this many generated songs with prompts up to this many words
+# count as small/simple
+ROUTING_FAST_MAX_SONGS = int(os.environ.get('ROUTING_FAST_MAX_SONGS', '30'))
+ROUTING_SIMPLE_PROMPT_MAX_WORDS = int(os.environ.get('ROUTING_SIMPLE_PROMPT_MAX_WORDS', '12'))
+# Escalation rules
+ESCALATION_FILL_RATE_THRESHOLD = float(os.environ.get('ESCALATION_FILL_RATE_THRESHOLD', '0.6'))
+ESCALATION_MIN_REMAINING_SECONDS = float(os.environ.get('ESCALATION_MIN_REMAINING_SECONDS', '8'))
+
+TIER_FAST = 'fast'
+TIER_STANDARD = 'standard'
+TIER_LARGE = 'large'
+
+FAMILY_CLAUDE = 'claude'
+FAMILY_NOVA = 'nova'
+
+TASK_PLAYLIST = 'playlist'
+TASK_PROMPT_ENHANCEMENT = 'prompt_enhancement'
+TASK_AGENT_QUESTION = 'agent_question'
+TASK_IMAGE_ANALYSIS = 'image_analysis'
+TASK_KNOWLEDGE = 'knowledge'
+
+ESCALATE_TRUNCATED = 'truncated'
+ESCALATE_UNPARSABLE = 'unparsable'
+ESCALATE_LOW_FILL = 'low_fill'
+
+# Cheapest first; tiers configured with the same model as the previous one are skipped when escalating
+MODEL_TIERS: Dict[str, List[Tuple[str, str]]] = {
+    FAMILY_CLAUDE: [(TIER_FAST, BEDROCK_FAST_MODEL_ID), (TIER_STANDARD, BEDROCK_MODEL_ID), (TIER_LARGE, BEDROCK_LARGE_MODEL_ID)],
+    FAMILY_NOVA: [(TIER_STANDARD, NOVA_MODEL_ID), (TIER_LARGE, NOVA_LARGE_MODEL_ID)]
+}
+
+
+class ModelRoute:
+    """
+    The model chosen for one task of a request. Escalating moves it (in place) to the next tier,
+    so every later call of the request uses the escalated model.
+    """
+
+    def __init__(self, task: str, family: str, tier: str, reason: str):
+        self.task = task
+        self.family = family
+        self.reason = reason
+        self.escalations: List[Dict[str, str]] = []
+        self._index = [name for name, _ in MODEL_TIERS[family]].index(tier)
+
+    @property
+    def tier(self) -> str:
+        return MODEL_TIERS[self.family][self._index][0]
+
+    @property
+    def model_id(self) -> str:
+        return MODEL_TIERS[self.family][self._index][1]
+
+    def escalate(
+        self,
+        reason: str,
+        deadline: Optional[Deadline] = None,
+        is_available: Optional[Callable[[str], bool]] = None
+    ) -> bool:
+        """
+        Moves to the next tier with a different (and available) model. False when routing is
+        disabled, there is no such tier, or the deadline leaves no time for another call.
+        """
+        if not MODEL_ROUTING_ENABLED:
+            return False
+        if deadline is not None and not deadline.has(ESCALATION_MIN_REMAINING_SECONDS):
+            print(f"Not escalating {self.task} ({reason}): {deadline.remaining():.1f}s left")
+            return False
+        tiers = MODEL_TIERS[self.family]
+        for index in range(self._index + 1, len(tiers)):
+            tier, model_id = tiers[index]
+            if model_id == self.model_id or (is_available is not None and not is_available(model_id)):
+                continue
+            print(f"Escalating {self.task} from {self.tier} to {tier} ({model_id}): {reason}")
+            self.escalations.append({'from': self.tier, 'to': tier, 'reason': reason})
+            self._index = index
+            return True
+        return False
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'task': self.task,
+            'tier': self.tier,
+            'model_id': self.model_id,
+            'reason': self.reason,
+            'escalations': list(self.escalations)
+        }
+
+
+def is_simple_prompt(text: str) -> bool:
+    return len((text or '').split()) <= ROUTING_SIMPLE_PROMPT_MAX_WORDS
+
+
+def route(task: str, text: str = '', songs: int = 0) -> ModelRoute:
+    """
+    Picks the starting tier for a task. text is the user's prompt or question, songs the
+    number of songs the call will generate (playlists only).
+    """
+    family = FAMILY_NOVA if task == TASK_IMAGE_ANALYSIS else FAMILY_CLAUDE
+    if not MODEL_ROUTING_ENABLED:
+        return ModelRoute(task, family, TIER_STANDARD, 'routing disabled')
+    if family == FAMILY_NOVA:
+        return ModelRoute(task, family, TIER_STANDARD, 'vision')
+    if task in (TASK_PROMPT_ENHANCEMENT, TASK_AGENT_QUESTION):
+        return ModelRoute(task, family, TIER_FAST, 'short helper call')
+    if task == TASK_PLAYLIST and songs > ROUTING_FAST_MAX_SONGS:
+        return ModelRoute(task, family, TIER_STANDARD, f'{songs} songs')
+    if not is_simple_prompt(text):
+        return ModelRoute(task, family, TIER_STANDARD, 'complex prompt')
+    return ModelRoute(task, family, TIER_FAST, 'small and simple')
+
+
+def log_tier(source: str, route_info: Optional[Dict[str, Any]]) -> None:
+    """
+    Logs the tier a response was produced with (route_info is ModelRoute.describe()).
+    """
+    if not route_info:
+        return
+    escalations = ' -> '.join(f"{step['to']} ({step['reason']})" for step in route_info['escalations'])
+    print(f"[{source}] model tier: {route_info['tier']} ({route_info['model_id']}) for {route_info['task']}, "
+          f"{route_info['reason']}" + (f", escalated to {escalations}" if escalations else ''))
+
+
+def escalation_reason(
+    truncated: bool = False,
+    parsed: bool = True,
+    fill_rate: Optional[float] = None
+) -> Optional[str]:
+    """
+    Why the output of a call justifies the next tier, or None if it does not.
+    """
+    if truncated:
+        return ESCALATE_TRUNCATED
+    if not parsed:
+        return ESCALATE_UNPARSABLE
+    if fill_rate is not None and fill_rate < ESCALATION_FILL_RATE_THRESHOLD:
+        return ESCALATE_LOW_FILL
+    return None
@@ -0,0 +1,103 @@
+"""
+Playlist history storage
+One DynamoDB item per created playlist ("playlist#<user>#<timestamp>#<id>" keys) instead of
+a list that grows inside the user item. Items carry history_owner / history_created_at,
+the keys of the sparse "history-index" GSI, so a user's history is read newest first, a page
+at a time.
+"""
+
+import base64
+import json
+import os
+import uuid
+import boto3
+from boto3.dynamodb.conditions import Key
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+# AWS Client Configuration
+dynamodb = boto3.resource('dynamodb')
+
+# Environment Variables
+DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME')
+PLAYLIST_HISTORY_INDEX = os.environ.get('PLAYLIST_HISTORY_INDEX', 'history-index')
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+# Attributes projected into history-index; everything else (parameters) stays on the base item
+SUMMARY_FIELDS = ('playlist_url', 'playlist_name', 'prompt', 'created_at', 'tracks_count')
+
+# DynamoDB Table
+table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+
+
+def build_playlist_item(
+    user_id: str,
+    playlist_url: str,
+    prompt: str,
+    parameters: Dict[str, Any],
+    tracks_count: Optional[int] = None,
+    created_at: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Builds the history item for one playlist. created_at is an ISO-8601 UTC timestamp,
+    so it sorts chronologically as a string.
+    """
+    created_at = created_at or datetime.utcnow().isoformat()
+    return {
+        'user_id': f"playlist#{user_id}#{created_at}#{uuid.uuid4().hex[:8]}",
+        'history_owner': user_id,
+        'history_created_at': created_at,
+        'playlist_url': playlist_url,
+        'playlist_name': parameters.get('playlist_name') if isinstance(parameters, dict) else None,
+        'prompt': prompt,
+        'parameters': parameters,
+        'tracks_count': tracks_count,
+        'created_at': created_at
+    }
+
+
+def query_playlists(
+    user_id: str,
+    limit: int = HISTORY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    newest_first: bool = True,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Returns one page of the user's playlist summaries (SUMMARY_FIELDS, read from the index
+    only) and the cursor for the next page (None at the end).
+    created_from / created_to are ISO dates or timestamps; created_to includes every
+    timestamp it prefixes, so "2025-01-31" covers that whole day.
+    """
+    key_condition = Key('history_owner').eq(user_id)
+    if created_from and created_to:
+        key_condition &= Key('history_created_at').between(created_from, created_to + '~')
+    elif created_from:
+        key_condition &= Key('history_created_at').gte(created_from)
+    elif created_to:
+        key_condition &= Key('history_created_at').lte(created_to + '~')
+
+    query_args = {
+        'IndexName': PLAYLIST_HISTORY_INDEX,
+        'KeyConditionExpression': key_condition,
+        'ProjectionExpression': ', '.join(f'#{field}' for field in SUMMARY_FIELDS),
+        'ExpressionAttributeNames': {f'#{field}': field for field in SUMMARY_FIELDS},
+        'ScanIndexForward': not newest_first,
+        'Limit': max(1, min(int(limit), HISTORY_MAX_PAGE_SIZE))
+    }
+    if cursor:
+        query_args['ExclusiveStartKey'] = decode_cursor(cursor)
+
+    response = table.query(**query_args)
+    next_key = response.get('LastEvaluatedKey')
+    return response.get('Items', []), encode_cursor(next_key) if next_key else None
+
+
+def encode_cursor(last_evaluated_key: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
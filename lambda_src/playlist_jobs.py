@@ -0,0 +1,171 @@
+"""
+Asynchronous playlist jobs
+Job records live in the DynamoDB cache table under "job#<id>" keys (TTL via expires_at).
+POST /playlist with async=true creates a job and invokes the worker Lambda; the worker
+writes progress and partial tracks to the record; GET /playlist/jobs/{id} reads it back.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+import boto3
+from decimal import Decimal
+from typing import Dict, Any, List, Optional
+
+# AWS Client Configuration
+dynamodb = boto3.resource('dynamodb')
+lambda_client = boto3.client('lambda', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+
+# Environment Variables
+CACHE_TABLE_NAME = os.environ.get('CACHE_TABLE_NAME') or os.environ.get('DYNAMODB_TABLE_NAME')
+PLAYLIST_JOB_WORKER_FUNCTION = os.environ.get('PLAYLIST_JOB_WORKER_FUNCTION')
+PLAYLIST_JOB_TTL_SECONDS = int(os.environ.get('PLAYLIST_JOB_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Partial tracks are flushed to the job record in batches to limit write volume
+PROGRESS_FLUSH_TRACKS = 10
+PROGRESS_FLUSH_SECONDS = 1.0
+
+JOB_STATUS_QUEUED = 'queued'
+JOB_STATUS_RUNNING = 'running'
+JOB_STATUS_SUCCEEDED = 'succeeded'
+JOB_STATUS_FAILED = 'failed'
+
+# DynamoDB Table
+table = dynamodb.Table(CACHE_TABLE_NAME)
+
+
+def job_key(job_id: str) -> str:
+    return f"job#{job_id}"
+
+
+def create_job(user_id: str, request_body: Dict[str, Any]) -> str:
+    """
+    Stores a queued job and invokes the worker asynchronously. Returns the job id.
+    The Spotify token is passed to the worker in the invocation payload only, never stored.
+    """
+    if not PLAYLIST_JOB_WORKER_FUNCTION:
+        raise Exception("PLAYLIST_JOB_WORKER_FUNCTION is not configured")
+
+    job_id = uuid.uuid4().hex
+    now = int(time.time())
+    stored_request = {key: value for key, value in request_body.items() if key != 'spotify_access_token'}
+
+    table.put_item(
+        Item={
+            'user_id': job_key(job_id),
+            'owner_id': user_id,
+            'status': JOB_STATUS_QUEUED,
+            'stage': 'queued',
+            'request': json.dumps(stored_request),
+            'tracks': [],
+            'tracks_found': 0,
+            'created_at': now,
+            'updated_at': now,
+            'expires_at': now + PLAYLIST_JOB_TTL_SECONDS
+        }
+    )
+
+    lambda_client.invoke(
+        FunctionName=PLAYLIST_JOB_WORKER_FUNCTION,
+        InvocationType='Event',
+        Payload=json.dumps({'job_id': job_id, 'body': request_body}).encode('utf-8')
+    )
+    print(f"Queued playlist job {job_id} for user {user_id}")
+    return job_id
+
+
+def update_job(job_id: str, **fields: Any) -> None:
+    """
+    Sets top-level fields on the job record (status, stage, playlist_url, result, error...).
+    """
+    fields['updated_at'] = int(time.time())
+    names = {f'#f{i}': name for i, name in enumerate(fields)}
+    values = {f':v{i}': _to_dynamo(value) for i, value in enumerate(fields.values())}
+    table.update_item(
+        Key={'user_id': job_key(job_id)},
+        UpdateExpression='SET ' + ', '.join(f'#f{i} = :v{i}' for i in range(len(fields))),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values
+    )
+
+
+def append_job_tracks(job_id: str, tracks: List[Dict[str, Any]]) -> None:
+    if not tracks:
+        return
+    table.update_item(
+        Key={'user_id': job_key(job_id)},
+        UpdateExpression='SET tracks = list_append(if_not_exists(tracks, :empty), :new), '
+                         'tracks_found = if_not_exists(tracks_found, :zero) + :count, updated_at = :now',
+        ExpressionAttributeValues={
+            ':empty': [],
+            ':new': _to_dynamo(tracks),
+            ':zero': 0,
+            ':count': len(tracks),
+            ':now': int(time.time())
+        }
+    )
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    response = table.get_item(Key={'user_id': job_key(job_id)})
+    item = response.get('Item')
+    if not item:
+        return None
+    return _from_dynamo(item)
+
+
+class JobProgressWriter:
+    """
+    emit() callback for the playlist pipelines that records progress on the job record.
+    Track events arrive from resolver threads and are buffered, then appended in batches.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._pending = []
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+
+    def __call__(self, event_type: str, data: Dict[str, Any]) -> None:
+        try:
+            if event_type == 'track':
+                with self._lock:
+                    self._pending.append({**data['track'], 'position': data['position']})
+                    due = (len(self._pending) >= PROGRESS_FLUSH_TRACKS or
+                           time.time() - self._last_flush >= PROGRESS_FLUSH_SECONDS)
+                if due:
+                    self.flush()
+            elif event_type == 'parameters':
+                songs = data.get('parameters', {}).get('songs', [])
+                update_job(self.job_id, stage='searching', songs_suggested=len(songs))
+            elif event_type == 'playlist_created':
+                self.flush()
+                update_job(self.job_id, stage='saving', playlist_url=data.get('playlist_url'))
+        except Exception as e:
+            print(f"Error recording job progress ({event_type}): {str(e)}")
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.time()
+        if pending:
+            append_job_tracks(self.job_id, pending)
+
+
+def _to_dynamo(value: Any) -> Any:
+    """
+    DynamoDB rejects floats; round-trip through JSON with Decimal.
+    """
+    return json.loads(json.dumps(value), parse_float=Decimal)
+
+
+def _from_dynamo(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_from_dynamo(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _from_dynamo(v) for k, v in value.items()}
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
@@ -0,0 +1,99 @@
+"""
+Two-tier cache for Spotify /me profile lookups
+Keyed on a hash of the user's access token (the token itself is never stored).
+Tier 1: in-memory LRU in the warm container. Tier 2: DynamoDB items with a short TTL.
+Entries never outlive the token they were looked up with.
+"""
+
+import hashlib
+import json
+import os
+import time
+import boto3
+from typing import Dict, Any, Optional
+
+from memory_cache import LRUCache
+
+# AWS Client Configuration
+dynamodb = boto3.resource('dynamodb')
+
+# Environment Variables
+CACHE_TABLE_NAME = os.environ.get('CACHE_TABLE_NAME') or os.environ.get('DYNAMODB_TABLE_NAME')
+PROFILE_CACHE_ENABLED = os.environ.get('PROFILE_CACHE_ENABLED', 'true').lower() == 'true'
+PROFILE_CACHE_MAX_ENTRIES = int(os.environ.get('PROFILE_CACHE_MAX_ENTRIES', '1000'))
+# Spotify access tokens are valid for one hour, so no entry can be useful for longer
+PROFILE_CACHE_TTL_SECONDS = int(os.environ.get('PROFILE_CACHE_TTL_SECONDS', '3600'))
+
+# Fields kept from the /me response
+PROFILE_FIELDS = ('id', 'display_name', 'country')
+
+# DynamoDB Table (cache table; profile cache items use a "profile#" key prefix)
+table = dynamodb.Table(CACHE_TABLE_NAME)
+
+memory_cache = LRUCache(PROFILE_CACHE_MAX_ENTRIES, PROFILE_CACHE_TTL_SECONDS)
+
+
+def build_cache_key(access_token: str) -> str:
+    return f"profile#{hashlib.sha256(access_token.encode('utf-8')).hexdigest()}"
+
+
+def cache_ttl(token_expires_at: Optional[int] = None) -> int:
+    """
+    Seconds an entry may live: the configured TTL, bounded by the token expiry when known.
+    """
+    ttl = PROFILE_CACHE_TTL_SECONDS
+    if token_expires_at:
+        ttl = min(ttl, int(token_expires_at) - int(time.time()))
+    return ttl
+
+
+def get_cached_profile(key: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns {'profile', 'tier'} or None on a miss.
+    """
+    if not PROFILE_CACHE_ENABLED:
+        return None
+
+    profile = memory_cache.get(key)
+    if profile is not None:
+        return {'profile': dict(profile), 'tier': 'memory'}
+
+    try:
+        response = table.get_item(Key={'user_id': key})
+        item = response.get('Item')
+    except Exception as e:
+        print(f"Profile cache DynamoDB read failed: {str(e)}")
+        return None
+
+    # TTL deletion is lazy, so expired items can still be returned for a while
+    remaining = int(item.get('expires_at', 0)) - int(time.time()) if item else 0
+    if remaining <= 0:
+        return None
+
+    profile = json.loads(item['profile'])
+    memory_cache.put(key, profile, remaining)
+    return {'profile': dict(profile), 'tier': 'dynamodb'}
+
+
+def put_cached_profile(key: str, profile: Dict[str, Any], token_expires_at: Optional[int] = None) -> None:
+    if not PROFILE_CACHE_ENABLED:
+        return
+    ttl = cache_ttl(token_expires_at)
+    if ttl <= 0:
+        return
+
+    cached_profile = {field: profile.get(field) for field in PROFILE_FIELDS}
+    memory_cache.put(key, cached_profile, ttl)
+
+    now = int(time.time())
+    try:
+        table.put_item(
+            Item={
+                'user_id': key,
+                'profile': json.dumps(cached_profile),
+                'created_at': now,
+                'expires_at': now + ttl
+            }
+        )
+    except Exception as e:
+        print(f"Profile cache DynamoDB write failed: {str(e)}")
@@ -0,0 +1,143 @@
+"""
+Result cache for Bedrock playlist generation
+Stores the generated songs/playlist_name keyed on normalized prompt + limit + model id,
+in the warm container (LRU) and in DynamoDB (TTL) so identical prompts skip Bedrock entirely.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import boto3
+from typing import Dict, Any, Optional
+
+from memory_cache import LRUCache
+
+# AWS Client Configuration
+dynamodb = boto3.resource('dynamodb')
+
+# Environment Variables
+CACHE_TABLE_NAME = os.environ.get('CACHE_TABLE_NAME') or os.environ.get('DYNAMODB_TABLE_NAME')
+# Generation is non-deterministic, so caching trades variety for latency; fresh=true requests bypass it
+PROMPT_CACHE_ENABLED = os.environ.get('PROMPT_CACHE_ENABLED', 'true').lower() == 'true'
+PROMPT_CACHE_TTL_SECONDS = int(os.environ.get('PROMPT_CACHE_TTL_SECONDS', str(6 * 3600)))
+PROMPT_CACHE_MAX_ENTRIES = int(os.environ.get('PROMPT_CACHE_MAX_ENTRIES', '500'))
+
+# DynamoDB Table (cache table; prompt cache items use a "prompt#" key prefix)
+table = dynamodb.Table(CACHE_TABLE_NAME)
+
+memory_cache = LRUCache(PROMPT_CACHE_MAX_ENTRIES, PROMPT_CACHE_TTL_SECONDS)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    "Rock para entrenar " and "rock para entrenar" normalize to the same text.
+    """
+    text = unicodedata.normalize('NFKC', prompt or '').casefold()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip('.!?¡¿ ')
+
+
+def build_cache_key(prompt: str, limit: int, model_id: str, mode: str) -> str:
+    """
+    Hashes the normalized prompt together with everything that changes the generated list.
+    """
+    raw = f"{model_id}|{mode}|{limit}|{normalize_prompt(prompt)}"
+    return f"prompt#{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+
+def _record_hit(key: str, entry: Dict[str, Any]) -> int:
+    """
+    Counts a hit on the in-memory entry and returns the count, known as of the last
+    DynamoDB read plus this container's hits. The DynamoDB counter is incremented in the
+    background, so hits never wait on a write.
+    """
+    entry['hit_count'] = entry.get('hit_count', 0) + 1
+    threading.Thread(target=_increment_hit_count, args=(key,), daemon=True).start()
+    return entry['hit_count']
+
+
+def _increment_hit_count(key: str) -> None:
+    try:
+        table.update_item(
+            Key={'user_id': key},
+            UpdateExpression='ADD hit_count :one SET last_hit_at = :now',
+            ConditionExpression='attribute_exists(user_id)',
+            ExpressionAttributeValues={':one': 1, ':now': int(time.time())}
+        )
+    except Exception as e:
+        print(f"Prompt cache hit counter update failed: {str(e)}")
+
+
+def get_cached_generation(key: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the cached music parameters plus cache info, or None on a miss.
+    """
+    if not PROMPT_CACHE_ENABLED:
+        return None
+
+    entry = memory_cache.get(key)
+    tier = 'memory'
+
+    if entry is None:
+        tier = 'dynamodb'
+        try:
+            response = table.get_item(Key={'user_id': key})
+            item = response.get('Item')
+        except Exception as e:
+            print(f"Prompt cache DynamoDB read failed: {str(e)}")
+            item = None
+        if not item or int(item.get('expires_at', 0)) <= int(time.time()):
+            return None
+        entry = {
+            'music_parameters': json.loads(item['music_parameters']),
+            'created_at': int(item.get('created_at', 0)),
+            'hit_count': int(item.get('hit_count', 0))
+        }
+        memory_cache.put(key, entry, max(1, int(item['expires_at']) - int(time.time())))
+
+    hit_count = _record_hit(key, entry)
+    print(f"⚡ Prompt cache hit ({tier}), hit_count={hit_count}")
+    return {
+        'music_parameters': dict(entry['music_parameters']),
+        'cache_info': {
+            'hit': True,
+            'tier': tier,
+            'hit_count': hit_count,
+            'age_seconds': int(time.time()) - entry['created_at']
+        }
+    }
+
+
+def put_cached_generation(key: str, music_parameters: Dict[str, Any]) -> None:
+    """
+    Stores a successful generation. Empty song lists and fallback parameters are not cached.
+    """
+    if not PROMPT_CACHE_ENABLED:
+        return
+    songs = music_parameters.get('songs') if isinstance(music_parameters, dict) else None
+    if not isinstance(songs, list) or not songs:
+        return
+
+    now = int(time.time())
+    cached_parameters = {
+        'songs': songs,
+        'playlist_name': music_parameters.get('playlist_name', 'AI DJ Playlist')
+    }
+    memory_cache.put(key, {'music_parameters': cached_parameters, 'created_at': now})
+
+    try:
+        table.put_item(
+            Item={
+                'user_id': key,
+                'music_parameters': json.dumps(cached_parameters),
+                'hit_count': 0,
+                'created_at': now,
+                'expires_at': now + PROMPT_CACHE_TTL_SECONDS
+            }
+        )
+    except Exception as e:
+        print(f"Prompt cache DynamoDB write failed: {str(e)}")
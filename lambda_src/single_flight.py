@@ -0,0 +1,218 @@
+"""
+Single-flight coalescing of identical in-flight generations
+Requests for the same normalized prompt + limit share one generation and search: the first
+one (the leader) computes the result, the others (followers) wait for it instead of calling
+Bedrock and Spotify again. Within a warm container followers wait on the leader's in-memory
+flight; across containers the leader holds a "flight#<hash>" lease item in the cache table
+and publishes its result there for followers to pick up. Followers that cannot get a result
+in time (leader failed, lease expired, deadline) compute their own.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from prompt_cache import normalize_prompt
+from time_budget import Deadline
+
+# AWS Client Configuration
+# Lease bookkeeping sits on the request path: short timeouts, no SDK retries
+dynamodb = boto3.resource('dynamodb', config=Config(connect_timeout=1, read_timeout=1, retries={'max_attempts': 1}))
+
+# Environment Variables
+CACHE_TABLE_NAME = os.environ.get('CACHE_TABLE_NAME') or os.environ.get('DYNAMODB_TABLE_NAME')
+SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+# Followers arriving shortly after the leader finished still get its result
+SINGLE_FLIGHT_RESULT_TTL_SECONDS = int(os.environ.get('SINGLE_FLIGHT_RESULT_TTL_SECONDS', '15'))
+SINGLE_FLIGHT_POLL_SECONDS = float(os.environ.get('SINGLE_FLIGHT_POLL_SECONDS', '0.25'))
+
+FLIGHT_RUNNING = 'running'
+FLIGHT_DONE = 'done'
+
+# DynamoDB Table (cache table; lease items use a "flight#" key prefix)
+table = dynamodb.Table(CACHE_TABLE_NAME)
+
+_flights: Dict[str, 'Flight'] = {}
+_flights_lock = threading.Lock()
+
+
+class Flight:
+    """
+    One in-flight computation in this container. result stays None if it failed.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.result: Optional[Dict[str, Any]] = None
+        self.source = 'memory'
+        self._done = threading.Event()
+
+    def complete(self, result: Optional[Dict[str, Any]], source: str = 'memory') -> None:
+        self.result = result
+        self.source = source
+        self._done.set()
+
+    def wait(self, timeout: float) -> Optional[Dict[str, Any]]:
+        return self.result if self._done.wait(max(0.0, timeout)) else None
+
+
+def build_key(prompt: str, limit: int, model_id: str, mode: str) -> str:
+    raw = f"{model_id}|{mode}|{limit}|{normalize_prompt(prompt)}"
+    return f"flight#{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+
+def run(
+    key: str,
+    compute: Callable[[], Dict[str, Any]],
+    deadline: Deadline
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Returns (result, info). compute() must return a JSON-serializable dict; it is called
+    when this request leads the flight, or as a fallback when no leader result arrives
+    before the deadline. info['role'] is 'leader', 'follower' or 'fallback', with
+    info['source'] ('memory' or 'dynamodb') and info['waited_ms'] for followers.
+    """
+    started_at = time.time()
+    with _flights_lock:
+        flight = _flights.get(key)
+        local_leader = flight is None
+        if local_leader:
+            flight = _flights[key] = Flight(key)
+
+    if not local_leader:
+        result = flight.wait(deadline.remaining())
+        if result is not None:
+            return result, _info('follower', flight.source, started_at)
+        print(f"Single-flight {key[:20]}: no result from the local leader, computing")
+        return compute(), _info('fallback', None, started_at)
+
+    result = None
+    source = 'memory'
+    try:
+        owner = uuid.uuid4().hex
+        if _acquire_lease(key, owner, deadline):
+            result = _lead(key, owner, compute)
+            return result, _info('leader', None, started_at)
+
+        result = _wait_for_remote(key, deadline)
+        if result is not None:
+            source = 'dynamodb'
+            return result, _info('follower', source, started_at)
+        print(f"Single-flight {key[:20]}: no result from the remote leader, computing")
+        result = compute()
+        return result, _info('fallback', None, started_at)
+    finally:
+        # Local followers get whatever this request ended up with (None if it failed)
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.complete(result, source)
+
+
+def _info(role: str, source: Optional[str], started_at: float) -> Dict[str, Any]:
+    info = {'role': role}
+    if role == 'follower':
+        info.update({'source': source, 'waited_ms': int((time.time() - started_at) * 1000)})
+    return info
+
+
+def _lead(key: str, owner: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    try:
+        result = compute()
+    except Exception:
+        _release_lease(key, owner)
+        raise
+    _publish_result(key, owner, result)
+    return result
+
+
+def _acquire_lease(key: str, owner: str, deadline: Deadline) -> bool:
+    """
+    Conditional put of the lease item; it lasts as long as the leader's own deadline.
+    If DynamoDB is unavailable, this request leads without a lease.
+    """
+    now = time.time()
+    try:
+        table.put_item(
+            Item={
+                'user_id': key,
+                'status': FLIGHT_RUNNING,
+                'owner': owner,
+                'lease_until_ms': int(deadline.expires_at * 1000),
+                'expires_at': int(deadline.expires_at) + SINGLE_FLIGHT_RESULT_TTL_SECONDS
+            },
+            ConditionExpression='attribute_not_exists(user_id) OR lease_until_ms < :now',
+            ExpressionAttributeValues={':now': int(now * 1000)}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        print(f"Single-flight lease failed, leading without one: {str(e)}")
+        return True
+    except Exception as e:
+        print(f"Single-flight lease failed, leading without one: {str(e)}")
+        return True
+
+
+def _publish_result(key: str, owner: str, result: Dict[str, Any]) -> None:
+    """
+    Stores the result on the lease item and keeps it readable for SINGLE_FLIGHT_RESULT_TTL_SECONDS.
+    """
+    until = time.time() + SINGLE_FLIGHT_RESULT_TTL_SECONDS
+    try:
+        table.update_item(
+            Key={'user_id': key},
+            UpdateExpression='SET #status = :done, #result = :result, lease_until_ms = :until, expires_at = :expires',
+            ConditionExpression='#owner = :owner',
+            ExpressionAttributeNames={'#status': 'status', '#result': 'result', '#owner': 'owner'},
+            ExpressionAttributeValues={
+                ':done': FLIGHT_DONE,
+                ':result': json.dumps(result),
+                ':until': int(until * 1000),
+                ':expires': int(until) + 60,
+                ':owner': owner
+            }
+        )
+    except Exception as e:
+        print(f"Single-flight result not published: {str(e)}")
+
+
+def _release_lease(key: str, owner: str) -> None:
+    try:
+        table.delete_item(
+            Key={'user_id': key},
+            ConditionExpression='#owner = :owner',
+            ExpressionAttributeNames={'#owner': 'owner'},
+            ExpressionAttributeValues={':owner': owner}
+        )
+    except Exception as e:
+        print(f"Single-flight lease not released: {str(e)}")
+
+
+def _wait_for_remote(key: str, deadline: Deadline) -> Optional[Dict[str, Any]]:
+    """
+    Polls the lease item until the leader publishes, gives up (item gone or lease expired)
+    or the deadline passes.
+    """
+    while not deadline.expired():
+        try:
+            item = table.get_item(Key={'user_id': key}, ConsistentRead=True).get('Item')
+        except Exception as e:
+            print(f"Single-flight poll failed: {str(e)}")
+            return None
+        if not item:
+            return None
+        if item.get('status') == FLIGHT_DONE:
+            return json.loads(item['result'])
+        if int(item.get('lease_until_ms', 0)) < int(time.time() * 1000):
+            return None
+        time.sleep(min(SINGLE_FLIGHT_POLL_SECONDS, deadline.remaining()))
+    return None
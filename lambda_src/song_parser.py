@@ -0,0 +1,152 @@
+"""
+Incremental parser for the model's {"songs": [...], "playlist_name": ...} JSON
+Emits each "Song - Artist" string as soon as its closing quote arrives, so Spotify
+lookups can start while Bedrock is still generating the rest of the list.
+The same parser salvages responses that do not parse as JSON (cut off at max_tokens):
+salvage_song_list() recovers every complete song and the text to continue from.
+How often that saves a second Bedrock call is counted per container (salvage_stats()).
+"""
+
+import json
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+SONGS_ARRAY_START = re.compile(r'"songs"\s*:\s*\[')
+PLAYLIST_NAME = re.compile(r'"playlist_name"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+_salvage_stats = {'attempts': 0, 'salvaged': 0, 'songs_salvaged': 0, 'continuations': 0, 'second_calls_avoided': 0}
+_salvage_lock = threading.Lock()
+
+
+class SongStreamParser:
+    """
+    Feed text deltas with feed(); on_song is called once per completed song string,
+    up to max_songs. Anything that is not a plain string inside the songs array stops
+    incremental parsing (the caller still parses the full text at the end).
+    """
+
+    def __init__(self, on_song: Callable[[str], None], max_songs: Optional[int] = None):
+        self.on_song = on_song
+        self.max_songs = max_songs
+        self.songs: List[str] = []
+        self.first_song_ms: Optional[int] = None
+        # Length of the fed text up to (and including) the closing quote of the last song
+        self.end_offset = 0
+        self._started_at = time.time()
+        self._state = 'seek'
+        self._pending = ''
+        self._raw = ''
+        self._escaped = False
+        self._fed = 0
+
+    @property
+    def done(self) -> bool:
+        return self._state == 'done'
+
+    def feed(self, text: str) -> None:
+        if self._state == 'done' or not text:
+            return
+        self._fed += len(text)
+
+        if self._state == 'seek':
+            self._pending += text
+            match = SONGS_ARRAY_START.search(self._pending)
+            if not match:
+                # Keep only a tail long enough to contain a split '"songs": [' token
+                self._pending = self._pending[-64:]
+                return
+            text = self._pending[match.end():]
+            self._pending = ''
+            self._state = 'array'
+
+        start = self._fed - len(text)
+        for index, char in enumerate(text):
+            if self._state == 'array':
+                if char == '"':
+                    self._raw = char
+                    self._state = 'string'
+                elif char == ']':
+                    self._state = 'done'
+                    return
+                elif not (char.isspace() or char == ','):
+                    # Objects or other values: leave it to the full parse
+                    self._state = 'done'
+                    return
+            elif self._state == 'string':
+                self._raw += char
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._state = 'array'
+                    self.end_offset = start + index + 1
+                    self._emit(self._raw)
+                    if self._state == 'done':
+                        return
+
+    def _emit(self, raw: str) -> None:
+        try:
+            song = json.loads(raw)
+        except ValueError:
+            return
+        song = song.strip()
+        if not song:
+            return
+        self.songs.append(song)
+        if self.first_song_ms is None:
+            self.first_song_ms = int((time.time() - self._started_at) * 1000)
+        self.on_song(song)
+        if self.max_songs is not None and len(self.songs) >= self.max_songs:
+            self._state = 'done'
+
+
+def salvage_song_list(text: str, max_songs: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Recovers what is usable from a song list JSON that failed to parse: every complete song
+    (up to max_songs), the playlist_name if it was generated, and prefix, the text up to the
+    last complete song (what a continuation has to carry on from; '' without songs).
+    """
+    parser = SongStreamParser(lambda song: None, max_songs=max_songs)
+    parser.feed(text)
+    name = PLAYLIST_NAME.search(text)
+    playlist_name = None
+    if name:
+        try:
+            playlist_name = json.loads(name.group(1))
+        except ValueError:
+            pass
+    return {
+        'songs': list(parser.songs),
+        'playlist_name': playlist_name,
+        'prefix': text[:parser.end_offset] if parser.songs else ''
+    }
+
+
+def record_salvage(songs: int, continued: bool) -> None:
+    """
+    Counts one salvage attempt: songs recovered (including any continuation) and whether
+    a continuation call was made. A salvage with songs and no continuation avoided a second call.
+    """
+    with _salvage_lock:
+        _salvage_stats['attempts'] += 1
+        _salvage_stats['songs_salvaged'] += songs
+        if songs:
+            _salvage_stats['salvaged'] += 1
+        if continued:
+            _salvage_stats['continuations'] += 1
+        elif songs:
+            _salvage_stats['second_calls_avoided'] += 1
+    stats = salvage_stats()
+    print(f"Song list salvage: {songs} songs{' with a continuation' if continued else ''} "
+          f"(second call avoided in {stats['second_calls_avoided']}/{stats['attempts']}, "
+          f"{stats['continuations']} continuations)")
+
+
+def salvage_stats() -> Dict[str, Any]:
+    with _salvage_lock:
+        stats = dict(_salvage_stats)
+    stats['second_call_avoided_rate'] = round(stats['second_calls_avoided'] / stats['attempts'], 3) if stats['attempts'] else 0.0
+    return stats
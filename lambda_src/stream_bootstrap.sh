@@ -0,0 +1,5 @@
+#!/bin/sh
+# Exec wrapper for AI-DJ-Stream-Handler (AWS_LAMBDA_EXEC_WRAPPER).
+# Replaces the managed Python runtime loop with streaming_runtime.py, which
+# supports Lambda response streaming for the function URL.
+exec /var/lang/bin/python3 -u "${LAMBDA_TASK_ROOT:-/var/task}/streaming_runtime.py"
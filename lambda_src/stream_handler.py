@@ -0,0 +1,94 @@
+"""
+Streaming entry point for /playlist, /agent/chat and /playlist-from-image
+Runs the same pipelines as the buffered handlers and writes newline-delimited JSON events
+as they happen: parameters, track (one per resolved track), playlist_created, done.
+The done event carries the same body the buffered endpoint would have returned.
+Served by a Lambda function URL in RESPONSE_STREAM mode through streaming_runtime.py.
+"""
+
+import base64
+import json
+import queue
+import threading
+import time
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+import app
+import agent_handler
+import image_handler
+from time_budget import Deadline
+
+# Path -> pipeline(body, emit, deadline=...) returning (status_code, response body)
+STREAM_ROUTES = {
+    '/playlist': app.process_playlist_request,
+    '/agent/chat': agent_handler.process_agent_request,
+    '/playlist-from-image': image_handler.process_image_request,
+}
+
+# CORS headers are added by the function URL configuration, not here
+STREAM_HEADERS = {
+    'Content-Type': 'application/x-ndjson',
+    'Cache-Control': 'no-cache'
+}
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Tuple[int, Dict[str, str], Iterator[bytes]]:
+    """
+    Returns (status_code, headers, body chunks). The pipeline runs on a worker thread
+    and each emitted event is yielded to the client as one JSON line.
+    """
+    path = event.get('rawPath') or event.get('path') or '/playlist'
+    pipeline = STREAM_ROUTES.get(path.rstrip('/'))
+    if pipeline is None:
+        return 404, STREAM_HEADERS, iter([encode_event('done', {
+            'status_code': 404,
+            'body': {'error': f'No streaming route for {path}'}
+        })])
+
+    try:
+        raw_body = event.get('body') or '{}'
+        if event.get('isBase64Encoded'):
+            raw_body = base64.b64decode(raw_body).decode('utf-8')
+        body = json.loads(raw_body)
+    except Exception as e:
+        return 400, STREAM_HEADERS, iter([encode_event('done', {
+            'status_code': 400,
+            'body': {'error': f'Invalid JSON body: {str(e)}'}
+        })])
+
+    # Function URLs are not bound by the API Gateway limit; the budget is the Lambda timeout
+    deadline = Deadline.for_request(context, behind_api_gateway=False)
+    return 200, STREAM_HEADERS, run_pipeline_stream(pipeline, body, deadline)
+
+
+def encode_event(event_type: str, data: Dict[str, Any]) -> bytes:
+    return (json.dumps({'event': event_type, **data}) + '\n').encode('utf-8')
+
+
+def run_pipeline_stream(pipeline: Any, body: Dict[str, Any], deadline: Optional[Deadline] = None) -> Iterator[bytes]:
+    """
+    Runs pipeline(body, emit, deadline=deadline) in the background and yields its events in emission order,
+    finishing with a done event (status_code + body) once the pipeline returns.
+    """
+    events = queue.Queue()
+    started_at = time.time()
+
+    def emit(event_type: str, data: Dict[str, Any]) -> None:
+        events.put(encode_event(event_type, {**data, 'elapsed_ms': int((time.time() - started_at) * 1000)}))
+
+    def worker() -> None:
+        try:
+            status_code, response_body = pipeline(body, emit, deadline=deadline)
+        except Exception as e:
+            print(f"Error in streaming pipeline: {str(e)}")
+            status_code, response_body = 500, {'error': f'Internal server error: {str(e)}'}
+        emit('done', {'status_code': status_code, 'body': response_body})
+        events.put(None)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+    while True:
+        chunk = events.get()
+        if chunk is None:
+            return
+        yield chunk
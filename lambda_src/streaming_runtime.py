@@ -0,0 +1,109 @@
+"""
+Minimal Lambda Runtime API loop with response streaming
+The managed Python runtime only sends buffered responses, so the streaming function starts
+this loop instead (via the stream_bootstrap.sh exec wrapper). It calls
+stream_handler.lambda_handler and forwards each body chunk to the Runtime API as it is
+produced, using the function URL HTTP integration format (JSON prelude + 8 NUL bytes + body).
+"""
+
+import http.client
+import json
+import os
+import sys
+import time
+import traceback
+
+# The managed runtime normally puts the task root and layers on sys.path
+sys.path[:0] = [os.environ.get('LAMBDA_TASK_ROOT', '/var/task'), '/opt/python']
+
+RUNTIME_API = os.environ.get('AWS_LAMBDA_RUNTIME_API', '127.0.0.1:9001')
+RUNTIME_PATH = '/2018-06-01/runtime'
+HTTP_INTEGRATION_CONTENT_TYPE = 'application/vnd.awslambda.http-integration-response'
+PRELUDE_DELIMITER = b'\x00' * 8
+
+
+class InvocationContext:
+    """
+    Subset of the Lambda context object used by the handlers.
+    """
+
+    def __init__(self, headers):
+        self.aws_request_id = headers.get('Lambda-Runtime-Aws-Request-Id')
+        self.invoked_function_arn = headers.get('Lambda-Runtime-Invoked-Function-Arn')
+        self.function_name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
+        self.function_version = os.environ.get('AWS_LAMBDA_FUNCTION_VERSION')
+        self.memory_limit_in_mb = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+        self.log_group_name = os.environ.get('AWS_LAMBDA_LOG_GROUP_NAME')
+        self.log_stream_name = os.environ.get('AWS_LAMBDA_LOG_STREAM_NAME')
+        self._deadline_ms = int(headers.get('Lambda-Runtime-Deadline-Ms', '0'))
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, self._deadline_ms - int(time.time() * 1000))
+
+
+def _runtime_request(method: str, path: str, body=None, headers=None, encode_chunked: bool = False):
+    connection = http.client.HTTPConnection(RUNTIME_API)
+    connection.request(method, RUNTIME_PATH + path, body=body, headers=headers or {}, encode_chunked=encode_chunked)
+    response = connection.getresponse()
+    payload = response.read()
+    connection.close()
+    return response, payload
+
+
+def _error_payload(error: Exception) -> bytes:
+    return json.dumps({
+        'errorMessage': str(error),
+        'errorType': type(error).__name__,
+        'stackTrace': traceback.format_exc().splitlines()
+    }).encode('utf-8')
+
+
+def _stream_body(status_code, headers, chunks):
+    yield json.dumps({'statusCode': status_code, 'headers': headers}).encode('utf-8') + PRELUDE_DELIMITER
+    for chunk in chunks:
+        if chunk:
+            yield chunk
+
+
+def main() -> None:
+    try:
+        import stream_handler
+    except Exception as e:
+        print(f"Streaming runtime init failed: {str(e)}")
+        _runtime_request('POST', '/init/error', body=_error_payload(e),
+                         headers={'Lambda-Runtime-Function-Error-Type': 'Runtime.ImportModuleError'})
+        sys.exit(1)
+
+    while True:
+        response, payload = _runtime_request('GET', '/invocation/next')
+        headers = {key: value for key, value in response.getheaders()}
+        request_id = headers.get('Lambda-Runtime-Aws-Request-Id')
+        os.environ['_X_AMZN_TRACE_ID'] = headers.get('Lambda-Runtime-Trace-Id', '')
+
+        try:
+            event = json.loads(payload or b'{}')
+            status_code, response_headers, chunks = stream_handler.lambda_handler(event, InvocationContext(headers))
+        except Exception as e:
+            print(f"Error in streaming handler: {str(e)}")
+            _runtime_request('POST', f'/invocation/{request_id}/error', body=_error_payload(e),
+                             headers={'Lambda-Runtime-Function-Error-Type': 'Unhandled'})
+            continue
+
+        try:
+            _runtime_request(
+                'POST',
+                f'/invocation/{request_id}/response',
+                body=_stream_body(status_code, response_headers, chunks),
+                headers={
+                    'Lambda-Runtime-Function-Response-Mode': 'streaming',
+                    'Content-Type': HTTP_INTEGRATION_CONTENT_TYPE
+                },
+                encode_chunked=True
+            )
+        except Exception as e:
+            # The client already received part of the stream; nothing else can be reported
+            print(f"Error while streaming response: {str(e)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Request-scoped time budget
+A Deadline is created once per invocation from the Lambda context (and the API Gateway
+integration limit when the function sits behind it) and passed down to every stage, so
+retries, backoff sleeps, HTTP timeouts and optional steps fit in the time that is left.
+"""
+
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from http_client import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+
+# Environment Variables
+# HTTP API integrations time out at 30s; keep a little room for the response itself
+API_GATEWAY_TIMEOUT_SECONDS = float(os.environ.get('API_GATEWAY_TIMEOUT_SECONDS', '29'))
+DEADLINE_SAFETY_MARGIN_SECONDS = float(os.environ.get('DEADLINE_SAFETY_MARGIN_SECONDS', '1.5'))
+
+# Never hand out HTTP timeouts shorter than this; a call that cannot finish should be skipped instead
+MIN_HTTP_TIMEOUT_SECONDS = 0.5
+
+
+class Deadline:
+    """
+    Absolute point in time (epoch seconds) by which the pipeline must have its answer.
+    """
+
+    def __init__(self, expires_at: float, budget_seconds: Optional[float] = None):
+        self.expires_at = expires_at
+        self.started_at = time.time()
+        self.budget_seconds = budget_seconds if budget_seconds is not None else expires_at - self.started_at
+
+    @classmethod
+    def after(cls, seconds: float) -> 'Deadline':
+        return cls(time.time() + seconds, seconds)
+
+    @classmethod
+    def for_request(cls, context: Any, behind_api_gateway: bool = True, fallback_seconds: float = 25.0) -> 'Deadline':
+        """
+        Budget = min(Lambda time left, API Gateway limit when applicable) - safety margin.
+        fallback_seconds is used when there is no context (local runs).
+        """
+        limits = []
+        if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+            limits.append(context.get_remaining_time_in_millis() / 1000.0)
+        if behind_api_gateway:
+            limits.append(API_GATEWAY_TIMEOUT_SECONDS)
+        budget = (min(limits) if limits else fallback_seconds) - DEADLINE_SAFETY_MARGIN_SECONDS
+        return cls.after(max(0.0, budget))
+
+    def reserving(self, seconds: float) -> 'Deadline':
+        """
+        An earlier deadline that leaves `seconds` of this one for a later step
+        (e.g. stop searching in time to still create the playlist).
+        """
+        child = Deadline(self.expires_at - seconds, self.budget_seconds - seconds)
+        child.started_at = self.started_at
+        return child
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def has(self, seconds: float) -> bool:
+        """
+        True when at least `seconds` are left, i.e. a step of that cost can still run.
+        """
+        return self.remaining() >= seconds
+
+    def can_sleep(self, seconds: float, then_needs: float = 0.0) -> bool:
+        """
+        Whether a backoff of `seconds` still leaves `then_needs` seconds for the retried call.
+        """
+        return self.remaining() >= seconds + then_needs
+
+    def http_timeout(self) -> Tuple[float, float]:
+        """
+        (connect, read) timeout for requests, capped to the remaining time.
+        """
+        remaining = max(MIN_HTTP_TIMEOUT_SECONDS, self.remaining())
+        return min(HTTP_CONNECT_TIMEOUT, remaining), min(HTTP_READ_TIMEOUT, remaining)
+
+    def report(self) -> Dict[str, float]:
+        return {
+            'budget_seconds': round(self.budget_seconds, 2),
+            'elapsed_seconds': round(time.time() - self.started_at, 2),
+            'remaining_seconds': round(self.remaining(), 2)
+        }
@@ -0,0 +1,222 @@
+"""
+Two-tier cache for Spotify track resolution
+Tier 1: in-memory LRU in the warm container. Tier 2: shared DynamoDB items with TTL expiry.
+Keys are a normalized "Song - Artist" string plus the search market.
+Songs Spotify cannot find are cached too (negative entries, shorter TTL) so they are skipped.
+"""
+
+import json
+import os
+import re
+import time
+import unicodedata
+import boto3
+from typing import Dict, Any, List, Optional
+
+from memory_cache import LRUCache
+
+# AWS Client Configuration
+dynamodb = boto3.resource('dynamodb')
+
+# Environment Variables
+CACHE_TABLE_NAME = os.environ.get('CACHE_TABLE_NAME') or os.environ.get('DYNAMODB_TABLE_NAME')
+TRACK_CACHE_ENABLED = os.environ.get('TRACK_CACHE_ENABLED', 'true').lower() == 'true'
+TRACK_CACHE_MAX_ENTRIES = int(os.environ.get('TRACK_CACHE_MAX_ENTRIES', '5000'))
+# Track URIs are stable; a week keeps popular tracks warm without pinning stale metadata forever
+TRACK_CACHE_TTL_SECONDS = int(os.environ.get('TRACK_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Songs Spotify had no match for are remembered for less time, since the catalog changes
+NEGATIVE_CACHE_TTL_SECONDS = int(os.environ.get('NEGATIVE_CACHE_TTL_SECONDS', str(24 * 3600)))
+
+# Memory-tier marker for songs cached as not found
+NOT_FOUND = False
+
+# Fields stored for each resolved track
+TRACK_FIELDS = ('uri', 'id', 'name', 'artist', 'album', 'album_image', 'popularity')
+
+# BatchGetItem accepts at most 100 keys per call
+DYNAMODB_BATCH_GET_LIMIT = 100
+
+# DynamoDB Table (cache table; items use a "track#" key prefix)
+table = dynamodb.Table(CACHE_TABLE_NAME)
+
+memory_cache = LRUCache(TRACK_CACHE_MAX_ENTRIES, TRACK_CACHE_TTL_SECONDS)
+
+
+def normalize_song_key(song: str, market: str) -> str:
+    """
+    Builds the cache key for a song suggestion.
+    "  Enter Sandman -  Metallica" and "enter sandman - metallica" map to the same key.
+    """
+    text = unicodedata.normalize('NFKC', song or '').casefold()
+    text = re.sub(r'\s*[-–—]\s*', ' - ', text)
+    text = re.sub(r'\s+', ' ', text).strip(' "\'')
+    return f"track#{market.upper()}#{text}"
+
+
+def new_cache_stats() -> Dict[str, Any]:
+    """
+    Per-request counters reported back in handler responses.
+    negative_hits counts songs skipped because they are known to be missing on Spotify.
+    """
+    return {
+        'lookups': 0,
+        'memory_hits': 0,
+        'dynamodb_hits': 0,
+        'negative_hits': 0,
+        'misses': 0,
+        'evictions': 0,
+        'hit_ratio': 0.0,
+        'spotify_calls_saved': 0
+    }
+
+
+def _finalize_stats(stats: Dict[str, Any]) -> None:
+    hits = stats['memory_hits'] + stats['dynamodb_hits'] + stats['negative_hits']
+    stats['spotify_calls_saved'] = hits
+    stats['hit_ratio'] = round(hits / stats['lookups'], 3) if stats['lookups'] else 0.0
+
+
+def merge_cache_stats(target: Dict[str, Any], source: Dict[str, Any]) -> None:
+    """
+    Adds the counters from source into target (e.g. per-song stats into per-request stats).
+    """
+    for field in ('lookups', 'memory_hits', 'dynamodb_hits', 'negative_hits', 'misses', 'evictions'):
+        target[field] += source.get(field, 0)
+    _finalize_stats(target)
+
+
+def _batch_get_from_dynamodb(keys: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Reads cache items from DynamoDB, skipping anything whose TTL has passed
+    (DynamoDB deletes expired items lazily, so they can still be returned).
+    Negative items map to None.
+    """
+    found = {}
+    now = int(time.time())
+    for start in range(0, len(keys), DYNAMODB_BATCH_GET_LIMIT):
+        chunk = keys[start:start + DYNAMODB_BATCH_GET_LIMIT]
+        response = dynamodb.batch_get_item(
+            RequestItems={
+                CACHE_TABLE_NAME: {
+                    'Keys': [{'user_id': key} for key in chunk],
+                    'ProjectionExpression': 'user_id, track, not_found, expires_at'
+                }
+            }
+        )
+        for item in response.get('Responses', {}).get(CACHE_TABLE_NAME, []):
+            if int(item.get('expires_at', 0)) <= now:
+                continue
+            if item.get('not_found'):
+                found[item['user_id']] = None
+            elif item.get('track'):
+                found[item['user_id']] = json.loads(item['track'])
+    return found
+
+
+def get_cached_tracks(songs: List[str], market: str, stats: Dict[str, Any]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Looks up each song in memory first, then DynamoDB for the remaining misses.
+    Returns a mapping of cache key -> track record for every hit, or None for
+    songs cached as not found on Spotify (these should not be searched again).
+    """
+    if not TRACK_CACHE_ENABLED:
+        return {}
+
+    hits = {}
+    hit_tier = {}
+    missing_keys = []
+    evictions_before = memory_cache.evictions
+
+    for song in songs:
+        key = normalize_song_key(song, market)
+        if key in hits or key in missing_keys:
+            continue
+        track = memory_cache.get(key)
+        if track is NOT_FOUND:
+            hits[key] = None
+            hit_tier[key] = 'negative_hits'
+        elif track is not None:
+            hits[key] = track
+            hit_tier[key] = 'memory_hits'
+        else:
+            missing_keys.append(key)
+
+    if missing_keys:
+        try:
+            dynamo_hits = _batch_get_from_dynamodb(missing_keys)
+        except Exception as e:
+            print(f"Track cache DynamoDB read failed, searching Spotify instead: {str(e)}")
+            dynamo_hits = {}
+        for key, track in dynamo_hits.items():
+            if track is None:
+                memory_cache.put(key, NOT_FOUND, NEGATIVE_CACHE_TTL_SECONDS)
+                hit_tier[key] = 'negative_hits'
+            else:
+                memory_cache.put(key, track)
+                hit_tier[key] = 'dynamodb_hits'
+            hits[key] = track
+
+    for song in songs:
+        key = normalize_song_key(song, market)
+        stats['lookups'] += 1
+        stats[hit_tier.get(key, 'misses')] += 1
+
+    stats['evictions'] += memory_cache.evictions - evictions_before
+    _finalize_stats(stats)
+    return hits
+
+
+def put_cached_tracks(resolved: Dict[str, Dict[str, Any]], stats: Dict[str, Any]) -> None:
+    """
+    Stores freshly resolved tracks (cache key -> track) in both tiers.
+    """
+    if not TRACK_CACHE_ENABLED or not resolved:
+        return
+
+    evictions_before = memory_cache.evictions
+    expires_at = int(time.time()) + TRACK_CACHE_TTL_SECONDS
+
+    for key, track in resolved.items():
+        memory_cache.put(key, {field: track.get(field) for field in TRACK_FIELDS})
+
+    try:
+        with table.batch_writer(overwrite_by_pkeys=['user_id']) as batch:
+            for key, track in resolved.items():
+                batch.put_item(Item={
+                    'user_id': key,
+                    'track': json.dumps({field: track.get(field) for field in TRACK_FIELDS}),
+                    'expires_at': expires_at
+                })
+    except Exception as e:
+        print(f"Track cache DynamoDB write failed: {str(e)}")
+
+    stats['evictions'] += memory_cache.evictions - evictions_before
+
+
+def put_not_found(keys: List[str], stats: Dict[str, Any]) -> None:
+    """
+    Records songs that Spotify returned no match for, with the shorter negative TTL.
+    Only genuine empty search results belong here, never failed or rate-limited searches.
+    """
+    if not TRACK_CACHE_ENABLED or not keys:
+        return
+
+    evictions_before = memory_cache.evictions
+    expires_at = int(time.time()) + NEGATIVE_CACHE_TTL_SECONDS
+
+    for key in keys:
+        memory_cache.put(key, NOT_FOUND, NEGATIVE_CACHE_TTL_SECONDS)
+
+    try:
+        with table.batch_writer(overwrite_by_pkeys=['user_id']) as batch:
+            for key in keys:
+                batch.put_item(Item={
+                    'user_id': key,
+                    'not_found': True,
+                    'expires_at': expires_at
+                })
+    except Exception as e:
+        print(f"Negative track cache DynamoDB write failed: {str(e)}")
+
+    stats['evictions'] += memory_cache.evictions - evictions_before
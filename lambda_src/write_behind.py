@@ -0,0 +1,167 @@
+"""
+Write-behind persistence for non-critical DynamoDB writes
+Playlist history and analytics events are queued instead of being
+written before the HTTP response. With WRITE_BEHIND_QUEUE_URL set, items go to SQS and
+write_behind_handler stores them with BatchWriteItem (analytics events in the cache table,
+everything else in the users table); otherwise an in-process queue and
+background thread stand in for SQS (local runs and tests).
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import boto3
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Any, List
+
+# AWS Client Configuration
+dynamodb = boto3.resource('dynamodb')
+sqs = boto3.client('sqs', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+
+# Environment Variables
+DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME')
+CACHE_TABLE_NAME = os.environ.get('CACHE_TABLE_NAME') or DYNAMODB_TABLE_NAME
+WRITE_BEHIND_QUEUE_URL = os.environ.get('WRITE_BEHIND_QUEUE_URL')
+WRITE_BEHIND_MAX_RETRIES = int(os.environ.get('WRITE_BEHIND_MAX_RETRIES', '5'))
+ANALYTICS_TTL_SECONDS = int(os.environ.get('ANALYTICS_TTL_SECONDS', str(90 * 24 * 3600)))
+
+# BatchWriteItem accepts at most 25 items per call
+DYNAMODB_BATCH_WRITE_LIMIT = 25
+# Key prefixes of items that expire via TTL and belong in the cache table
+CACHE_TABLE_KEY_PREFIXES = ('analytics#',)
+# How long the local stand-in waits to fill a batch
+LOCAL_BATCH_WINDOW_SECONDS = 0.2
+
+_local_queue = queue.Queue()
+_local_worker = None
+_local_worker_lock = threading.Lock()
+
+
+def put_items(items: List[Dict[str, Any]]) -> None:
+    """
+    Queues full-item puts. Never raises: these writes must not fail the request.
+    """
+    items = [item for item in items if item]
+    if not items:
+        return
+    try:
+        if WRITE_BEHIND_QUEUE_URL:
+            # One message per call keeps a request's writes together
+            sqs.send_message(
+                QueueUrl=WRITE_BEHIND_QUEUE_URL,
+                MessageBody=json.dumps({'items': items}, default=_json_default)
+            )
+        else:
+            _ensure_local_worker()
+            for item in items:
+                _local_queue.put(item)
+    except Exception as e:
+        print(f"Write-behind enqueue failed, writing directly: {str(e)}")
+        try:
+            batch_write_items(items)
+        except Exception as write_error:
+            print(f"Direct write failed: {str(write_error)}")
+
+
+def analytics_event(event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Builds an analytics event item (analytics#<date>#<id>, expires via TTL).
+    """
+    now = datetime.utcnow()
+    return {
+        'user_id': f"analytics#{now.strftime('%Y-%m-%d')}#{uuid.uuid4().hex}",
+        'event_type': event_type,
+        'data': data,
+        'created_at': now.isoformat(),
+        'expires_at': int(time.time()) + ANALYTICS_TTL_SECONDS
+    }
+
+
+def batch_write_items(items: List[Dict[str, Any]], max_retries: int = WRITE_BEHIND_MAX_RETRIES) -> List[Dict[str, Any]]:
+    """
+    Writes items with BatchWriteItem in chunks of 25, retrying unprocessed items with
+    exponential backoff. Returns the items that could not be written.
+    """
+    failed = []
+    by_table: Dict[str, List[Dict[str, Any]]] = {}
+    for item in items:
+        by_table.setdefault(table_for(item), []).append(_to_dynamo(item))
+
+    for table_name, table_items in by_table.items():
+        for start in range(0, len(table_items), DYNAMODB_BATCH_WRITE_LIMIT):
+            # A batch may not contain the same key twice; the latest write wins
+            chunk = list({item['user_id']: item for item in table_items[start:start + DYNAMODB_BATCH_WRITE_LIMIT]}.values())
+            requests = [{'PutRequest': {'Item': item}} for item in chunk]
+
+            for attempt in range(max_retries + 1):
+                try:
+                    response = dynamodb.batch_write_item(RequestItems={table_name: requests})
+                    requests = response.get('UnprocessedItems', {}).get(table_name, [])
+                except Exception as e:
+                    print(f"BatchWriteItem failed (attempt {attempt + 1}/{max_retries + 1}): {str(e)}")
+                if not requests:
+                    break
+                if attempt < max_retries:
+                    time.sleep(min(0.1 * (2 ** attempt), 5))
+
+            if requests:
+                failed.extend(request['PutRequest']['Item'] for request in requests)
+
+    if failed:
+        print(f"Write-behind: {len(failed)} item(s) not written after {max_retries} retries")
+    return failed
+
+
+def table_for(item: Dict[str, Any]) -> str:
+    """
+    Table an item is written to, by its key prefix.
+    """
+    if str(item.get('user_id', '')).startswith(CACHE_TABLE_KEY_PREFIXES):
+        return CACHE_TABLE_NAME
+    return DYNAMODB_TABLE_NAME
+
+
+def _ensure_local_worker() -> None:
+    global _local_worker
+    with _local_worker_lock:
+        if _local_worker is None or not _local_worker.is_alive():
+            _local_worker = threading.Thread(target=_drain_local_queue, daemon=True)
+            _local_worker.start()
+
+
+def _drain_local_queue() -> None:
+    """
+    Background loop of the in-process stand-in: collects up to 25 items per batch.
+    """
+    while True:
+        batch = [_local_queue.get()]
+        deadline = time.time() + LOCAL_BATCH_WINDOW_SECONDS
+        while len(batch) < DYNAMODB_BATCH_WRITE_LIMIT:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_local_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            batch_write_items(batch)
+        except Exception as e:
+            print(f"Write-behind local batch failed: {str(e)}")
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _to_dynamo(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    DynamoDB rejects floats; round-trip through JSON with Decimal.
+    """
+    return json.loads(json.dumps(item, default=_json_default), parse_float=Decimal)
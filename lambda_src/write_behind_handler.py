@@ -0,0 +1,34 @@
+"""
+SQS consumer for write-behind persistence
+Each message carries {"items": [...]} queued by write_behind.put_items. Items from the whole
+SQS batch are stored together with BatchWriteItem; messages whose items could not be written
+are reported as batch item failures so SQS retries them (and eventually dead-letters them).
+"""
+
+import json
+from typing import Dict, Any
+
+import write_behind
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    items = []
+    item_message = {}
+    failures = []
+
+    for record in event.get('Records', []):
+        message_id = record.get('messageId')
+        try:
+            for item in json.loads(record['body']).get('items', []):
+                items.append(item)
+                item_message[item['user_id']] = message_id
+        except Exception as e:
+            print(f"Invalid write-behind message {message_id}: {str(e)}")
+            failures.append(message_id)
+
+    failed_items = write_behind.batch_write_items(items) if items else []
+    failed_messages = {item_message.get(item['user_id']) for item in failed_items}
+    failures.extend(message_id for message_id in failed_messages if message_id and message_id not in failures)
+
+    print(f"Write-behind: stored {len(items) - len(failed_items)} of {len(items)} item(s), {len(failures)} message(s) to retry")
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failures]}
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Reads the NDJSON event stream of the streaming endpoints and prints each event with its arrival time.
+
+Usage:
+  # Against the deployed function URL (StreamEndpoint output of the stack)
+  python test-stream.py --url https://<id>.lambda-url.us-east-1.on.aws --prompt "rock para entrenar"
+
+  # In-process, calling stream_handler directly with your local AWS credentials
+  python test-stream.py --local --path /playlist --prompt "rock para entrenar"
+
+The Spotify user token is read from --token or the SPOTIFY_ACCESS_TOKEN environment variable.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+
+
+def build_body(args) -> dict:
+    body = {
+        'user_id': args.user_id,
+        'spotify_access_token': args.token,
+        'limit': args.limit
+    }
+    if args.path == '/agent/chat':
+        body['message'] = args.prompt
+        body['session_id'] = args.session_id
+    elif args.path == '/playlist-from-image':
+        body['image_url'] = args.image_url
+    else:
+        body['prompt'] = args.prompt
+    return body
+
+
+def read_remote(args, body: dict):
+    request = urllib.request.Request(
+        args.url.rstrip('/') + args.path,
+        data=json.dumps(body).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    with urllib.request.urlopen(request, timeout=args.timeout) as response:
+        print(f"[INFO] HTTP {response.status} {response.headers.get('Content-Type')}")
+        for line in response:
+            if line.strip():
+                yield line
+
+
+def read_local(args, body: dict):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda_src'))
+    import stream_handler
+
+    event = {'rawPath': args.path, 'body': json.dumps(body)}
+    status_code, headers, chunks = stream_handler.lambda_handler(event, None)
+    print(f"[INFO] status {status_code} {headers.get('Content-Type')}")
+    for chunk in chunks:
+        yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read the AI DJ streaming response')
+    parser.add_argument('--url', help='Streaming function URL')
+    parser.add_argument('--local', action='store_true', help='Call stream_handler in-process instead of the URL')
+    parser.add_argument('--path', default='/playlist', choices=['/playlist', '/agent/chat', '/playlist-from-image'])
+    parser.add_argument('--prompt', default='rock para entrenar')
+    parser.add_argument('--image-url', default=None)
+    parser.add_argument('--session-id', default=f'stream-test-{int(time.time())}')
+    parser.add_argument('--user-id', default='stream-test')
+    parser.add_argument('--token', default=os.environ.get('SPOTIFY_ACCESS_TOKEN'))
+    parser.add_argument('--limit', type=int, default=25)
+    parser.add_argument('--timeout', type=int, default=120)
+    args = parser.parse_args()
+
+    if not args.url and not args.local:
+        parser.error('--url or --local is required')
+    if not args.token:
+        parser.error('--token or SPOTIFY_ACCESS_TOKEN is required')
+
+    body = build_body(args)
+    started_at = time.time()
+    first_track_at = None
+    events = read_local(args, body) if args.local else read_remote(args, body)
+
+    for raw in events:
+        elapsed = time.time() - started_at
+        event = json.loads(raw)
+        event_type = event.get('event')
+
+        if event_type == 'track':
+            if first_track_at is None:
+                first_track_at = elapsed
+            track = event['track']
+            print(f"[{elapsed:6.2f}s] track #{event['position']}: {track['name']} - {track['artist']}")
+        elif event_type == 'parameters':
+            songs = event['parameters'].get('songs', [])
+            print(f"[{elapsed:6.2f}s] parameters: {len(songs)} songs, name={event['parameters'].get('playlist_name')!r}")
+        elif event_type == 'playlist_created':
+            print(f"[{elapsed:6.2f}s] playlist_created: {event['playlist_url']} ({event['tracks_count']} tracks)")
+        elif event_type == 'done':
+            print(f"[{elapsed:6.2f}s] done: status {event['status_code']}")
+            print(json.dumps(event['body'], indent=2, ensure_ascii=False)[:2000])
+        else:
+            print(f"[{elapsed:6.2f}s] {event_type}: {json.dumps(event)[:300]}")
+
+    if first_track_at is not None:
+        print(f"\n[INFO] Time to first track: {first_track_at:.2f}s")
+    print(f"[INFO] Total: {time.time() - started_at:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+"""
+Test setup: the Lambda modules live in lambda_src and read their configuration from the
+environment at import time, so both are prepared before any test module imports them.
+No test talks to AWS or Spotify; DynamoDB tables and HTTP sessions are replaced per test.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambda_src'))
+
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('DYNAMODB_TABLE_NAME', 'AI-DJ-Users')
+os.environ.setdefault('CACHE_TABLE_NAME', 'AI-DJ-Cache')
+# Breakers share state through DynamoDB; the tests that need them switch them on explicitly
+os.environ.setdefault('CIRCUIT_BREAKER_ENABLED', 'false')
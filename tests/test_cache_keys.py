@@ -0,0 +1,41 @@
+import prompt_cache
+import single_flight
+import track_cache
+
+HAIKU = 'us.anthropic.claude-haiku-4-5-20251001-v1:0'
+SONNET = 'us.anthropic.claude-sonnet-4-5-20250929-v1:0'
+
+
+def test_prompt_normalization():
+    assert prompt_cache.normalize_prompt("  Rock   para ENTRENAR!! ") == "rock para entrenar"
+    assert prompt_cache.normalize_prompt("¿Jazz suave?") == "¿jazz suave"
+
+
+def test_prompt_cache_key_ignores_formatting():
+    assert (prompt_cache.build_cache_key("Rock para entrenar", 25, HAIKU, 'fast') ==
+            prompt_cache.build_cache_key("  rock PARA entrenar. ", 25, HAIKU, 'fast'))
+
+
+def test_prompt_cache_key_covers_everything_that_changes_the_list():
+    key = prompt_cache.build_cache_key("rock", 25, HAIKU, 'fast')
+    assert key.startswith('prompt#')
+    assert key != prompt_cache.build_cache_key("rock", 30, HAIKU, 'fast')
+    assert key != prompt_cache.build_cache_key("rock", 25, SONNET, 'fast')
+    assert key != prompt_cache.build_cache_key("rock", 25, HAIKU, 'two_call')
+    assert key != prompt_cache.build_cache_key("jazz", 25, HAIKU, 'fast')
+
+
+def test_flight_key_matches_prompt_cache_inputs():
+    key = single_flight.build_key("Rock para entrenar", 25, HAIKU, 'fast')
+    assert key.startswith('flight#')
+    assert key == single_flight.build_key("rock para entrenar!", 25, HAIKU, 'fast')
+    assert key != single_flight.build_key("rock para entrenar", 25, SONNET, 'fast')
+    assert key != single_flight.build_key("rock para entrenar", 26, HAIKU, 'fast')
+    assert key[len('flight#'):] == prompt_cache.build_cache_key("rock para entrenar", 25, HAIKU, 'fast')[len('prompt#'):]
+
+
+def test_track_key_normalizes_spacing_case_and_dashes():
+    assert (track_cache.normalize_song_key("  Enter Sandman -  Metallica", 'us') ==
+            track_cache.normalize_song_key("enter sandman – metallica", 'US') ==
+            "track#US#enter sandman - metallica")
+    assert track_cache.normalize_song_key("Enter Sandman - Metallica", 'ES') != track_cache.normalize_song_key("Enter Sandman - Metallica", 'US')
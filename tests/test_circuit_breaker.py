@@ -0,0 +1,203 @@
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+import circuit_breaker
+from circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitOpenError
+
+
+def conditional_check_failed():
+    return ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+
+
+class FakeTable:
+    """
+    The breaker# item of one breaker, with the conditional updates allow() and record() use.
+    """
+
+    def __init__(self):
+        self.item = {}
+        self.lock = threading.Lock()
+        self.claims = 0
+        self.claim_delay = 0.0
+
+    def put_item(self, Item):
+        with self.lock:
+            self.item = dict(Item)
+
+    def get_item(self, Key):
+        with self.lock:
+            return {'Item': dict(self.item)} if self.item else {}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues):
+        time.sleep(self.claim_delay)
+        values = ExpressionAttributeValues
+        with self.lock:
+            lease = self.item.get('probe_until_ms')
+            if UpdateExpression.startswith('SET'):
+                if lease is not None and lease >= values[':now']:
+                    raise conditional_check_failed()
+                self.claims += 1
+                self.item['probe_until_ms'] = values[':until']
+            else:
+                if lease != values[':until']:
+                    raise conditional_check_failed()
+                del self.item['probe_until_ms']
+
+
+def wait_for(predicate, timeout=2.0):
+    until = time.time() + timeout
+    while not predicate():
+        if time.time() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def table(monkeypatch):
+    fake = FakeTable()
+    monkeypatch.setattr(circuit_breaker, 'table', fake)
+    monkeypatch.setattr(circuit_breaker, 'CIRCUIT_BREAKER_ENABLED', True)
+    monkeypatch.setattr(circuit_breaker, 'CIRCUIT_BREAKER_MIN_CALLS', 4)
+    monkeypatch.setattr(circuit_breaker, 'CIRCUIT_BREAKER_FAILURE_RATE', 0.5)
+    monkeypatch.setattr(circuit_breaker, 'CIRCUIT_BREAKER_SLOW_CALL_RATE', 0.8)
+    # Shared state is only read when a test asks for it
+    monkeypatch.setattr(circuit_breaker, 'CIRCUIT_BREAKER_SYNC_SECONDS', 3600)
+    return fake
+
+
+def new_breaker():
+    breaker = circuit_breaker.CircuitBreaker('test', slow_call_seconds=1.0)
+    breaker._synced_at = time.time()
+    return breaker
+
+
+def trip(breaker, table):
+    for _ in range(4):
+        breaker.record(False)
+    assert breaker.state == STATE_OPEN
+    # The open state is published in the background; let it land before the test edits the item
+    assert wait_for(lambda: table.item.get('state') == STATE_OPEN)
+
+
+def end_open_period(breaker):
+    breaker._open_until = time.time() - 0.01
+
+
+def test_stays_closed_below_min_calls(table):
+    breaker = new_breaker()
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.allow()
+
+
+def test_opens_on_failure_rate_and_rejects(table):
+    breaker = new_breaker()
+    breaker.record(True)
+    breaker.record(True)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == STATE_OPEN
+    assert breaker.is_open()
+    assert not breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    assert wait_for(lambda: table.item.get('state') == STATE_OPEN)
+
+
+def test_opens_on_slow_call_rate(table):
+    breaker = new_breaker()
+    for _ in range(4):
+        breaker.record(True, duration=2.0)
+    assert breaker.state == STATE_OPEN
+
+
+def test_single_probe_after_open_period(table):
+    breaker = new_breaker()
+    trip(breaker, table)
+    end_open_period(breaker)
+    table.claim_delay = 0.05
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(breaker.allow())) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
+    assert table.claims == 1
+    assert breaker.state == STATE_HALF_OPEN
+
+
+def test_claim_runs_without_the_lock(table):
+    breaker = new_breaker()
+    trip(breaker, table)
+    end_open_period(breaker)
+    table.claim_delay = 0.2
+    thread = threading.Thread(target=breaker.allow)
+    thread.start()
+    time.sleep(0.05)
+    acquired = breaker._lock.acquire(timeout=0.05)
+    if acquired:
+        breaker._lock.release()
+    thread.join()
+    assert acquired
+
+
+def test_successful_probe_closes_and_releases_the_claim(table):
+    breaker = new_breaker()
+    trip(breaker, table)
+    end_open_period(breaker)
+    assert breaker.allow()
+    breaker.record(True, duration=0.1)
+    assert breaker.state == STATE_CLOSED
+    # Released by the conditional remove, or dropped by the closed state's put, whichever lands first
+    assert wait_for(lambda: table.item.get('state') == STATE_CLOSED and 'probe_until_ms' not in table.item)
+
+
+def test_failed_probe_reopens_and_next_period_can_probe(table):
+    breaker = new_breaker()
+    trip(breaker, table)
+    end_open_period(breaker)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow()
+    assert wait_for(lambda: table.item.get('reason') == 'probe failed' and 'probe_until_ms' not in table.item)
+    end_open_period(breaker)
+    assert breaker.allow()
+    assert table.claims == 2
+
+
+def test_probe_held_by_another_container(table):
+    breaker = new_breaker()
+    trip(breaker, table)
+    end_open_period(breaker)
+    table.item['probe_until_ms'] = int((time.time() + 30) * 1000)
+    assert not breaker.allow()
+    assert breaker.state == STATE_OPEN
+
+
+def test_adopts_open_state_from_another_container(table):
+    breaker = new_breaker()
+    table.item = {
+        'user_id': 'breaker#test',
+        'state': STATE_OPEN,
+        'open_until_ms': int((time.time() + 20) * 1000),
+        'updated_at_ms': int(time.time() * 1000),
+        'reason': 'elsewhere'
+    }
+    breaker._adopt_shared_state()
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow()
+
+
+def test_disabled_breaker_always_allows(table, monkeypatch):
+    breaker = new_breaker()
+    trip(breaker, table)
+    monkeypatch.setattr(circuit_breaker, 'CIRCUIT_BREAKER_ENABLED', False)
+    assert breaker.allow()
+    assert not breaker.is_open()
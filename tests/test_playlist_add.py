@@ -0,0 +1,154 @@
+from unittest import mock
+
+import pytest
+import requests
+
+import app
+from time_budget import Deadline
+
+PLAYLIST_URL = 'https://api.spotify.com/v1/playlists/p'
+
+
+def response(status_code, body=None, headers=None):
+    result = mock.Mock(status_code=status_code, headers=headers or {})
+    result.json.return_value = body or {}
+
+    def raise_for_status():
+        if status_code >= 400:
+            raise requests.HTTPError(f"{status_code} error", response=result)
+
+    result.raise_for_status = raise_for_status
+    return result
+
+
+class FakeSpotify:
+    """
+    A playlist that stores added tracks, with scripted outcomes for successive adds:
+    'ok', 'lost' (error, nothing stored), 'stored' (stored, then the response is lost),
+    'connect' (connect timeout), or a status code.
+    """
+
+    def __init__(self, script=()):
+        self.tracks = []
+        self.script = list(script)
+        self.posts = 0
+        self.length_checks = 0
+
+    def request(self, method, url, **kwargs):
+        if method == 'GET' and url == f'{PLAYLIST_URL}/tracks':
+            self.length_checks += 1
+            return response(200, {'total': len(self.tracks)})
+        if method == 'GET' and url == PLAYLIST_URL:
+            return response(200, {'snapshot_id': self.snapshot()})
+        assert method == 'POST' and url == f'{PLAYLIST_URL}/tracks'
+        self.posts += 1
+        body = kwargs['json']
+        action = self.script.pop(0) if self.script else 'ok'
+        if action == 'lost':
+            raise requests.exceptions.ReadTimeout('read timed out')
+        if action == 'connect':
+            raise requests.exceptions.ConnectTimeout('connect timed out')
+        if action == 'stored':
+            self.store(body)
+            raise requests.exceptions.ConnectionError('connection reset')
+        if isinstance(action, int):
+            return response(action, headers={'Retry-After': '0'})
+        self.store(body)
+        return response(201, {'snapshot_id': self.snapshot()})
+
+    def store(self, body):
+        self.tracks[body['position']:body['position']] = body['uris']
+
+    def snapshot(self):
+        return f"snap-{len(self.tracks)}"
+
+
+@pytest.fixture
+def spotify(monkeypatch):
+    def install(script=()):
+        fake = FakeSpotify(script)
+        monkeypatch.setattr(app.http_session, 'request', fake.request)
+        return fake
+
+    monkeypatch.setattr(app.time, 'sleep', lambda seconds: None)
+    return install
+
+
+def add(uris, stats=None):
+    return app.add_tracks_to_playlist('p', uris, {}, stats, Deadline.after(20))
+
+
+URIS = [f'spotify:track:{i}' for i in range(250)]
+
+
+def test_adds_chunks_in_order(spotify):
+    fake = spotify()
+    stats = {}
+    assert add(URIS, stats) == 'snap-250'
+    assert fake.tracks == URIS
+    assert fake.posts == 3
+    assert stats == {'add_chunks': 3, 'add_retries': 0}
+
+
+def test_stored_chunk_is_not_resent(spotify):
+    fake = spotify(['ok', 'stored'])
+    stats = {}
+    assert add(URIS, stats) == 'snap-250'
+    assert fake.tracks == URIS
+    assert fake.posts == 3
+    assert stats['add_retries'] == 1
+
+
+def test_lost_chunk_is_resent_after_a_length_check(spotify):
+    fake = spotify(['lost'])
+    assert add(URIS) == 'snap-250'
+    assert fake.tracks == URIS
+    assert fake.posts == 4
+    assert fake.length_checks == 1
+
+
+def test_connect_timeout_and_429_resend_without_checking(spotify):
+    fake = spotify(['connect', 429, 'ok', 'ok'])
+    assert add(URIS) == 'snap-250'
+    assert fake.tracks == URIS
+    assert fake.length_checks == 0
+
+
+def test_server_error_is_checked_then_resent(spotify):
+    fake = spotify([502])
+    assert add(URIS) == 'snap-250'
+    assert fake.tracks == URIS
+    assert fake.length_checks == 1
+
+
+def test_unexpected_length_is_not_resent(spotify):
+    fake = spotify(['lost'])
+    fake.tracks = ['spotify:track:other']
+    with pytest.raises(Exception, match='not resending'):
+        add(URIS)
+    assert fake.posts == 1
+
+
+def test_client_error_is_not_retried(spotify):
+    fake = spotify([400])
+    with pytest.raises(requests.HTTPError):
+        add(URIS)
+    assert fake.posts == 1
+    assert fake.length_checks == 0
+
+
+def test_gives_up_after_max_retries(spotify, monkeypatch):
+    monkeypatch.setattr(app, 'SPOTIFY_PLAYLIST_ADD_MAX_RETRIES', 2)
+    fake = spotify(['lost', 'lost', 'lost'])
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        add(URIS)
+    assert fake.posts == 3
+    assert fake.tracks == []
+
+
+def test_empty_playlist(spotify):
+    fake = spotify()
+    stats = {}
+    assert add([], stats) is None
+    assert fake.posts == 0
+    assert stats == {'add_chunks': 0, 'add_retries': 0}
@@ -0,0 +1,80 @@
+import json
+
+from song_parser import SongStreamParser, salvage_song_list
+
+
+def parse(chunks, max_songs=None):
+    emitted = []
+    parser = SongStreamParser(emitted.append, max_songs=max_songs)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser, emitted
+
+
+def test_emits_songs_in_order_across_deltas():
+    text = '{"playlist_name": "Road Trip", "songs": ["Africa - Toto", "Hold the Line - Toto", "Rosanna - Toto"]}'
+    parser, emitted = parse([text[i:i + 7] for i in range(0, len(text), 7)])
+    assert emitted == ["Africa - Toto", "Hold the Line - Toto", "Rosanna - Toto"]
+    assert parser.songs == emitted
+    assert parser.done
+
+
+def test_songs_key_split_between_deltas():
+    parser, emitted = parse(['{"so', 'ngs"', ' :  ', '[ "A - B"', ', "C - D"]}'])
+    assert emitted == ["A - B", "C - D"]
+
+
+def test_escaped_quotes_and_backslashes():
+    songs = ['Say "Hello" - Artist', 'Back\\slash - Band', 'Ends with \\ - X']
+    text = json.dumps({'songs': songs})
+    parser, emitted = parse([text[i:i + 3] for i in range(0, len(text), 3)])
+    assert emitted == songs
+
+
+def test_stops_at_max_songs():
+    parser, emitted = parse(['{"songs": ["A - 1", "B - 2", "C - 3"]}'], max_songs=2)
+    assert emitted == ["A - 1", "B - 2"]
+    assert parser.done
+
+
+def test_non_string_items_stop_incremental_parsing():
+    parser, emitted = parse(['{"songs": ["A - 1", {"title": "B"}, "C - 3"]}'])
+    assert emitted == ["A - 1"]
+    assert parser.done
+
+
+def test_blank_songs_are_skipped():
+    parser, emitted = parse(['{"songs": ["  ", "A - 1"]}'])
+    assert emitted == ["A - 1"]
+
+
+def test_end_offset_points_after_last_complete_song():
+    text = '{"songs": ["A - 1", "B - 2", "C - '
+    parser, _ = parse([text[:15], text[15:]])
+    assert text[:parser.end_offset].endswith('"B - 2"')
+
+
+def test_salvage_truncated_list():
+    text = '{"playlist_name": "Late \\"Night\\" Drive", "songs": ["A - 1", "B - 2", "C - 3", "D -'
+    salvaged = salvage_song_list(text)
+    assert salvaged['songs'] == ["A - 1", "B - 2", "C - 3"]
+    assert salvaged['playlist_name'] == 'Late "Night" Drive'
+    assert salvaged['prefix'] == text[:text.index('"C - 3"') + len('"C - 3"')]
+
+
+def test_salvage_prefix_can_be_continued():
+    text = '{"songs": ["A - 1", "B - 2", "C'
+    salvaged = salvage_song_list(text)
+    continued = salvaged['prefix'] + ', "D - 4"], "playlist_name": "Mix"}'
+    assert json.loads(continued) == {'songs': ["A - 1", "B - 2", "D - 4"], 'playlist_name': 'Mix'}
+
+
+def test_salvage_without_songs():
+    salvaged = salvage_song_list('{"playlist_name": "Mix", "so')
+    assert salvaged == {'songs': [], 'playlist_name': 'Mix', 'prefix': ''}
+
+
+def test_salvage_respects_max_songs():
+    salvaged = salvage_song_list('{"songs": ["A - 1", "B - 2", "C - 3", "D', max_songs=2)
+    assert salvaged['songs'] == ["A - 1", "B - 2"]
+    assert salvaged['prefix'] == '{"songs": ["A - 1", "B - 2"'
@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+import time_budget
+from time_budget import Deadline
+
+
+class FakeContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def test_for_request_uses_the_tighter_limit(monkeypatch):
+    monkeypatch.setattr(time_budget, 'API_GATEWAY_TIMEOUT_SECONDS', 29.0)
+    monkeypatch.setattr(time_budget, 'DEADLINE_SAFETY_MARGIN_SECONDS', 1.5)
+    assert Deadline.for_request(FakeContext(10_000)).budget_seconds == pytest.approx(8.5)
+    assert Deadline.for_request(FakeContext(300_000)).budget_seconds == pytest.approx(27.5)
+    assert Deadline.for_request(FakeContext(300_000), behind_api_gateway=False).budget_seconds == pytest.approx(298.5)
+    assert Deadline.for_request(None, behind_api_gateway=False, fallback_seconds=5).budget_seconds == pytest.approx(3.5)
+
+
+def test_for_request_never_negative():
+    assert Deadline.for_request(FakeContext(100)).remaining() == 0
+    assert Deadline.for_request(FakeContext(100)).expired()
+
+
+def test_reserving_keeps_time_for_a_later_step():
+    deadline = Deadline.after(10)
+    child = deadline.reserving(4)
+    assert child.expires_at == pytest.approx(deadline.expires_at - 4)
+    assert child.started_at == deadline.started_at
+    assert 5 < child.remaining() <= 6
+
+
+def test_has_and_can_sleep():
+    deadline = Deadline.after(5)
+    assert deadline.has(4)
+    assert not deadline.has(6)
+    assert deadline.can_sleep(2, then_needs=2)
+    assert not deadline.can_sleep(2, then_needs=4)
+
+
+def test_http_timeout_is_capped_by_remaining_time():
+    connect, read = Deadline.after(2).http_timeout()
+    assert connect <= 2 and read <= 2
+    expired = Deadline(time.time() - 1, 1)
+    assert expired.http_timeout() == (time_budget.MIN_HTTP_TIMEOUT_SECONDS, time_budget.MIN_HTTP_TIMEOUT_SECONDS)